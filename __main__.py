@@ -7,6 +7,8 @@ usage           : python sifra [OPTIONS]
                   -s                Display this usage message
                   -l [LEVEL]        Choose logging level DEBUG, INFO,
                                     WARNING, ERROR, CRITICAL
+                  -r [OUTPUT_PATH]  Resume the run in OUTPUT_PATH from its
+                                    checkpoint
 
 python_version  : 2.7
 """
@@ -34,6 +36,9 @@ def main():
     parser.add_argument("-v", "--verbose",  type=str,
                         help="Choose option for logging level from: \n"
                              "DEBUG, INFO, WARNING, ERROR, CRITICAL.")
+    parser.add_argument("-r", "--resume", type=str,
+                        help="Output folder of a run to resume from the \n"
+                             "hazard levels saved in its checkpoint.")
     args = parser.parse_args()
 
     level = logging.DEBUG
@@ -63,8 +68,9 @@ def main():
         # Configure simulation model.
         # Read data and control parameters and construct objects.
 
-        config = Configuration(args.setup)
+        config = Configuration(args.setup, output_path=args.resume)
         scenario = Scenario(config)
+        scenario.resume = args.resume is not None
         hazards = HazardsContainer(config)
         infrastructure = ingest_model(config)
 
@@ -78,7 +84,10 @@ def main():
         #     {},  # hazard level vs component response
         #     {},  # hazard level vs component type response
         #     [],  # array of infrastructure output for each sample
-        #     []]  # array infrastructure econ loss for each sample
+        #     [],  # array infrastructure econ loss for each sample
+        #     {},  # hazard level vs number of samples
+        #     {},  # hazard level vs likelihood weights
+        #     {}]  # hazard level vs streamed statistics
 
         response_list = calculate_response(hazards, scenario, infrastructure)
 
@@ -89,7 +98,9 @@ def main():
 
         write_system_response(response_list, infrastructure, scenario, hazards)
         economic_loss_array = response_list[5]
-        plot_mean_econ_loss(scenario, economic_loss_array, hazards)
+        # streamed samples keep no per-sample economic loss to plot
+        if economic_loss_array is not None:
+            plot_mean_econ_loss(scenario, economic_loss_array, hazards)
 
         if config.HAZARD_INPUT_METHOD == "hazard_array":
             pe_by_component_class(response_list, infrastructure,
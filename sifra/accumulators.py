@@ -0,0 +1,239 @@
+import numpy as np
+
+
+class RunningMoments(object):
+    """
+    The weighted mean and (population) variance of each column of a
+    stream of (samples x n) arrays, updated one block of samples at a time.
+
+    A block is reduced to its weight, mean and sum of squared deviations,
+    and merged into the running values with the update of Welford,
+    generalised to blocks and weights by Chan, Golub and LeVeque (1979).
+    This avoids the cancellation of the sum of squares formula, and two
+    sets of moments merge in the same way.
+    """
+
+    def __init__(self, num_columns):
+        self.total_weight = 0.0
+        self.mean = np.zeros(num_columns)
+        self.squared_deviations = np.zeros(num_columns)
+
+    def add(self, values, weights=None):
+        """
+        :param values: (samples x n) array of a block of samples
+        :param weights: Optional weight of each sample
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if weights is None:
+            block_weight = float(len(values))
+            block_mean = np.mean(values, axis=0)
+            block_squared_deviations = \
+                np.sum((values - block_mean) ** 2, axis=0)
+        else:
+            block_weight = float(np.sum(weights, dtype=np.float64))
+            block_mean = np.dot(weights, values) / block_weight
+            block_squared_deviations = \
+                np.dot(weights, (values - block_mean) ** 2)
+        self._merge(block_weight, block_mean, block_squared_deviations)
+
+    def merge(self, other):
+        """Add the samples of another RunningMoments."""
+        self._merge(other.total_weight, other.mean, other.squared_deviations)
+
+    def _merge(self, weight, mean, squared_deviations):
+        if weight == 0:
+            return
+        total_weight = self.total_weight + weight
+        delta = mean - self.mean
+        self.mean = self.mean + delta * (weight / total_weight)
+        self.squared_deviations = \
+            self.squared_deviations + squared_deviations + \
+            delta ** 2 * (self.total_weight * weight / total_weight)
+        self.total_weight = total_weight
+
+    @property
+    def variance(self):
+        return self.squared_deviations / self.total_weight
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+
+class WeightedHistogram(object):
+    """
+    The total weight of the samples in each of a number of levels, e.g.
+    the damage states of the system, from which the probability of
+    exceeding each level follows.
+    """
+
+    def __init__(self, num_levels):
+        self.counts = np.zeros(num_levels)
+
+    def add(self, levels, weights=None):
+        """
+        :param levels: Integer level of each sample of a block
+        :param weights: Optional weight of each sample
+        """
+        self.counts += np.bincount(levels, weights=weights,
+                                   minlength=len(self.counts))
+
+    def merge(self, other):
+        """Add the samples of another WeightedHistogram."""
+        self.counts += other.counts
+
+    def exceedance(self, level):
+        """
+        :return: The weighted fraction of the samples at or above a level
+        """
+        return np.sum(self.counts[level:]) / np.sum(self.counts)
+
+
+class ResponseAccumulator(object):
+    """
+    The statistics of the response of an infrastructure to a hazard
+    level, accumulated over chunks of samples, so the per-sample arrays
+    of all the samples are never held at once.
+
+    It keeps the moments of the loss, functionality and failure of each
+    component, of the output of each output node and of the economic loss,
+    and the histograms of the damage state of the system, and for a
+    substation of each class of components, that the post-processing
+    calculates the probabilities of exceedance from.
+    """
+
+    def __init__(self, infrastructure, scenario):
+        """
+        :param infrastructure: The infrastructure exposed to the hazard
+        :param scenario: Parameters for the scenario
+        """
+        compiled = infrastructure.compile()
+        # only the small parts of the compiled model are kept, so the
+        # accumulator is cheap to send back from a worker process
+        self.component_ids = compiled.component_ids
+        self.component_types = compiled.component_types
+        self.type_indices = compiled.type_indices
+        self._failure_ds_index = compiled.failure_ds_index
+        self.output_ids = list(infrastructure.output_nodes.keys())
+        self.component_loss = RunningMoments(compiled.num_components)
+        self.component_functionality = \
+            RunningMoments(compiled.num_components)
+        self.component_failures = RunningMoments(compiled.num_components)
+        self.output = RunningMoments(len(self.output_ids))
+        self.economic_loss = RunningMoments(1)
+
+        # the system damage state of a sample is the number of damage
+        # scale bounds its economic loss exceeds
+        self._system_damage_bounds = \
+            np.asarray(infrastructure.get_dmg_scale_bounds(scenario))
+        self.system_damage = \
+            WeightedHistogram(len(self._system_damage_bounds) + 1)
+
+        # the damage state of a class of components is the number of
+        # class limits exceeded by the mean damage state index of its
+        # components, see pe_by_component_class
+        self._class_limits = {}
+        self._class_indices = {}
+        self.class_damage = {}
+        if infrastructure.system_class == 'Substation':
+            for compclass in np.unique(
+                    list(infrastructure.get_component_class_list())):
+                if compclass in infrastructure.uncosted_classes:
+                    continue
+                limits = np.asarray(
+                    infrastructure.ds_lims_compclasses[compclass])
+                self._class_limits[compclass] = limits
+                self._class_indices[compclass] = \
+                    compiled.class_indices[compclass]
+                self.class_damage[compclass] = \
+                    WeightedHistogram(len(limits) + 1)
+
+    def add(self, component_damage_state_ind, component_loss,
+            comp_sample_func, sample_output, economic_loss, weights=None):
+        """
+        Add a chunk of samples, as given by calc_output_loss.
+        :param weights: Optional weight of each sample, e.g. the number
+                        of samples a distinct row stands for
+        """
+        self.component_loss.add(component_loss, weights)
+        self.component_functionality.add(comp_sample_func, weights)
+        self.component_failures.add(
+            component_damage_state_ind >= self._failure_ds_index, weights)
+        self.output.add(sample_output, weights)
+        self.economic_loss.add(economic_loss[:, np.newaxis], weights)
+        self.system_damage.add(
+            np.sum(economic_loss[:, np.newaxis] >
+                   self._system_damage_bounds, axis=1),
+            weights)
+        for compclass, limits in self._class_limits.items():
+            class_failures = np.mean(
+                component_damage_state_ind[:, self._class_indices[compclass]],
+                axis=1)
+            self.class_damage[compclass].add(
+                np.sum(class_failures[:, np.newaxis] > limits, axis=1),
+                weights)
+
+    def merge(self, other):
+        """
+        Add the samples of another ResponseAccumulator of the same model,
+        e.g. of another shard of the samples of the hazard level.
+        """
+        self.component_loss.merge(other.component_loss)
+        self.component_functionality.merge(other.component_functionality)
+        self.component_failures.merge(other.component_failures)
+        self.output.merge(other.output)
+        self.economic_loss.merge(other.economic_loss)
+        self.system_damage.merge(other.system_damage)
+        for compclass, histogram in self.class_damage.items():
+            histogram.merge(other.class_damage[compclass])
+
+    def mean_output(self):
+        """
+        :return: Dict of the mean output of each output node
+        """
+        return {output_id: self.output.mean[output_index]
+                for output_index, output_id in enumerate(self.output_ids)}
+
+    def component_response(self):
+        """
+        The statistics of the components and of the component types, as
+        given by Infrastructure.calc_response.
+        :return: The component response dict and the component type
+                 response dict
+        """
+        loss_mean = self.component_loss.mean
+        loss_std = self.component_loss.std
+        func_mean = self.component_functionality.mean
+        func_std = self.component_functionality.std
+        num_failures = self.component_failures.mean
+
+        comp_resp_dict = dict()
+        for comp_index, comp_id in enumerate(self.component_ids):
+            comp_resp_dict[(comp_id, 'loss_mean')] = loss_mean[comp_index]
+            comp_resp_dict[(comp_id, 'loss_std')] = loss_std[comp_index]
+            comp_resp_dict[(comp_id, 'func_mean')] = func_mean[comp_index]
+            comp_resp_dict[(comp_id, 'func_std')] = func_std[comp_index]
+            comp_resp_dict[(comp_id, 'num_failures')] = \
+                num_failures[comp_index]
+
+        # the components of a type are pooled: the variance of the pool is
+        # the mean of the variances of the components, and the variance of
+        # their means
+        comptype_resp_dict = dict()
+        for ct_id in self.component_types:
+            ct_pos_index = self.type_indices[ct_id]
+            ct_loss_mean = np.mean(loss_mean[ct_pos_index])
+            ct_func_mean = np.mean(func_mean[ct_pos_index])
+            comptype_resp_dict[(ct_id, 'loss_mean')] = ct_loss_mean
+            comptype_resp_dict[(ct_id, 'loss_std')] = np.sqrt(np.mean(
+                self.component_loss.variance[ct_pos_index] +
+                (loss_mean[ct_pos_index] - ct_loss_mean) ** 2))
+            comptype_resp_dict[(ct_id, 'loss_tot')] = \
+                ct_loss_mean * len(ct_pos_index)
+            comptype_resp_dict[(ct_id, 'func_mean')] = ct_func_mean
+            comptype_resp_dict[(ct_id, 'func_std')] = np.sqrt(np.mean(
+                self.component_functionality.variance[ct_pos_index] +
+                (func_mean[ct_pos_index] - ct_func_mean) ** 2))
+            comptype_resp_dict[(ct_id, 'num_failures')] = \
+                np.mean(num_failures[ct_pos_index])
+        return comp_resp_dict, comptype_resp_dict
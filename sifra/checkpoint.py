@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+from sifra.logger import rootLogger
+
+# Switches that only choose how a run is executed, not its results. A run
+# can be resumed with other values of these.
+EXECUTION_SWITCHES = ('MULTIPROCESS', 'NUM_WORKERS', 'PARALLEL_CHUNK_SIZE',
+                      'SHARED_SAMPLE_ARRAYS', 'PARALLEL_BACKEND',
+                      'DASK_SCHEDULER_ADDRESS', 'CHECKPOINT')
+
+
+def config_digest(config):
+    """
+    SHA-256 digest of the settings of a configuration file, other than
+    the EXECUTION_SWITCHES.
+    :param config: The configuration, as read from its json file
+    """
+    settings = dict(config)
+    settings['Switches'] = {
+        name: value for name, value in config.get('Switches', {}).items()
+        if name not in EXECUTION_SWITCHES}
+    return hashlib.sha256(
+        json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def file_digest(path):
+    """SHA-256 digest of the contents of a file."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def hazard_digest(hazard):
+    """
+    SHA-256 digest of the hazard intensities of a hazard level, at each
+    of its locations.
+    """
+    digest = hashlib.sha256()
+    for location in hazard.scenario_hazard_data:
+        digest.update(u"{!r},{!r},{!r};".format(
+            location["longitude"], location["latitude"],
+            location["hazard_intensity"]).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class RunCheckpoint(object):
+    """
+    The responses of the hazard levels of a run, saved one file per level
+    in RAW_OUTPUT_DIR/checkpoint as soon as each level is complete, so a
+    run that stops can be resumed without repeating them.
+
+    A manifest records the digests of the configuration and of the model,
+    and the hazard levels with their numbers of samples and the digests of
+    their hazard intensities. The responses of a level only depend on
+    these, so a resumed run gives the same outputs as a run without a
+    stop. A checkpoint with another manifest is not resumed from.
+    """
+
+    def __init__(self, scenario, hazard_samples, resume=False):
+        """
+        :param scenario: Parameters for the simulation
+        :param hazard_samples: List of (hazard, number of samples) pairs
+        :param resume: Keep the responses saved by an earlier run with the
+                       same manifest. Otherwise the checkpoint starts empty.
+        """
+        self.directory = os.path.join(scenario.raw_output_dir, 'checkpoint')
+        hazard_names = [hazard.hazard_scenario_name
+                        for hazard, _ in hazard_samples]
+        self.hazard_index = {hazard_name: hazard_index
+                             for hazard_index, hazard_name
+                             in enumerate(hazard_names)}
+        self.manifest = {
+            'config_digest': scenario.config_digest,
+            'model_digest': file_digest(scenario.sys_conf_file),
+            'hazards': [[hazard.hazard_scenario_name, int(num_samples),
+                         hazard_digest(hazard)]
+                        for hazard, num_samples in hazard_samples]}
+        manifest_path = os.path.join(self.directory, 'manifest.json')
+
+        if resume and os.path.exists(manifest_path):
+            with open(manifest_path, 'r') as f:
+                saved_manifest = json.load(f)
+            if saved_manifest != self.manifest:
+                raise ValueError(
+                    "The checkpoint in {} was saved for another "
+                    "configuration, model or hazard, and "
+                    "cannot be resumed".format(self.directory))
+            rootLogger.info("Resuming from the checkpoint in " +
+                            self.directory)
+        else:
+            if resume:
+                rootLogger.info("No checkpoint to resume in " +
+                                self.directory)
+            shutil.rmtree(self.directory, ignore_errors=True)
+            os.makedirs(self.directory)
+            self._write(manifest_path,
+                        json.dumps(self.manifest, indent=2).encode('utf-8'))
+
+    def _path(self, hazard_name):
+        return os.path.join(self.directory, 'hazard_{:05d}.pickle'.format(
+            self.hazard_index[hazard_name]))
+
+    @staticmethod
+    def _write(path, data):
+        # a file is complete or absent, even if the run stops while saving
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+        os.rename(path + '.tmp', path)
+
+    def save(self, hazard_response):
+        """
+        :param hazard_response: Response of a hazard level, as given by
+                                calculate_response_for_hazard
+        """
+        for hazard_name in hazard_response:
+            self._write(self._path(hazard_name),
+                        pickle.dumps(hazard_response,
+                                     pickle.HIGHEST_PROTOCOL))
+
+    def load_completed(self):
+        """
+        :return: Dict of the saved responses by hazard level name
+        """
+        completed = {}
+        for hazard_name in self.hazard_index:
+            path = self._path(hazard_name)
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    completed[hazard_name] = pickle.load(f)
+        return completed
@@ -1,6 +1,7 @@
 import os
 import json
 from sifra.logger import rootLogger
+from sifra.checkpoint import config_digest
 import scripts.convert_setup_files_to_json as converter
 
 
@@ -16,6 +17,8 @@ class Configuration:
         :param run_mode: Default is 'impact' - this runs the full MC simulation
                          If option is 'analysis' then new output folders are
                          not created
+        :param output_path: Output folder of an earlier run, to use instead
+                            of a new timestamped one, e.g. to resume it
         """
         file_ext = \
             os.path.splitext(os.path.basename(configuration_file_path))[1]
@@ -25,6 +28,8 @@ class Configuration:
 
         with open(configuration_file_path, 'r') as f:
             config = json.load(f)
+        # identifies the settings that the results of a run depend on
+        self.CONFIG_DIGEST = config_digest(config)
 
         # reading in simulation scenario parameters
         self.SCENARIO_NAME \
@@ -94,7 +99,105 @@ class Configuration:
         self.SAVE_VARS_NPY = config['Test']['SAVE_VARS_NPY']
 
         self.MULTIPROCESS = config['Switches']['MULTIPROCESS']
+        # Number of worker processes of a parallel run, zero for one per
+        # CPU, and the number of hazard levels sent to a worker at a time
+        self.NUM_WORKERS = config['Switches'].get('NUM_WORKERS', 0)
+        self.PARALLEL_CHUNK_SIZE = \
+            config['Switches'].get('PARALLEL_CHUNK_SIZE', 1)
+        # The workers of a parallel run write their per-sample arrays into
+        # memory-mapped files, instead of returning them pickled
+        self.SHARED_SAMPLE_ARRAYS = \
+            config['Switches'].get('SHARED_SAMPLE_ARRAYS', False)
+        # The backend that runs the tasks: 'serial', 'process' or 'dask'.
+        # Defaults to 'process' with MULTIPROCESS and 'serial' without.
+        self.PARALLEL_BACKEND = config['Switches'].get('PARALLEL_BACKEND')
+        # Address of the scheduler of a dask cluster. Without one, the
+        # 'dask' backend starts a cluster on this machine.
+        self.DASK_SCHEDULER_ADDRESS = \
+            config['Switches'].get('DASK_SCHEDULER_ADDRESS')
+        # Save the response of each hazard level in RAW_OUTPUT_DIR as soon
+        # as it is complete, so the run can be resumed
+        self.CHECKPOINT = config['Switches'].get('CHECKPOINT', False)
         self.RUN_CONTEXT = config['Switches']['RUN_CONTEXT']
+        # Use the same random numbers for every hazard level, and only
+        # recalculate the output of the samples whose damage states change
+        # from one level to the next
+        self.COMMON_RANDOM_NUMBERS = \
+            config['Switches'].get('COMMON_RANDOM_NUMBERS', False)
+        # Uniform numbers the damage states are sampled from: 'random'
+        # (pseudo-random), 'lhs' (Latin hypercube), 'sobol' (scrambled
+        # Sobol sequence) or 'philox' (counter-based pseudo-random streams
+        # keyed on RANDOM_SEED and the hazard level)
+        self.SAMPLING_METHOD = \
+            config['Switches'].get('SAMPLING_METHOD', 'random')
+        self.RANDOM_SEED = config['Switches'].get('RANDOM_SEED', 0)
+        # Give the components whose damage state is certain at a hazard
+        # level that damage state without drawing random numbers, and
+        # evaluate a level where every component is certain only once
+        self.DETERMINISTIC_SATURATION = \
+            config['Switches'].get('DETERMINISTIC_SATURATION', False)
+        # Draw IMPORTANCE_BIASED_FRACTION of the samples from a proposal
+        # that damages every component with a probability of at least
+        # IMPORTANCE_MIN_EXCEEDANCE, and weight the samples by their
+        # likelihood ratio
+        self.IMPORTANCE_SAMPLING = \
+            config['Switches'].get('IMPORTANCE_SAMPLING', False)
+        self.IMPORTANCE_MIN_EXCEEDANCE = \
+            config['Switches'].get('IMPORTANCE_MIN_EXCEEDANCE', 0.1)
+        self.IMPORTANCE_BIASED_FRACTION = \
+            config['Switches'].get('IMPORTANCE_BIASED_FRACTION', 0.5)
+        # Draw the samples of each hazard level in blocks of
+        # ADAPTIVE_BLOCK_SIZE, and stop when the confidence intervals of
+        # the mean economic loss and output are within ADAPTIVE_TOLERANCE,
+        # or NUM_SAMPLES is reached
+        self.ADAPTIVE_SAMPLING = \
+            config['Switches'].get('ADAPTIVE_SAMPLING', False)
+        self.ADAPTIVE_BLOCK_SIZE = \
+            config['Switches'].get('ADAPTIVE_BLOCK_SIZE', 100)
+        self.ADAPTIVE_TOLERANCE = \
+            config['Switches'].get('ADAPTIVE_TOLERANCE', 0.01)
+        self.ADAPTIVE_CONFIDENCE = \
+            config['Switches'].get('ADAPTIVE_CONFIDENCE', 0.95)
+        # Share a total of SAMPLE_BUDGET samples between the hazard levels,
+        # from a pilot pass of PILOT_SAMPLES samples at each level.
+        # Zero draws NUM_SAMPLES samples at every level.
+        self.SAMPLE_BUDGET = config['Switches'].get('SAMPLE_BUDGET', 0)
+        self.PILOT_SAMPLES = config['Switches'].get('PILOT_SAMPLES', 100)
+        # Draw and evaluate the samples of a hazard level in chunks of this
+        # many samples, keeping running statistics instead of per-sample
+        # arrays. Zero evaluates all the samples at once.
+        self.STREAM_CHUNK_SIZE = \
+            config['Switches'].get('STREAM_CHUNK_SIZE', 0)
+        # Split the samples of each hazard level into shards of this many
+        # samples, evaluated on the workers of a parallel run, and merge
+        # their statistics. Zero keeps each hazard level in one task.
+        self.SAMPLE_SHARD_SIZE = \
+            config['Switches'].get('SAMPLE_SHARD_SIZE', 0)
+        # Number of component functionality vectors whose system output
+        # is memoised during a run. Zero disables the cache.
+        self.FLOW_CACHE_SIZE = \
+            config['Switches'].get('FLOW_CACHE_SIZE', 10000)
+        # Evaluate only the distinct damage state rows of the samples
+        self.COMPRESS_SAMPLES = \
+            config['Switches'].get('COMPRESS_SAMPLES', False)
+        # Graph library for the max flow calculations, or 'auto' to
+        # select the fastest for the model
+        self.GRAPH_BACKEND = \
+            config['Switches'].get('GRAPH_BACKEND', 'igraph')
+        # Calculate the output in closed form where the component graph
+        # reduces to series and parallel parts
+        self.FLOW_REDUCTION = \
+            config['Switches'].get('FLOW_REDUCTION', True)
+        # Decide the output of the samples that the reachability of the
+        # output nodes settles, without a flow calculation
+        self.REACHABILITY_FAST_PATH = \
+            config['Switches'].get('REACHABILITY_FAST_PATH', True)
+        # Find the samples with no output from the minimal cut sets of up
+        # to CUT_SET_MAX_ORDER components, before any flow calculation
+        self.CUT_SET_SCREENING = \
+            config['Switches'].get('CUT_SET_SCREENING', False)
+        self.CUT_SET_MAX_ORDER = \
+            config['Switches'].get('CUT_SET_MAX_ORDER', 2)
 
         # reading in setup information
 
@@ -107,8 +210,13 @@ class Configuration:
         self.timestamp = rootLogger.timestamp
 
         if run_mode=='impact':
-            output_dir_timestamped = self.OUTPUT_DIR_NAME + "_" + self.timestamp
-            self.OUTPUT_PATH = os.path.join(self.ROOT_DIR, output_dir_timestamped)
+            if output_path:
+                self.OUTPUT_PATH = os.path.abspath(output_path)
+            else:
+                output_dir_timestamped = \
+                    self.OUTPUT_DIR_NAME + "_" + self.timestamp
+                self.OUTPUT_PATH = os.path.join(self.ROOT_DIR,
+                                                output_dir_timestamped)
 
             # create output dir: root/SCENARIO_NAME+self.timestamp
             if not os.path.exists(self.OUTPUT_PATH):
@@ -0,0 +1,231 @@
+from collections import OrderedDict
+import multiprocessing
+import os
+import tempfile
+try:
+    from distributed import Client, LocalCluster
+except ImportError:
+    # dask.distributed is only needed for the 'dask' backend
+    Client = None
+    LocalCluster = None
+
+# The state of a worker process: the task function and the model it is
+# applied to, set once by the initializer of the pool
+_worker_state = {}
+
+
+def _initialise_worker(function, scenario, infrastructure):
+    _worker_state['function'] = function
+    _worker_state['scenario'] = scenario
+    _worker_state['infrastructure'] = infrastructure
+
+
+def _run_task(task):
+    return _worker_state['function'](task,
+                                     _worker_state['scenario'],
+                                     _worker_state['infrastructure'])
+
+
+class SerialExecutor(object):
+    """
+    Runs the tasks one after the other in this process, with the model
+    of the run.
+    """
+    name = 'serial'
+
+    def __init__(self, function, scenario, infrastructure):
+        """
+        :param function: Module level function called as
+                         function(task, scenario, infrastructure)
+        :param scenario: Parameters for the scenario
+        :param infrastructure: Model of the infrastructure
+        """
+        self.function = function
+        self.scenario = scenario
+        self.infrastructure = infrastructure
+
+    @classmethod
+    def is_available(cls):
+        """
+        Whether the backend can be used with the installed libraries.
+        """
+        return True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    def map(self, tasks):
+        """
+        :param tasks: List of the arguments of the tasks
+        :return: List of the results of the tasks, in the order of the tasks
+        """
+        return list(self.imap(tasks))
+
+    def imap(self, tasks):
+        """
+        :param tasks: List of the arguments of the tasks
+        :return: Iterator of the results of the tasks, in the order of the
+                 tasks, each as soon as it and the ones before it are done
+        """
+        for task in tasks:
+            yield self.function(task, self.scenario, self.infrastructure)
+
+
+class ModelPool(SerialExecutor):
+    """
+    A pool of worker processes that each hold their own copy of the
+    scenario and the infrastructure model, for the whole run.
+
+    The model is handed to each worker once, by the initializer of the
+    pool, rather than pickled with every task as parmap.map does. Where
+    processes are forked, the workers inherit the model with no pickling
+    at all. A task only carries its own arguments, e.g. a hazard level and
+    its number of samples, and the tasks are sent to the workers in chunks
+    of chunk_size tasks.
+    """
+    name = 'process'
+
+    def __init__(self, function, scenario, infrastructure, num_workers=0,
+                 chunk_size=1):
+        """
+        :param function: Module level function called as
+                         function(task, scenario, infrastructure)
+        :param scenario: Parameters for the scenario
+        :param infrastructure: Model of the infrastructure
+        :param num_workers: Number of worker processes. Zero uses one for
+                            each CPU.
+        :param chunk_size: Number of tasks sent to a worker at a time
+        """
+        self.num_workers = num_workers or multiprocessing.cpu_count()
+        self.chunk_size = max(int(chunk_size), 1)
+        # compile the model before the workers start, so they share it
+        infrastructure.compile()
+        self._pool = multiprocessing.Pool(
+            self.num_workers, initializer=_initialise_worker,
+            initargs=(function, scenario, infrastructure))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self._pool.close()
+        else:
+            self._pool.terminate()
+        self._pool.join()
+
+    def map(self, tasks):
+        """
+        :param tasks: List of the arguments of the tasks
+        :return: List of the results of the tasks, in the order of the tasks
+        """
+        return self._pool.map(_run_task, tasks, self.chunk_size)
+
+    def imap(self, tasks):
+        return self._pool.imap(_run_task, tasks, self.chunk_size)
+
+
+class DaskExecutor(SerialExecutor):
+    """
+    Runs the tasks on the workers of a dask.distributed cluster, which
+    can span several machines. The scenario and the model are scattered
+    to every worker once, and the tasks refer to the worker's copy.
+
+    Without the address of a scheduler, a LocalCluster of num_workers
+    worker processes is started on this machine for the run. The workers
+    of a cluster need sifra on their path, and one thread each, since a
+    model is not shared safely between threads, e.g.
+        dask-worker tcp://scheduler:8786 --nthreads 1
+    """
+    name = 'dask'
+
+    def __init__(self, function, scenario, infrastructure, num_workers=0,
+                 scheduler_address=None):
+        """
+        :param function: Module level function called as
+                         function(task, scenario, infrastructure)
+        :param scenario: Parameters for the scenario
+        :param infrastructure: Model of the infrastructure
+        :param num_workers: Number of worker processes of a LocalCluster.
+                            Zero uses one for each CPU.
+        :param scheduler_address: Address of the scheduler of a running
+                                  cluster, e.g. 'tcp://10.0.0.1:8786'
+        """
+        super(DaskExecutor, self).__init__(function, scenario,
+                                           infrastructure)
+        infrastructure.compile()
+        self._cluster = None
+        if scheduler_address:
+            self._client = Client(scheduler_address)
+        else:
+            self._cluster = LocalCluster(
+                n_workers=num_workers or multiprocessing.cpu_count(),
+                threads_per_worker=1, diagnostics_port=None,
+                # keep the scratch space of the workers out of the run
+                local_dir=os.path.join(tempfile.gettempdir(),
+                                       'sifra-dask-worker-space'))
+            self._client = Client(self._cluster)
+        self._model = self._client.scatter([scenario, infrastructure],
+                                           broadcast=True)
+
+    @classmethod
+    def is_available(cls):
+        return Client is not None
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._client.close()
+        if self._cluster is not None:
+            self._cluster.close()
+
+    def imap(self, tasks):
+        scenario, infrastructure = self._model
+        futures = self._client.map(self.function, tasks,
+                                   scenario=scenario,
+                                   infrastructure=infrastructure,
+                                   pure=False)
+        for future in futures:
+            yield future.result()
+
+
+EXECUTORS = OrderedDict(
+    (executor.name, executor) for executor in
+    (SerialExecutor, ModelPool, DaskExecutor))
+
+
+def parallel_backend(scenario):
+    """
+    The name of the parallel backend of the scenario: its PARALLEL_BACKEND,
+    or else 'process' with MULTIPROCESS and 'serial' without.
+    """
+    name = scenario.parallel_backend
+    if not name:
+        name = 'process' if scenario.run_parallel_proc else 'serial'
+    if name not in EXECUTORS:
+        raise ValueError("Unknown parallel backend '{}'. Accepted backends "
+                         "are: {}".format(name, ", ".join(EXECUTORS)))
+    if not EXECUTORS[name].is_available():
+        raise ValueError("The parallel backend '{}' is not available with "
+                         "the installed libraries".format(name))
+    return name
+
+
+def create_executor(function, scenario, infrastructure):
+    """
+    Build the executor of the parallel backend of the scenario.
+    :param function: Module level function called as
+                     function(task, scenario, infrastructure)
+    :param scenario: Parameters for the scenario
+    :param infrastructure: Model of the infrastructure
+    """
+    name = parallel_backend(scenario)
+    if name == 'process':
+        return ModelPool(function, scenario, infrastructure,
+                         scenario.num_workers, scenario.parallel_chunk_size)
+    if name == 'dask':
+        return DaskExecutor(function, scenario, infrastructure,
+                            scenario.num_workers,
+                            scenario.dask_scheduler_address)
+    return SerialExecutor(function, scenario, infrastructure)
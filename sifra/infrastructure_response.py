@@ -38,12 +38,14 @@ from sifra.modelling import infrastructure
 
 def plot_mean_econ_loss(scenario, economic_loss_array, hazards):
     """Draws and saves a boxplot of mean economic loss"""
-    hazvals_ext = [[str(i)] * scenario.num_samples
+    # the rows of the hazard levels with fewer samples are NaN padding
+    num_sample_rows = np.shape(economic_loss_array)[0]
+    hazvals_ext = [[str(i)] * num_sample_rows
                    for i in hazards.hazard_scenario_list]
 
     x1 = np.ndarray.flatten(np.array(hazvals_ext))
 
-    smpl = range(1, scenario.num_samples + 1, 1)
+    smpl = range(1, num_sample_rows + 1, 1)
     x2 = np.array(smpl * hazards.num_hazard_pts)
 
     arrays = [x1, x2]
@@ -93,6 +95,50 @@ def plot_mean_econ_loss(scenario, economic_loss_array, hazards):
     plt.close(fig)
 
 
+def get_sample_counts(response_list, hazards):
+    """
+    The number of samples drawn at each hazard level, in the order of the
+    columns of the per-sample arrays of the response list. The rows past
+    the samples of a hazard level are padding.
+    """
+    return [response_list[6][hazard.hazard_scenario_name]
+            for hazard in hazards.listOfhazards]
+
+
+def get_sample_weights(response_list, hazards):
+    """
+    The likelihood weights of the samples at each hazard level, in the
+    order of the columns of the per-sample arrays of the response list,
+    or None for the levels whose samples have equal weight.
+    """
+    sample_weights = []
+    for hazard in hazards.listOfhazards:
+        weights = response_list[7][hazard.hazard_scenario_name]
+        sample_weights.append(
+            None if weights is None else np.asarray(weights))
+    return sample_weights
+
+
+def get_response_statistics(response_list, hazards):
+    """
+    The ResponseAccumulator of each hazard level, in the order of the
+    columns of the per-sample arrays of the response list, for a run with
+    streamed samples that keeps no per-sample arrays.
+    """
+    return [response_list[8][hazard.hazard_scenario_name]
+            for hazard in hazards.listOfhazards]
+
+
+def exceedance_fraction(exceeded, weights=None):
+    """
+    The fraction of the samples in which a damage state is exceeded,
+    weighted by the likelihood weights of the samples when they are given.
+    """
+    if weights is None:
+        return np.sum(exceeded) / float(len(exceeded))
+    return np.average(exceeded, weights=weights)
+
+
 def write_system_response(response_list, infrastructure, scenario, hazards):
     # ------------------------------------------------------------------------
     # 'ids_comp_vs_haz' is a dict of numpy arrays
@@ -103,7 +149,12 @@ def write_system_response(response_list, infrastructure, scenario, hazards):
     id_comp_vs_haz = response_list[0]
     with open(idshaz, 'w') as handle:
         for response_key in sorted(id_comp_vs_haz.keys()):
-            pickle.dump({response_key: id_comp_vs_haz[response_key]}, handle)
+            if id_comp_vs_haz[response_key] is None:
+                # streamed samples keep no damage states
+                continue
+            pickle.dump(
+                {response_key: np.asarray(id_comp_vs_haz[response_key])},
+                handle)
     idshaz_zip = os.path.join(scenario.raw_output_dir, 'ids_comp_vs_haz.zip')
     zipmode = zipfile.ZIP_DEFLATED
     with zipfile.ZipFile(idshaz_zip, 'w', zipmode) as zip:
@@ -131,6 +182,18 @@ def write_system_response(response_list, infrastructure, scenario, hazards):
                          sep=',',
                          index_label=[sys_output_df.index.name])
 
+    # ------------------------------------------------------------------------
+    # Number of samples drawn for each hazard level
+    # ------------------------------------------------------------------------
+    sample_count_df = pd.DataFrame(
+        {'Number of Samples': pd.Series(response_list[6])})
+    sample_count_df.index.name = 'Hazard Intensity'
+    outfile_sample_count = os.path.join(scenario.output_path,
+                                        'sample_count_vs_haz_intensity.csv')
+    sample_count_df.to_csv(outfile_sample_count,
+                           sep=',',
+                           index_label=[sample_count_df.index.name])
+
     # ------------------------------------------------------------------------
     # Hazard response for component instances, i.e. components as-installed
     # ------------------------------------------------------------------------
@@ -161,28 +224,40 @@ def write_system_response(response_list, infrastructure, scenario, hazards):
 
     # infrastructure econ loss for sample
     economic_loss_array = response_list[5]
-    sys_frag = np.zeros_like(economic_loss_array, dtype=int)
-    if_system_damage_states = infrastructure.get_dmg_scale_bounds(scenario)
-    for j, hazard_level in enumerate(hazards.hazard_scenario_list):
-        for i in range(scenario.num_samples):
-            # system output and economic loss
-            sys_frag[i, j] = \
-                np.sum(economic_loss_array[i, j] > if_system_damage_states)
-
-    # Calculating Probability of Exceedence:
     pe_sys_econloss = np.zeros(
         (len(infrastructure.get_system_damage_states()),
          hazards.num_hazard_pts)
     )
-    for j in range(hazards.num_hazard_pts):
-        for i in range(len(infrastructure.get_system_damage_states())):
-            pe_sys_econloss[i, j] = \
-                np.sum(sys_frag[:, j] >= i) / float(scenario.num_samples)
+    if economic_loss_array is None:
+        # the samples were streamed, and only the histograms of the system
+        # damage states were kept
+        for j, statistics in enumerate(
+                get_response_statistics(response_list, hazards)):
+            for i in range(len(infrastructure.get_system_damage_states())):
+                pe_sys_econloss[i, j] = statistics.system_damage.exceedance(i)
+    else:
+        sample_counts = get_sample_counts(response_list, hazards)
+        sample_weights = get_sample_weights(response_list, hazards)
+        # the padding rows past the samples of a hazard level are marked -1
+        sys_frag = np.full(economic_loss_array.shape, -1, dtype=int)
+        if_system_damage_states = \
+            infrastructure.get_dmg_scale_bounds(scenario)
+        for j, hazard_level in enumerate(hazards.hazard_scenario_list):
+            for i in range(sample_counts[j]):
+                # system output and economic loss
+                sys_frag[i, j] = \
+                    np.sum(economic_loss_array[i, j] > if_system_damage_states)
+
+        # Calculating Probability of Exceedence:
+        for j in range(hazards.num_hazard_pts):
+            for i in range(len(infrastructure.get_system_damage_states())):
+                pe_sys_econloss[i, j] = exceedance_fraction(
+                    sys_frag[:sample_counts[j], j] >= i, sample_weights[j])
 
-    np.save(
-        os.path.join(scenario.raw_output_dir, 'sys_frag.npy'),
-        sys_frag
-        )
+        np.save(
+            os.path.join(scenario.raw_output_dir, 'sys_frag.npy'),
+            sys_frag
+            )
 
     np.save(
         os.path.join(scenario.raw_output_dir, 'pe_sys_econloss.npy'),
@@ -208,74 +283,87 @@ def pe_by_component_class(response_list, infrastructure, scenario, hazards):
 
     cp_classes_in_system = np.unique(list(infrastructure.
                                           get_component_class_list()))
-
-    cp_class_map = {k: [] for k in cp_classes_in_system}
-    for comp_id, component in infrastructure.components.items():
-        cp_class_map[component.component_class].append(component)
+    sample_counts = get_sample_counts(response_list, hazards)
+    sample_weights = get_sample_weights(response_list, hazards)
+    # streamed samples without per-sample arrays keep their statistics
+    streamed = response_list[5] is None
 
     if infrastructure.system_class == 'Substation':
         cp_classes_costed = \
             [x for x in cp_classes_in_system
              if x not in infrastructure.uncosted_classes]
-
-        # --- System fragility - Based on Failure of Component Classes ---
-        comp_class_failures = \
-            {cc: np.zeros((scenario.num_samples, hazards.num_hazard_pts))
-             for cc in cp_classes_costed}
-
-        comp_class_frag = \
-            {cc: np.zeros((scenario.num_samples, hazards.num_hazard_pts))
-             for cc in cp_classes_costed}
-
-        # TODO check or correctness
-        # for j, hazard_level in enumerate(hazard.hazard_range):
-        #     for i in range(scenario.num_samples):
-        #         for compclass in cp_classes_costed:
-        #             for c in cp_class_map[compclass]:
-        #                 comp_class_failures[compclass][i, j] += \
-        #                     response_list[hazard_level.hazard_intensity]\
-        #                                  [i, infrastructure.components[c]]
-        #             comp_class_failures[compclass][i, j] /= \
-        #                 len(cp_class_map[compclass])
-        #
-        #             comp_class_frag[compclass][i, j] = \
-        #                 np.sum(comp_class_failures[compclass][i, j] > \
-        #                        infrastructure.ds_lims_compclasses[compclass])
-
-        # for j, hazard_intensity in enumerate(hazards.hazard_range):
-
-        for j, (scenario_name, hazard_data) in \
-                enumerate(hazards.scenario_hazard_data.items()):
-            for i in range(scenario.num_samples):
-                for compclass in cp_classes_costed:
-                    # **************************************************
-                    # TODO: CHECK COMPONENETS ARE SAVED IN CORRECT ORDER
-                    # **************************************************
-                    for comptype in cp_class_map[compclass]:
-                        comp_ndx = infrastructure.components.keys().\
-                            index(comptype.component_id)
-                        comp_class_failures[compclass][i, j] += \
-                            response_list[0][scenario_name][i, comp_ndx]
-                    comp_class_failures[compclass][i, j] /= \
-                        len(cp_class_map[compclass])
-
-                    comp_class_frag[compclass][i, j] = \
-                        np.sum(comp_class_failures[compclass][i, j] > \
-                               infrastructure.ds_lims_compclasses[compclass])
-
-        # Probability of Exceedence -- Based on Failure of Component Classes
         pe_sys_cpfailrate = np.zeros(
             (len(infrastructure.sys_dmg_states), hazards.num_hazard_pts)
         )
-        for p in range(hazards.num_hazard_pts):
-            for d in range(len(infrastructure.sys_dmg_states)):
-                ds_ss_ix = []
+
+        if streamed:
+            # Probability of Exceedence -- from the histograms of the
+            # damage states of the component classes
+            for p, statistics in enumerate(
+                    get_response_statistics(response_list, hazards)):
+                for d in range(len(infrastructure.sys_dmg_states)):
+                    pe_sys_cpfailrate[d, p] = np.median(
+                        [statistics.class_damage[compclass].exceedance(d)
+                         for compclass in cp_classes_costed])
+        else:
+            num_sample_rows = response_list[5].shape[0]
+
+            # --- System fragility - Based on Failure of Component Classes ---
+            comp_class_failures = \
+                {cc: np.zeros((num_sample_rows, hazards.num_hazard_pts))
+                 for cc in cp_classes_costed}
+
+            comp_class_frag = \
+                {cc: np.zeros((num_sample_rows, hazards.num_hazard_pts))
+                 for cc in cp_classes_costed}
+
+            # TODO check or correctness
+            # for j, hazard_level in enumerate(hazard.hazard_range):
+            #     for i in range(scenario.num_samples):
+            #         for compclass in cp_classes_costed:
+            #             for c in cp_class_map[compclass]:
+            #                 comp_class_failures[compclass][i, j] += \
+            #                     response_list[hazard_level.hazard_intensity]\
+            #                                  [i, infrastructure.components[c]]
+            #             comp_class_failures[compclass][i, j] /= \
+            #                 len(cp_class_map[compclass])
+            #
+            #             comp_class_frag[compclass][i, j] = \
+            #                 np.sum(comp_class_failures[compclass][i, j] > \
+            #                        infrastructure.ds_lims_compclasses[compclass])
+
+            # for j, hazard_intensity in enumerate(hazards.hazard_range):
+
+            # The damage state samples are in the compiled (sorted) component
+            # order, so the class membership is taken from the compiled model
+            compiled = infrastructure.compile()
+            for j, (scenario_name, hazard_data) in \
+                    enumerate(hazards.scenario_hazard_data.items()):
+                component_damage_state_ind = \
+                    np.asarray(response_list[0][scenario_name])
+                samples = slice(0, len(component_damage_state_ind))
                 for compclass in cp_classes_costed:
-                    ds_ss_ix.append(
-                        np.sum(comp_class_frag[compclass][:, p] >= d) /
-                        float(scenario.num_samples)
-                    )
-                pe_sys_cpfailrate[d, p] = np.median(ds_ss_ix)
+                    comp_class_failures[compclass][samples, j] = np.mean(
+                        component_damage_state_ind[
+                            :, compiled.class_indices[compclass]],
+                        axis=1)
+
+                    comp_class_frag[compclass][samples, j] = np.sum(
+                        comp_class_failures[compclass][samples, j]
+                        [:, np.newaxis] >
+                        infrastructure.ds_lims_compclasses[compclass],
+                        axis=1)
+
+            # Probability of Exceedence -- Based on Failure of Component Classes
+            for p in range(hazards.num_hazard_pts):
+                for d in range(len(infrastructure.sys_dmg_states)):
+                    ds_ss_ix = []
+                    for compclass in cp_classes_costed:
+                        ds_ss_ix.append(exceedance_fraction(
+                            comp_class_frag[compclass][:sample_counts[p], p]
+                            >= d,
+                            sample_weights[p]))
+                    pe_sys_cpfailrate[d, p] = np.median(ds_ss_ix)
 
         # --- Save prob exceedance data as npy ---
         np.save(os.path.join(scenario.raw_output_dir, 'pe_sys_cpfailrate.npy'),
@@ -285,28 +373,21 @@ def pe_by_component_class(response_list, infrastructure, scenario, hazards):
     # Validate damage ratio of the system
     # ------------------------------------------------------------------------
 
+    compiled = infrastructure.compile()
+    sys_dmg_state_indices = [int(ds) for ds in infrastructure.sys_dmg_states]
     exp_damage_ratio = np.zeros((len(infrastructure.components),
                                  hazards.num_hazard_pts))
     for l, hazard in enumerate(hazards.listOfhazards):
         # compute expected damage ratio
-        for j, component in enumerate(infrastructure.components.values()):
-            # TODO remove invalid Component accesses !!
-
-            component_pe_ds = np.zeros(len(component.damage_states))
-            for damage_state_index in component.damage_states.keys():
-                long, lat = component.get_location()
-                hazard_intensity \
-                    = hazard.get_hazard_intensity_at_location(long, lat)
-                component_pe_ds[damage_state_index] \
-                    = component.damage_states[damage_state_index].\
-                      response_function(hazard_intensity)
-
-            component_pe_ds = component_pe_ds[1:]
+        all_comps_pe_ds = infrastructure.get_exceedance_probabilities(hazard)
+        for j, comp_id in enumerate(infrastructure.components.keys()):
+            comp_index = compiled.component_index[comp_id]
+            component_pe_ds = all_comps_pe_ds[
+                comp_index, :compiled.num_damage_states[comp_index] - 1]
             pb = pe2pb(component_pe_ds)
 
-            dr = np.array([component.damage_states[int(ds)].damage_ratio
-                           for ds in infrastructure.sys_dmg_states])
-            cf = component.cost_fraction
+            dr = compiled.ds_damage_ratio[comp_index, sys_dmg_state_indices]
+            cf = compiled.cost_fraction[comp_index]
             loss_list = dr * cf
             exp_damage_ratio[j, l] = np.sum(pb * loss_list)
 
@@ -326,9 +407,27 @@ def pe_by_component_class(response_list, infrastructure, scenario, hazards):
     economic_loss_array = response_list[5]
     calculated_output_array = response_list[4]
 
+    if streamed:
+        statistics = get_response_statistics(response_list, hazards)
+        mean_economic_loss = np.array(
+            [level.economic_loss.mean[0] for level in statistics])
+        mean_output = np.array(
+            [np.sum(level.output.mean) for level in statistics])
+    else:
+        mean_economic_loss = np.nanmean(economic_loss_array, axis=0)
+        mean_output = np.nanmean(calculated_output_array, axis=0)
+        for j, weights in enumerate(sample_weights):
+            if weights is not None:
+                mean_economic_loss[j] = np.average(
+                    economic_loss_array[:sample_counts[j], j],
+                    weights=weights)
+                mean_output[j] = np.average(
+                    calculated_output_array[:sample_counts[j], j],
+                    weights=weights)
+
     outdat = {out_cols[0]: hazards.hazard_scenario_list,
-              out_cols[1]: np.mean(economic_loss_array, axis=0),
-              out_cols[2]: np.mean(calculated_output_array, axis=0)}
+              out_cols[1]: mean_economic_loss,
+              out_cols[2]: mean_output}
     df = pd.DataFrame(outdat)
     df.to_csv(
         outfile_sys_response, sep=',',
@@ -368,7 +467,7 @@ def pe_by_component_class(response_list, infrastructure, scenario, hazards):
     # *** Saving vars ***
     # ------------------------------------------------------------------------
 
-    if scenario.save_vars_npy:
+    if scenario.save_vars_npy and not streamed:
         np.save(
             os.path.join(scenario.raw_output_dir, 'economic_loss_array.npy'),
             economic_loss_array
@@ -379,6 +478,7 @@ def pe_by_component_class(response_list, infrastructure, scenario, hazards):
             calculated_output_array
         )
 
+    if scenario.save_vars_npy:
         np.save(
             os.path.join(scenario.raw_output_dir, 'exp_damage_ratio.npy'),
             exp_damage_ratio
@@ -0,0 +1,313 @@
+from collections import OrderedDict
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import breadth_first_order
+
+
+class CompiledInfrastructure(object):
+    """
+    An immutable, array based snapshot of an infrastructure model.
+
+    The simulation needs the same derived data for every hazard level and
+    every sample: the order of the components, the loss and functionality
+    of each damage state, the component groupings and the connectivity
+    of the component graph. This class derives them once from an
+    Infrastructure object and holds them as read-only numpy arrays, so
+    that all the calculation engines share one copy. It keeps no
+    references to component or graph objects, which makes it cheap to
+    pickle for worker processes.
+
+    Arrays indexed by component use the sorted component id order, which
+    is the column order of the sampled damage states.
+    """
+
+    def __init__(self, infrastructure):
+        """
+        Derive the arrays from the infrastructure model.
+        :param infrastructure: The Infrastructure object to compile
+        """
+        components = infrastructure.components
+
+        # ---------------------------------------------------------------
+        # component order
+        self.component_ids = tuple(sorted(components.keys()))
+        self.component_index = {comp_id: comp_index for comp_index, comp_id
+                                in enumerate(self.component_ids)}
+        self.num_components = len(self.component_ids)
+
+        # ---------------------------------------------------------------
+        # damage state tables (components x damage states)
+        self.num_damage_states = np.array(
+            [len(components[comp_id].damage_states)
+             for comp_id in self.component_ids], dtype=int)
+        max_damage_states = max(list(self.num_damage_states) + [1])
+        self.cost_fraction = np.array(
+            [components[comp_id].cost_fraction
+             for comp_id in self.component_ids], dtype=np.float64)
+
+        self.ds_damage_ratio = np.zeros(
+            (self.num_components, max_damage_states), dtype=np.float64)
+        self.ds_functionality = np.zeros(
+            (self.num_components, max_damage_states), dtype=np.float64)
+        self.ds_loss = np.zeros(
+            (self.num_components, max_damage_states), dtype=np.float64)
+        for comp_index, comp_id in enumerate(self.component_ids):
+            component = components[comp_id]
+            for ds_index, damage_state in component.damage_states.items():
+                self.ds_damage_ratio[comp_index, ds_index] = \
+                    damage_state.damage_ratio
+                self.ds_functionality[comp_index, ds_index] = \
+                    damage_state.functionality
+                self.ds_loss[comp_index, ds_index] = \
+                    damage_state.damage_ratio * component.cost_fraction
+
+        # a component has failed when it is in its last damage state
+        self.failure_ds_index = self.num_damage_states - 1
+
+        # ---------------------------------------------------------------
+        # component groupings
+        self.component_types = tuple(sorted(
+            infrastructure.get_component_types()))
+        self.type_indices = self._group_indices(
+            [components[comp_id].component_type
+             for comp_id in self.component_ids])
+        self.class_indices = self._group_indices(
+            [components[comp_id].component_class
+             for comp_id in self.component_ids])
+        self.is_dependency = np.array(
+            [components[comp_id].node_type == 'dependency'
+             for comp_id in self.component_ids], dtype=bool)
+
+        # ---------------------------------------------------------------
+        # graph connectivity
+        # The edges are listed in the order of the component graph, whose
+        # capacities are set by edge id. They are taken from the graph
+        # rather than the destination dicts, because a model restored from
+        # a pickle keeps the graph it was built with while its dicts can
+        # iterate in another order.
+        component_graph = infrastructure._component_graph
+        self.edge_parent = component_graph.edge_parent.copy()
+        self.edge_child = component_graph.edge_child.copy()
+        self.num_edges = len(self.edge_parent)
+
+        # CSR adjacency: the children of component i are
+        # adjacency_indices[adjacency_indptr[i]:adjacency_indptr[i + 1]],
+        # and adjacency_edges holds the matching edge ids
+        self.adjacency_edges = np.argsort(self.edge_parent, kind='mergesort')
+        self.adjacency_indices = self.edge_child[self.adjacency_edges]
+        self.adjacency_indptr = np.concatenate(
+            ([0], np.cumsum(np.bincount(self.edge_parent,
+                                        minlength=self.num_components))))
+
+        # ---------------------------------------------------------------
+        # dependency propagation
+        self.dependency_levels = self._build_dependency_levels()
+
+        # ---------------------------------------------------------------
+        # supply and output nodes, in the order of the model's dicts
+        self.supply_ids = tuple(infrastructure.supply_nodes.keys())
+        self.supply_indices = np.array(
+            [self.component_index[comp_id] for comp_id in self.supply_ids],
+            dtype=int)
+        self.supply_capacity_fraction = np.array(
+            [infrastructure.supply_nodes[comp_id]['capacity_fraction']
+             for comp_id in self.supply_ids], dtype=np.float64)
+        self.supply_commodity_types = tuple(
+            infrastructure.supply_nodes[comp_id]['commodity_type']
+            for comp_id in self.supply_ids)
+
+        self.output_ids = tuple(infrastructure.output_nodes.keys())
+        self.output_indices = np.array(
+            [self.component_index[comp_id] for comp_id in self.output_ids],
+            dtype=int)
+        self.output_capacity_fraction = np.array(
+            [infrastructure.output_nodes[comp_id]['capacity_fraction']
+             for comp_id in self.output_ids], dtype=np.float64)
+        self.nominal_output = infrastructure.get_nominal_output()
+
+        # ---------------------------------------------------------------
+        # max flow problems solved for each output node
+        self.flow_plan = self._build_flow_plan()
+
+        self._freeze()
+
+    @staticmethod
+    def _group_indices(labels):
+        """
+        Map each distinct label to the sorted indices of its components.
+        """
+        groups = {}
+        for comp_index, label in enumerate(labels):
+            groups.setdefault(label, []).append(comp_index)
+        return {label: np.array(indices, dtype=int)
+                for label, indices in groups.items()}
+
+    def _build_dependency_levels(self):
+        """
+        Group the edges from dependency nodes into levels that can each be
+        applied to all the samples in one array operation.
+
+        A dependency edge lowers the functionality of its dependent node
+        to that of its parent, and the edges are applied in edge order.
+        An edge starts a new level when its parent or its dependent node
+        has already been lowered within the current level, so applying
+        the levels in turn gives the same result as the edges one by one.
+
+        :return: A tuple of levels, each a (parents, dependents,
+            later_edges, later_edge_sources) tuple of arrays. The later
+            edges are the edges that leave a dependent node after the
+            dependency edge, and so carry its lowered functionality.
+        """
+        levels = []
+        level_edges = []
+        lowered = set()
+        for edge_id in np.flatnonzero(self.is_dependency[self.edge_parent]):
+            parent = self.edge_parent[edge_id]
+            dependent = self.edge_child[edge_id]
+            if parent in lowered or dependent in lowered:
+                levels.append(self._dependency_level(level_edges))
+                level_edges = []
+                lowered = set()
+            level_edges.append(edge_id)
+            lowered.add(dependent)
+        if level_edges:
+            levels.append(self._dependency_level(level_edges))
+        return tuple(levels)
+
+    def _dependency_level(self, edge_ids):
+        """
+        The arrays of one level of dependency edges.
+        """
+        edge_ids = np.array(edge_ids, dtype=int)
+        dependents = self.edge_child[edge_ids]
+        later_edges = []
+        later_edge_sources = []
+        for edge_id, dependent in zip(edge_ids, dependents):
+            out_edges = self.adjacency_edges[
+                self.adjacency_indptr[dependent]:
+                self.adjacency_indptr[dependent + 1]]
+            out_edges = out_edges[out_edges > edge_id]
+            later_edges.extend(out_edges)
+            later_edge_sources.extend([dependent] * len(out_edges))
+        return (self.edge_parent[edge_ids],
+                dependents,
+                np.array(later_edges, dtype=int),
+                np.array(later_edge_sources, dtype=int))
+
+    def propagate_dependencies(self, comp_sample_func):
+        """
+        Apply the functionality constraints of the dependency nodes to
+        every sample at once, and find the resulting edge capacities.
+        :param comp_sample_func: (samples x components) array of the
+            functionality of each component
+        :return: The (samples x components) functionality after the
+            dependency nodes are applied, and the (samples x edges) array
+            of the capacity of each edge, which is the functionality of
+            its parent component when the edge is reached.
+        """
+        functionality = np.array(comp_sample_func, dtype=np.float64,
+                                 ndmin=2)
+        edge_capacity = functionality[:, self.edge_parent]
+        for parents, dependents, later_edges, later_edge_sources in \
+                self.dependency_levels:
+            functionality[:, dependents] = np.minimum(
+                functionality[:, parents], functionality[:, dependents])
+            edge_capacity[:, later_edges] = \
+                functionality[:, later_edge_sources]
+        return functionality, edge_capacity
+
+    def _build_flow_plan(self):
+        """
+        Decide which max flow problems give the output of each output node.
+
+        The system output sums, for each commodity type, the max flow from
+        every supply node of that type scaled by its capacity fraction.
+        Supplies that add nothing are dropped from the plan: those with a
+        zero capacity fraction and those with no path to the output node.
+        Supplies with the same capacity fraction whose paths to the output
+        node share no edge are fed from one virtual super source. Their
+        joint max flow equals the sum of their separate max flows, so one
+        solve replaces several. Supplies that share edges with others are
+        solved on their own, since a joint flow would count a shared
+        bottleneck once rather than once per supply.
+
+        :return: For each output node, a tuple of (commodity type, sources)
+            pairs in supply node order. Each source is a (source,
+            supply positions) pair, where the source is a supply node id
+            or a tuple of the supply node ids fed by a super source.
+        """
+        adjacency = csr_matrix(
+            (np.ones(self.num_edges), (self.edge_parent, self.edge_child)),
+            shape=(self.num_components, self.num_components))
+        reverse_adjacency = adjacency.transpose().tocsr()
+
+        reachable_from_supply = [
+            set(breadth_first_order(adjacency, supply_index, directed=True,
+                                    return_predecessors=False))
+            for supply_index in self.supply_indices]
+
+        flow_plan = []
+        for output_index in self.output_indices:
+            feeds_output = np.zeros(self.num_components, dtype=bool)
+            feeds_output[breadth_first_order(
+                reverse_adjacency, output_index, directed=True,
+                return_predecessors=False)] = True
+
+            # each group holds supplies with pairwise disjoint paths
+            groups_by_commodity = OrderedDict()
+            for supply_pos, commodity_type in \
+                    enumerate(self.supply_commodity_types):
+                groups = groups_by_commodity.setdefault(commodity_type, [])
+                reachable = reachable_from_supply[supply_pos]
+                if self.supply_capacity_fraction[supply_pos] == 0.0 \
+                        or output_index not in reachable:
+                    continue
+                # the edges on any path from the supply to the output
+                path_edges = set(np.flatnonzero(
+                    np.in1d(self.edge_parent, list(reachable)) &
+                    feeds_output[self.edge_child]))
+                for group in groups:
+                    if self.supply_capacity_fraction[group[0][0]] == \
+                            self.supply_capacity_fraction[supply_pos] and \
+                            not any(path_edges & edges
+                                    for _, edges in group):
+                        group.append((supply_pos, path_edges))
+                        break
+                else:
+                    groups.append([(supply_pos, path_edges)])
+
+            output_plan = []
+            for commodity_type, groups in groups_by_commodity.items():
+                sources = []
+                for group in groups:
+                    supply_positions = tuple(pos for pos, _ in group)
+                    supply_ids = tuple(self.supply_ids[pos]
+                                       for pos in supply_positions)
+                    source = supply_ids[0] if len(supply_ids) == 1 \
+                        else supply_ids
+                    sources.append((source, supply_positions))
+                output_plan.append((commodity_type, tuple(sources)))
+            flow_plan.append(tuple(output_plan))
+
+        return tuple(flow_plan)
+
+    def _freeze(self):
+        """Make all the arrays read-only."""
+        for value in self.__dict__.values():
+            self._freeze_value(value)
+
+    @classmethod
+    def _freeze_value(cls, value):
+        if isinstance(value, np.ndarray):
+            value.flags.writeable = False
+        elif isinstance(value, dict):
+            for item in value.values():
+                cls._freeze_value(item)
+        elif isinstance(value, tuple):
+            for item in value:
+                cls._freeze_value(item)
+
+    def __setstate__(self, state):
+        # unpickled arrays are writeable, so freeze them again
+        self.__dict__.update(state)
+        self._freeze()
@@ -1,82 +1,203 @@
 import igraph
+import numpy as np
+from sifra.modelling.graph_backends import create_backend
 
 
 class ComponentGraph(object):
     """
     Border class abstraction of the component graph in an attempt to optimise the
     calculation of economic loss by using different Graph packages.
-    This implementation uses igraph
+    The graph of components is held in igraph, while the max flow problems
+    are solved by a backend from sifra.modelling.graph_backends.
     """
-    def __init__(self, components, comp_sample_func=None):
+    def __init__(self, components, comp_sample_func=None, backend='igraph'):
         """
         Construct a graph from the igraph package using the component dict.
         :param components: Dict of components that represent the infrastructure model
         :param comp_sample_func: Array of the functionality of each component (1.0 -> 0.0).
+        :param backend: Name of the graph backend that solves the max flow problems
         """
-        # create the directed graph
-        self.digraph = igraph.Graph(directed=True)
-
         # if we don't have a functionality array create a default one with 1.0's
         if comp_sample_func is None:
-            comp_sample_func = [1.0] * len(components)
+            comp_sample_func = np.ones(len(components))
 
         # TODO make this part of components?
         # create a map that will convert 'stack_1' -> 17 for editing the functionality (comp_sample_func)
         id_index_map = {comp_id: comp_index for comp_index, comp_id in list(enumerate(sorted(components.keys())))}
-
-        # iterate through the components to create the graph
-        # (using a list of sorted keys as we're trying to match the old code)
-        for comp_id in components.keys():
-            component = components[comp_id]
-            comp_index = id_index_map[comp_id]
-            # check that the component is not already in the graph
-            if len(self.digraph.vs) == 0 or comp_id not in self.digraph.vs['name']:
-                # add new component
-                self.digraph.add_vertex(name=comp_id)
-
-            # iterate through this components connected components
-            for dest_comp_id, destination_component in component.destination_components.items():
-                dest_index = id_index_map[dest_comp_id]
-                # check if the parent component is a dependent node type
+        self.id_index_map = id_index_map
+
+        # collect the vertices in the order they are first seen and the edges
+        # by the index of their vertices, in one pass over the components
+        vertex_names = []
+        vertex_index_map = {}
+        edge_parent = []
+        edge_child = []
+        dependency_edges = []
+        for comp_id, component in components.items():
+            if comp_id not in vertex_index_map:
+                vertex_index_map[comp_id] = len(vertex_names)
+                vertex_names.append(comp_id)
+            for dest_comp_id in component.destination_components.keys():
+                if dest_comp_id not in vertex_index_map:
+                    vertex_index_map[dest_comp_id] = len(vertex_names)
+                    vertex_names.append(dest_comp_id)
+                # edges from a dependency node combine the functionality of
+                # the parent with its dependent node
                 if component.node_type == 'dependency':
-                    # combine the dependent nodes functionality
-                    # TODO investigate the correctness of the logic of the following
-                    self.update_dependency(comp_sample_func, comp_index, dest_index)
-
-                # Is the child node in the graph
-                if len(self.digraph.vs) == 0 or dest_comp_id not in self.digraph.vs['name']:
-                    # add new child component
-                    self.digraph.add_vertex(name=dest_comp_id)
+                    dependency_edges.append(len(edge_parent))
+                edge_parent.append(id_index_map[comp_id])
+                edge_child.append(id_index_map[dest_comp_id])
+
+        self.edge_parent = np.array(edge_parent, dtype=int)
+        self.edge_child = np.array(edge_child, dtype=int)
+        self.dependency_edges = np.array(dependency_edges, dtype=int)
+        # the edges leaving each component, in edge id order
+        self._out_edges = np.argsort(self.edge_parent, kind='mergesort')
+        self._out_edges_indptr = np.concatenate(
+            ([0], np.cumsum(np.bincount(self.edge_parent,
+                                        minlength=len(id_index_map)))))
+
+        # the current capacity of each edge, by edge id, is kept in an array
+        # that is handed to the max flow solver as it is
+        self.edge_capacity = np.zeros(len(edge_parent), dtype=np.float64)
+        self.update_capacity(components, comp_sample_func)
+
+        # create the directed graph in bulk.
+        # The functionality of the parent vertice is the value of the edge capacity
+        self._digraph = igraph.Graph(directed=True)
+        self._digraph.add_vertices(vertex_names)
+        sorted_ids = sorted(id_index_map, key=id_index_map.get)
+        self._digraph.add_edges(
+            [(vertex_index_map[sorted_ids[parent]],
+              vertex_index_map[sorted_ids[child]])
+             for parent, child in zip(edge_parent, edge_child)])
+
+        self.set_backend(backend)
+        # minimal cut sets, keyed by the supplies, output and maximum order
+        self._cut_sets = {}
+
+    @property
+    def digraph(self):
+        """
+        The igraph graph of the components, with the current capacity of
+        each edge. The capacities are only copied into the graph when it is
+        read, not for every sample.
+        """
+        self._digraph.es['capacity'] = self.edge_capacity.tolist()
+        return self._digraph
 
-                # connect the parent and child vertices with an edge.
-                # The functionality of the parent vertice is the value of the edge capacity
-                self.digraph.add_edge(comp_id, dest_comp_id,
-                                      capacity=comp_sample_func[comp_index])
+    def set_backend(self, backend):
+        """
+        Use a different graph backend for the max flow problems.
+        :param backend: Name of the graph backend
+        """
+        self.backend_name = backend
+        self.flow_backend = create_backend(backend, len(self.id_index_map),
+                                           self.edge_parent, self.edge_child)
+        # backends for the graph with a virtual source vertex, keyed by the
+        # supply components the vertex feeds
+        self._super_source_backends = {}
 
     def update_capacity(self, components, comp_sample_func):
         """Update the graph to change the edge's capacity value to
-        reflect the new functionality of the parent vertice."""
-        # create a map that will convert 'stack_1' -> 17 for editing the functionality (comp_sample_func)
-        id_index_map = {v: k for k, v in list(enumerate(sorted(components.keys())))}
-
-        # iterate through the infrastructure components
-        # (using a list of sorted keys as we're trying to match the old code)
-        for comp_id in components.keys():
-            component = components[comp_id]
-            comp_index = id_index_map[comp_id]
-            # iterate through the destination components
-            for dest_comp_id in component.destination_components.keys():
-                dest_index = id_index_map[dest_comp_id]
-
-                if component.node_type == 'dependency':
-                    # combine the dependent vertices functionality with the parents
-                    # TODO investigate the correctness of the logic of the following
-                    self.update_dependency(comp_sample_func, comp_index, dest_index)
-
-                # Determine the edge id from the id's of the parent and child node
-                edge_id = self.digraph.get_eid(comp_id, dest_comp_id)
-                # update the edge dict with the functionality of the parent vertice
-                self.digraph.es[edge_id]['capacity'] = comp_sample_func[comp_index]
+        reflect the new functionality of the parent vertice.
+        The edges are updated as if in edge order: an edge from a
+        dependency node first lowers the functionality of its dependent
+        node, which then sets the capacity of the dependent node's edges
+        that come after it."""
+        # every edge takes the functionality of its parent vertice
+        self.edge_capacity[:] = np.asarray(comp_sample_func)[self.edge_parent]
+
+        # combine the dependent vertices functionality with the parents
+        # TODO investigate the correctness of the logic of the following
+        for edge_id in self.dependency_edges:
+            dependent = self.edge_child[edge_id]
+            self.update_dependency(comp_sample_func,
+                                   self.edge_parent[edge_id], dependent)
+            out_edges = self._out_edges[
+                self._out_edges_indptr[dependent]:
+                self._out_edges_indptr[dependent + 1]]
+            self.edge_capacity[out_edges[out_edges > edge_id]] = \
+                comp_sample_func[dependent]
+
+    def set_capacity(self, edge_capacity):
+        """Set the capacity of every edge, in edge id order."""
+        self.edge_capacity[:] = edge_capacity
+
+    def minimal_cut_sets(self, supply_comp_ids, output_comp_id, max_order=2):
+        """
+        Find the minimal cut sets of up to max_order components between the
+        supply components and the output component: the smallest sets of
+        components which, when none of them pass any flow, disconnect
+        every supply from the output. The sets only depend on the
+        structure of the graph, so they are found once and cached.
+
+        Every cut set must contain a component of each path from a supply
+        to the output, so the search takes one such path and, for each of
+        its components, removes it and searches the rest of the graph.
+
+        :param supply_comp_ids: A supply component id, or a tuple of them
+        :param output_comp_id: The output component id
+        :param max_order: The largest number of components in a cut set
+        :return: Tuple of the cut sets, each a sorted tuple of component
+                 indices
+        """
+        if not isinstance(supply_comp_ids, tuple):
+            supply_comp_ids = (supply_comp_ids,)
+        key = (supply_comp_ids, output_comp_id, max_order)
+        if key in self._cut_sets:
+            return self._cut_sets[key]
+
+        children = [[] for _ in range(len(self.id_index_map))]
+        for parent, child in zip(self.edge_parent, self.edge_child):
+            children[parent].append(child)
+        sources = [self.id_index_map[comp_id] for comp_id in supply_comp_ids]
+        sink = self.id_index_map[output_comp_id]
+
+        def find_path(removed):
+            # breadth first search for a path that avoids the removed
+            # components, returning its components other than the output
+            predecessor = {source: None for source in sources
+                           if source not in removed}
+            frontier = list(predecessor)
+            while frontier and sink not in predecessor:
+                next_frontier = []
+                for vertex in frontier:
+                    for child in children[vertex]:
+                        if child not in predecessor and child not in removed:
+                            predecessor[child] = vertex
+                            next_frontier.append(child)
+                frontier = next_frontier
+            if sink not in predecessor:
+                return None
+            path = []
+            vertex = predecessor[sink]
+            while vertex is not None:
+                path.append(vertex)
+                vertex = predecessor[vertex]
+            return path
+
+        cut_sets = set()
+        searched = set()
+
+        def search(removed):
+            if removed in searched:
+                return
+            searched.add(removed)
+            path = find_path(removed)
+            if path is None:
+                cut_sets.add(removed)
+            elif len(removed) < max_order:
+                for vertex in path:
+                    search(removed | frozenset([vertex]))
+
+        search(frozenset())
+        # drop the sets that contain a smaller cut set
+        minimal_cut_sets = [cut_set for cut_set in cut_sets
+                            if not any(other < cut_set for other in cut_sets)]
+        self._cut_sets[key] = tuple(sorted(
+            tuple(sorted(cut_set)) for cut_set in minimal_cut_sets))
+        return self._cut_sets[key]
 
     def update_dependency(self,comp_sample_func, parent, dependent):
         min_capacity = min(comp_sample_func[parent], comp_sample_func[dependent])
@@ -100,11 +221,31 @@ class ComponentGraph(object):
 
 
     def maxflow(self, supply_comp_id, output_comp_id):
-        """Computes the maximum flow between two nodes."""
-        # determine the vertice id's for the two components
-        sup_v = self.digraph.vs.find(supply_comp_id)
-        out_v = self.digraph.vs.find(output_comp_id)
+        """Computes the maximum flow between two nodes.
+        A tuple of supply components gives their joint maximum flow."""
+        if isinstance(supply_comp_id, tuple):
+            return self.joint_maxflow(supply_comp_id, output_comp_id)
         # calculate the maximum flow value between the two id's
-        return self.digraph.maxflow_value(sup_v.index,
-                                          out_v.index,
-                                          self.digraph.es['capacity'])
+        return self.flow_backend.maxflow(self.id_index_map[supply_comp_id],
+                                         self.id_index_map[output_comp_id],
+                                         self.edge_capacity)
+
+    def joint_maxflow(self, supply_comp_ids, output_comp_id):
+        """Computes the maximum flow from a virtual source vertex, joined
+        to each of the supply components by an edge of unbounded capacity,
+        to the output component. The virtual vertex is only added to the
+        graph given to the backend, so the graph of components is unchanged."""
+        source_index = len(self.id_index_map)
+        if supply_comp_ids not in self._super_source_backends:
+            # the virtual edges are added after the component edges
+            self._super_source_backends[supply_comp_ids] = create_backend(
+                self.backend_name, source_index + 1,
+                np.append(self.edge_parent,
+                          [source_index] * len(supply_comp_ids)),
+                np.append(self.edge_child,
+                          [self.id_index_map[comp_id]
+                           for comp_id in supply_comp_ids]))
+        capacity = np.append(self.edge_capacity,
+                             [np.inf] * len(supply_comp_ids))
+        return self._super_source_backends[supply_comp_ids].maxflow(
+            source_index, self.id_index_map[output_comp_id], capacity)
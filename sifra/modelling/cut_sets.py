@@ -0,0 +1,111 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+
+
+class CutSetScreen(object):
+    """
+    Finds the samples whose system output is zero from the minimal cut
+    sets of the component graph, without solving any max flow problem.
+
+    A component whose edges all have zero capacity passes no flow. When
+    every component of a cut set between a supply and an output node is
+    in that state, the max flow between them is zero. The output of a
+    node is zero when, for some commodity type, all of its supplies are
+    cut off in this way. The cut sets are found once for the model, and
+    the screen for a block of samples is a pair of matrix products.
+
+    The cut sets are limited to max_order components, so the screen
+    finds most, but not necessarily all, of the samples with no output.
+    The samples it does not find are left to the max flow calculation.
+    """
+
+    def __init__(self, compiled, component_graph, max_order=2):
+        """
+        :param compiled: The CompiledInfrastructure of the model
+        :param component_graph: The ComponentGraph of the model
+        :param max_order: The largest number of components in a cut set
+        """
+        self.compiled = compiled
+        self.max_order = max_order
+        self.num_screened = 0
+        self.num_samples = 0
+
+        # the edges leaving each component: (edges x components)
+        self._edge_parent_incidence = csr_matrix(
+            (np.ones(compiled.num_edges), (np.arange(compiled.num_edges),
+                                           compiled.edge_parent)),
+            shape=(compiled.num_edges, compiled.num_components))
+
+        # one row of the cut set matrix per cut set, and the cut sets of
+        # each flow problem as a slice of the rows
+        cut_set_rows = []
+        self._output_problems = []
+        for output_index, output_plan in enumerate(compiled.flow_plan):
+            commodity_problems = []
+            for _, sources in output_plan:
+                source_problems = []
+                for source, _ in sources:
+                    cut_sets = component_graph.minimal_cut_sets(
+                        source, compiled.output_ids[output_index], max_order)
+                    source_problems.append(
+                        slice(len(cut_set_rows),
+                              len(cut_set_rows) + len(cut_sets)))
+                    cut_set_rows.extend(cut_sets)
+                commodity_problems.append(source_problems)
+            self._output_problems.append(commodity_problems)
+
+        self.num_cut_sets = len(cut_set_rows)
+        self._cut_set_size = np.array(
+            [len(cut_set) for cut_set in cut_set_rows], dtype=int)
+        # the components of each cut set: (cut sets x components)
+        self._cut_set_matrix = csr_matrix(
+            (np.ones(self._cut_set_size.sum()),
+             ([row for row, cut_set in enumerate(cut_set_rows)
+               for _ in cut_set],
+              [comp_index for cut_set in cut_set_rows
+               for comp_index in cut_set])),
+            shape=(len(cut_set_rows), compiled.num_components))
+
+    def zero_output(self, edge_capacity):
+        """
+        :param edge_capacity: (samples x edges) array of edge capacities,
+            as given by propagate_dependencies
+        :return: (samples x output nodes) boolean array, True where the
+            output is known to be zero
+        """
+        num_samples = edge_capacity.shape[0]
+        # the number of edges with capacity leaving each component
+        flowing_edges = self._edge_parent_incidence.T.dot(
+            (edge_capacity > 0).T.astype(np.float64)).T
+        blocked = (flowing_edges == 0).astype(np.float64)
+        # a cut set fails when all of its components are blocked
+        cut_set_failed = \
+            self._cut_set_matrix.dot(blocked.T).T == self._cut_set_size
+
+        zero_output = np.zeros(
+            (num_samples, len(self._output_problems)), dtype=bool)
+        for output_index, commodity_problems in \
+                enumerate(self._output_problems):
+            for source_problems in commodity_problems:
+                commodity_cut_off = np.ones(num_samples, dtype=bool)
+                for problem in source_problems:
+                    commodity_cut_off &= \
+                        np.any(cut_set_failed[:, problem], axis=1)
+                zero_output[:, output_index] |= commodity_cut_off
+        return zero_output
+
+    def screen(self, edge_capacity):
+        """
+        :param edge_capacity: (samples x edges) array of edge capacities
+        :return: Boolean array, True for the samples with no output at
+                 any output node
+        """
+        no_output = np.all(self.zero_output(edge_capacity), axis=1)
+        self.num_samples += len(no_output)
+        self.num_screened += int(np.sum(no_output))
+        return no_output
+
+    def __str__(self):
+        return "{} cut sets of up to {} components; {} of {} samples " \
+               "had no output".format(self.num_cut_sets, self.max_order,
+                                      self.num_screened, self.num_samples)
@@ -0,0 +1,218 @@
+import time
+from abc import ABCMeta, abstractmethod
+from collections import OrderedDict
+import numpy as np
+import igraph
+import networkx as nx
+from sifra.logger import rootLogger
+
+
+class MaxFlowBackend(object):
+    """
+    The interface to a graph library that solves the max flow problems
+    of the component graph.
+
+    A backend is built once for the structure of the graph. Vertices are
+    the integers 0 .. num_vertices - 1 and the edges keep the order in
+    which they are given. The edge capacities change with every sample,
+    so they are passed to each solve as an array in edge order.
+    """
+    __metaclass__ = ABCMeta
+    name = None
+
+    def __init__(self, num_vertices, edge_parent, edge_child):
+        """
+        :param num_vertices: Number of vertices in the graph
+        :param edge_parent: Index of the start vertex of each edge
+        :param edge_child: Index of the end vertex of each edge
+        """
+        self.num_vertices = num_vertices
+        self.edge_parent = np.asarray(edge_parent, dtype=int)
+        self.edge_child = np.asarray(edge_child, dtype=int)
+
+    @classmethod
+    def is_available(cls, num_vertices):
+        """
+        Whether the backend can be used for a graph of the given size.
+        """
+        return True
+
+    @abstractmethod
+    def maxflow(self, source, sink, capacity):
+        """
+        Computes the maximum flow between two vertices.
+        :param source: Index of the source vertex
+        :param sink: Index of the sink vertex
+        :param capacity: Array of the capacity of each edge
+        :return: The value of the maximum flow
+        """
+
+
+class IGraphBackend(MaxFlowBackend):
+    """Max flow with the push-relabel solver of igraph."""
+    name = 'igraph'
+
+    def __init__(self, num_vertices, edge_parent, edge_child):
+        super(IGraphBackend, self).__init__(num_vertices, edge_parent,
+                                            edge_child)
+        self.graph = igraph.Graph(
+            n=num_vertices,
+            edges=list(zip(self.edge_parent.tolist(),
+                           self.edge_child.tolist())),
+            directed=True)
+
+    def maxflow(self, source, sink, capacity):
+        return self.graph.maxflow_value(source, sink,
+                                        np.asarray(capacity).tolist())
+
+
+class NetworkXBackend(MaxFlowBackend):
+    """Max flow with the preflow-push solver of networkx."""
+    name = 'networkx'
+
+    def __init__(self, num_vertices, edge_parent, edge_child):
+        super(NetworkXBackend, self).__init__(num_vertices, edge_parent,
+                                              edge_child)
+        self.graph = nx.DiGraph()
+        self.graph.add_nodes_from(range(num_vertices))
+        edges = list(zip(self.edge_parent.tolist(),
+                         self.edge_child.tolist()))
+        self.graph.add_edges_from(edges)
+        # keep the attribute dict of each edge, so the capacities can be
+        # set without looking the edges up again
+        self._edge_data = [self.graph.adj[parent][child]
+                           for parent, child in edges]
+
+    def maxflow(self, source, sink, capacity):
+        for edge_data, edge_capacity in zip(self._edge_data,
+                                            np.asarray(capacity).tolist()):
+            edge_data['capacity'] = edge_capacity
+        return nx.maximum_flow_value(self.graph, source, sink)
+
+
+class NumpyBackend(MaxFlowBackend):
+    """
+    Max flow with a breadth first augmenting path (Edmonds-Karp) search
+    over a dense residual capacity matrix. It needs no graph library and
+    has little overhead, which suits the small component graphs, but the
+    matrix grows with the square of the number of vertices.
+    """
+    name = 'numpy'
+    MAX_VERTICES = 500
+
+    @classmethod
+    def is_available(cls, num_vertices):
+        return num_vertices <= cls.MAX_VERTICES
+
+    def maxflow(self, source, sink, capacity):
+        residual = np.zeros((self.num_vertices, self.num_vertices))
+        np.add.at(residual, (self.edge_parent, self.edge_child), capacity)
+
+        total_flow = 0.0
+        while True:
+            # breadth first search for the shortest augmenting path
+            predecessor = np.full(self.num_vertices, -1, dtype=int)
+            predecessor[source] = source
+            frontier = np.array([source])
+            while frontier.size and predecessor[sink] < 0:
+                rows, cols = np.nonzero(
+                    (residual[frontier] > 0) & (predecessor < 0))
+                # each new vertex is reached from its first frontier vertex
+                cols, first = np.unique(cols, return_index=True)
+                predecessor[cols] = frontier[rows[first]]
+                frontier = cols
+            if predecessor[sink] < 0:
+                return total_flow
+
+            path = [sink]
+            while path[-1] != source:
+                path.append(predecessor[path[-1]])
+            path_child = np.array(path[:-1])
+            path_parent = np.array(path[1:])
+            bottleneck = residual[path_parent, path_child].min()
+            if np.isinf(bottleneck):
+                return np.inf
+            residual[path_parent, path_child] -= bottleneck
+            residual[path_child, path_parent] += bottleneck
+            total_flow += bottleneck
+
+
+GRAPH_BACKENDS = OrderedDict(
+    (backend.name, backend) for backend in
+    (IGraphBackend, NetworkXBackend, NumpyBackend))
+
+
+def available_backends(num_vertices):
+    """
+    :return: The names of the backends that can be used for a graph of
+             the given size
+    """
+    return [name for name, backend in GRAPH_BACKENDS.items()
+            if backend.is_available(num_vertices)]
+
+
+def create_backend(name, num_vertices, edge_parent, edge_child):
+    """
+    Build the named max flow backend for a graph.
+    :param name: One of the names in GRAPH_BACKENDS
+    """
+    if name not in GRAPH_BACKENDS:
+        raise ValueError("Unknown graph backend '{}'. Accepted backends "
+                         "are: {}".format(name, ", ".join(GRAPH_BACKENDS)))
+    if not GRAPH_BACKENDS[name].is_available(num_vertices):
+        raise ValueError("The graph backend '{}' is not available for "
+                         "this model".format(name))
+    return GRAPH_BACKENDS[name](num_vertices, edge_parent, edge_child)
+
+
+def benchmark_backends(num_vertices, edge_parent, edge_child, flow_pairs,
+                       num_trials=10, seed=0):
+    """
+    Time the available backends on max flow problems of the graph, with
+    random edge capacities. Backends whose flows do not agree with igraph,
+    the reference backend, are left out.
+    :param flow_pairs: The (source, sink) vertex pairs to solve
+    :param num_trials: Number of random capacity vectors to solve for
+    :param seed: Seed of the random capacities
+    :return: OrderedDict of the mean time per solve of each backend
+    """
+    random_state = np.random.RandomState(seed)
+    # mostly undamaged edges, as in the simulated samples
+    capacities = random_state.choice([0.0, 0.5, 1.0], p=[0.1, 0.2, 0.7],
+                                     size=(num_trials, len(edge_parent)))
+    num_solves = float(num_trials * max(len(flow_pairs), 1))
+
+    timings = OrderedDict()
+    reference_flows = None
+    for name in available_backends(num_vertices):
+        backend = create_backend(name, num_vertices, edge_parent, edge_child)
+        start_time = time.time()
+        flows = np.array([[backend.maxflow(source, sink, capacity)
+                           for source, sink in flow_pairs]
+                          for capacity in capacities])
+        elapsed = time.time() - start_time
+
+        if reference_flows is None:
+            reference_flows = flows
+        elif not np.allclose(flows, reference_flows, atol=1e-6):
+            rootLogger.warning("Graph backend {} disagrees with {} and "
+                               "is not used".format(name, IGraphBackend.name))
+            continue
+        timings[name] = elapsed / num_solves
+    return timings
+
+
+def select_backend(num_vertices, edge_parent, edge_child, flow_pairs):
+    """
+    Pick the fastest backend for a graph with a micro-benchmark.
+    :return: The name of the selected backend
+    """
+    timings = benchmark_backends(num_vertices, edge_parent, edge_child,
+                                 flow_pairs)
+    selected = min(timings, key=timings.get)
+    rootLogger.info("Graph backend timings per max flow: {}; "
+                    "selected {}".format(
+                        ", ".join("{} {:.2e}s".format(name, seconds)
+                                  for name, seconds in timings.items()),
+                        selected))
+    return selected
@@ -12,18 +12,29 @@ class Hazard(object):
         self.hazard_scenario_name = hazard_scenario_name
         self.scenario_hazard_data = scenario_hazard_data
         self.round_off = 2
+        self._location_index = None
 
     def get_hazard_intensity_at_location(self, longitude, latitude):
-
-        for comp in self.scenario_hazard_data:   
-
-            if round(float(comp["longitude"]), self.round_off) \
-                    == round(float(longitude), self.round_off):
-                if round(float(comp["latitude"]), self.round_off) \
-                        == round(float(latitude), self.round_off):
-                    return comp["hazard_intensity"]
-
-        raise Exception("Invalid Values for Longitude or Latitude")
+        """
+        Look up the hazard intensity at a location. The locations are
+        matched after rounding to `round_off` decimal places.
+        """
+        # build the location index on first use so repeated look ups
+        # for a hazard do not scan all the locations each time
+        if self._location_index is None:
+            self._location_index = {}
+            for comp in self.scenario_hazard_data:
+                location = (round(float(comp["longitude"]), self.round_off),
+                            round(float(comp["latitude"]), self.round_off))
+                self._location_index.setdefault(
+                    location, comp["hazard_intensity"])
+
+        location = (round(float(longitude), self.round_off),
+                    round(float(latitude), self.round_off))
+        if location not in self._location_index:
+            raise Exception("Invalid Values for Longitude or Latitude")
+
+        return self._location_index[location]
 
     def get_seed(self):
         seed = 0
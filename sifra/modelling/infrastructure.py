@@ -4,8 +4,15 @@ np.set_printoptions(threshold='nan')
 
 from sifra.modelling.structural import Element
 from sifra.modelling.component_graph import ComponentGraph
+from sifra.modelling.graph_backends import select_backend
+from sifra.modelling.series_parallel import SeriesParallelFlowEngine
+from sifra.modelling.cut_sets import CutSetScreen
+from sifra.modelling.reachability import ReachabilityEngine
+from sifra.modelling.compiled_infrastructure import CompiledInfrastructure
+from sifra.modelling.output_cache import SystemOutputCache
 from sifra.modelling.structural import Base
 from sifra.modelling.iodict import IODict
+from sifra.modelling.responsemodels import evaluate_response_functions
 
 
 class InfrastructureFactory(object):
@@ -22,6 +29,34 @@ class InfrastructureFactory(object):
             return PotableWaterTreatmentPlant(**config)
 
 
+def _column_mean(values, weights=None):
+    """
+    Mean of each column of a (samples x n) array, optionally weighting
+    the samples.
+    """
+    if weights is None:
+        return np.mean(values, axis=0)
+    return np.dot(weights, values) / np.sum(weights, dtype=np.float64)
+
+
+def _column_mean_std(values, weights=None):
+    """
+    Mean and (population) standard deviation of each column of a
+    (samples x n) array, optionally weighting the samples.
+    """
+    if weights is None:
+        # make the samples of each column contiguous, so the results are
+        # the same as calculating them one column at a time
+        values_by_column = np.ascontiguousarray(values.T)
+        return np.mean(values_by_column, axis=1), \
+            np.std(values_by_column, axis=1)
+
+    total_weight = np.sum(weights, dtype=np.float64)
+    mean = np.dot(weights, values) / total_weight
+    variance = np.dot(weights, (values - mean) ** 2) / total_weight
+    return mean, np.sqrt(variance)
+
+
 class Infrastructure(Base):
     """
     The top level representation of a system that can respond to a
@@ -37,6 +72,16 @@ class Infrastructure(Base):
 
     # supply_total = None
     _component_graph = None
+    _compiled = None
+    _output_cache = None
+    _graph_backend_setting = None
+    _flow_engine = None
+    _cut_set_screen = None
+    _reachability_engine = None
+    # the damage states and output of the last hazard level calculated
+    _previous_level = None
+    # number of samples whose dependency nodes are applied at once
+    SAMPLE_BLOCK_SIZE = 1000
     if_nominal_output = None
     system_class = None
 
@@ -54,6 +99,139 @@ class Infrastructure(Base):
 
         self._component_graph = ComponentGraph(self.components)
 
+    def compile(self):
+        """
+        Derive the array based representation of the model that the
+        simulation engines share. It is built on first use and reused
+        afterwards, so changes to the components after that are not seen.
+        :return: The CompiledInfrastructure for this model
+        """
+        if self._compiled is None:
+            self._compiled = CompiledInfrastructure(self)
+        return self._compiled
+
+    def get_output_cache(self, max_size):
+        """
+        The cache of system outputs by component functionality vector.
+        It is kept on the model so that it persists across hazard levels.
+        :param max_size: Maximum number of entries in the cache
+        :return: The SystemOutputCache for this model
+        """
+        if self._output_cache is None \
+                or self._output_cache.max_size != max_size:
+            self._output_cache = SystemOutputCache(max_size)
+        return self._output_cache
+
+    def get_flow_engine(self):
+        """
+        The engine that calculates the output of many samples at once from
+        the series-parallel reduction of the flow problems.
+        :return: The SeriesParallelFlowEngine, or None if none of the flow
+            problems of the model reduce to closed form, in which case
+            solving the samples one at a time is faster.
+        """
+        if self._flow_engine is None:
+            self._flow_engine = SeriesParallelFlowEngine(self.compile())
+        if not self._flow_engine.num_closed_form:
+            return None
+        self._flow_engine.backend_name = self._component_graph.backend_name
+        return self._flow_engine
+
+    def get_cut_set_screen(self, max_order):
+        """
+        The screen that finds the samples with no output from the minimal
+        cut sets of the component graph.
+        :param max_order: The largest number of components in a cut set
+        :return: The CutSetScreen for this model
+        """
+        if self._cut_set_screen is None \
+                or self._cut_set_screen.max_order != max_order:
+            self._cut_set_screen = CutSetScreen(
+                self.compile(), self._component_graph, max_order)
+        return self._cut_set_screen
+
+    def get_reachability_engine(self):
+        """
+        The engine that decides the output of many samples at once from
+        the reachability of the output nodes.
+        :return: The ReachabilityEngine for this model
+        """
+        if self._reachability_engine is None:
+            self._reachability_engine = ReachabilityEngine(self.compile())
+        return self._reachability_engine
+
+    def set_graph_backend(self, backend_setting):
+        """
+        Choose the graph backend that solves the max flow problems.
+        :param backend_setting: Name of a backend, or 'auto' to pick the
+            fastest for this model with a micro-benchmark. The benchmark
+            is only run once for a setting.
+        """
+        if backend_setting == self._graph_backend_setting:
+            return
+        backend = backend_setting
+        if backend_setting == 'auto':
+            compiled = self.compile()
+            flow_pairs = [(supply_index, output_index)
+                          for supply_index in compiled.supply_indices
+                          for output_index in compiled.output_indices]
+            backend = select_backend(compiled.num_components,
+                                     compiled.edge_parent,
+                                     compiled.edge_child,
+                                     flow_pairs)
+        if backend != self._component_graph.backend_name:
+            self._component_graph.set_backend(backend)
+            # drop the outputs calculated with the previous backend
+            if self._output_cache is not None:
+                self._output_cache.clear()
+            self._previous_level = None
+        self._graph_backend_setting = backend_setting
+
+    def get_exceedance_probabilities(self, hazard):
+        """
+        Calculate the probability of exceeding each damage state for all
+        of the components, using one batched evaluation of the response
+        functions.
+        :param hazard: The hazard that the infrastructure is exposed to
+        :return: A (components x damage states) array in sorted component
+                 order. The default state (DS0 None) is dropped, and damage
+                 states that a component does not have are set to -inf, so
+                 they can never be exceeded.
+        """
+        compiled = self.compile()
+
+        response_functions = []
+        hazard_intensities = []
+        comp_indices = []
+        ds_indices = []
+        for comp_index, comp_id in enumerate(compiled.component_ids):
+            component = self.components[comp_id]
+            # find the hazard intensity the component is exposed to
+            longitude, latitude = component.get_location()
+            hazard_intensity = hazard.get_hazard_intensity_at_location(
+                longitude, latitude)
+
+            for damage_state_index, damage_state in \
+                    component.damage_states.items():
+                # the default state (DS0 None) is always exceeded
+                if damage_state_index == 0:
+                    continue
+                response_functions.append(damage_state.response_function)
+                hazard_intensities.append(hazard_intensity)
+                comp_indices.append(comp_index)
+                ds_indices.append(damage_state_index - 1)
+
+        component_pe_ds = np.full(
+            (compiled.num_components, compiled.ds_loss.shape[1] - 1),
+            -np.inf, dtype=np.float64)
+        component_pe_ds[np.array(comp_indices, dtype=int),
+                        np.array(ds_indices, dtype=int)] = \
+            evaluate_response_functions(response_functions,
+                                        hazard_intensities)
+        component_pe_ds[np.isnan(component_pe_ds)] = -np.inf
+
+        return component_pe_ds
+
     def calc_output_loss(self, scenario, component_damage_state_ind):
         """
         Calculate the results to the infrastructure given the damage state
@@ -63,19 +241,27 @@ class Infrastructure(Base):
                                             damage state samples
         :return: 5 lists of calculations
         """
+        num_samples = component_damage_state_ind.shape[0]
+        compiled = self.compile()
+        self.set_graph_backend(scenario.graph_backend)
+
+        # Look up the loss and functionality of every component in every
+        # sample at once: each row of the damage state samples indexes
+        # into the (components x damage states) tables.
+        comp_indices = np.arange(compiled.num_components)
         # Component loss caused by the damage
-        if_level_loss = np.zeros((scenario.num_samples, len(self.components)),
-                                 dtype=np.float64)
-        # Infrastructure loss: sum of component loss
-        if_level_economic_loss = np.zeros(scenario.num_samples,
-                                          dtype=np.float64)
+        if_level_loss = \
+            compiled.ds_loss[comp_indices, component_damage_state_ind]
         # Component functionality
         if_level_functionality = \
-            np.zeros((scenario.num_samples, len(self.components)),
-                     dtype=np.float64)
+            compiled.ds_functionality[comp_indices,
+                                      component_damage_state_ind]
+        # Infrastructure loss: sum of component loss
+        if_level_economic_loss = np.sum(if_level_loss, axis=1)
+
         # output for the level of damage
         if_level_output = \
-            np.zeros((scenario.num_samples, len(self.output_nodes)),
+            np.zeros((num_samples, len(self.output_nodes)),
                      dtype=np.float64)
 
         # ********************
@@ -85,38 +271,83 @@ class Infrastructure(Base):
         #     np.zeros((scenario.num_samples, scenario.num_time_steps),
         #              dtype=np.float64)
 
-        # iterate through the samples
-        for sample_index in range(scenario.num_samples):
-            # initialise the function and loss arrays for the sample
-            # component_function_at_time = []
-            comp_sample_loss = np.zeros(len(self.components))
-            comp_sample_func = np.zeros(len(self.components))
-            # Extract the array of damage states for this sample
-
-            component_ds = component_damage_state_ind[sample_index, :]
-            # iterate through the components
-            count = 0
-            for component_index, comp_key in \
-                    enumerate(sorted(self.components.keys())):
-                component = self.components[comp_key]
-                # get the damage state for the component
-                damage_state = \
-                    component.get_damage_state(component_ds[component_index])
-                # use the damage state attributes to calculate the loss and
-                # functionality for the component sample
-                loss = damage_state.damage_ratio * component.cost_fraction
-                comp_sample_loss[component_index] = loss
-                comp_sample_func[component_index] = damage_state.functionality
-
-            # save this sample's component loss and functionality
-            if_level_loss[sample_index, :] = comp_sample_loss
-            if_level_functionality[sample_index, :] = comp_sample_func
-            # the infrastructure's economic loss for this sample is the sum
-            # of all component losses
-            if_level_economic_loss[sample_index] = np.sum(comp_sample_loss)
-            # estimate the output for this sample's component functionality
-            if_level_output[sample_index, :] \
-                = self.compute_output_given_ds(comp_sample_func)
+        # estimate the output for each sample's component functionality.
+        # The dependency nodes are applied to a block of samples at a time,
+        # which gives the edge capacities of the flow problems.
+        # Where the flow problems reduce to closed form, the output of the
+        # whole block is calculated at once. Otherwise samples often share
+        # the same functionality vector, so the outputs are memoised, and
+        # the flow is only solved for unseen vectors.
+        flow_engine = self.get_flow_engine() \
+            if scenario.flow_reduction else None
+        # Before that, the samples whose output is settled by which supply
+        # nodes can reach the output nodes are decided with bit-parallel
+        # reachability, and optionally the samples whose output is zero
+        # are found from the minimal cut sets. Neither need any flow
+        # calculation.
+        reachability_engine = self.get_reachability_engine() \
+            if scenario.reachability_fast_path else None
+        cut_set_screen = \
+            self.get_cut_set_screen(scenario.cut_set_max_order) \
+            if scenario.cut_set_screening else None
+        output_cache = self.get_output_cache(scenario.flow_cache_size)
+
+        # With common random numbers, most samples have the same damage
+        # states as at the previous hazard level, and so the same output.
+        # Only the samples whose damage states changed are calculated.
+        samples_to_solve = np.arange(num_samples)
+        if scenario.common_random_numbers \
+                and self._previous_level is not None \
+                and self._previous_level[0].shape == \
+                component_damage_state_ind.shape:
+            previous_damage_state_ind, previous_output = self._previous_level
+            unchanged = np.all(
+                component_damage_state_ind == previous_damage_state_ind,
+                axis=1)
+            if_level_output[unchanged] = previous_output[unchanged]
+            samples_to_solve = np.flatnonzero(~unchanged)
+
+        for block_start in range(0, len(samples_to_solve),
+                                 self.SAMPLE_BLOCK_SIZE):
+            block_samples = samples_to_solve[
+                block_start:block_start + self.SAMPLE_BLOCK_SIZE]
+            block_functionality = if_level_functionality[block_samples]
+            _, block_edge_capacity = \
+                compiled.propagate_dependencies(block_functionality)
+            to_solve = np.ones(len(block_samples), dtype=bool)
+            if cut_set_screen is not None:
+                # the output of the screened samples stays at zero
+                to_solve &= ~cut_set_screen.screen(block_edge_capacity)
+            if reachability_engine is not None:
+                decided, decided_output = \
+                    reachability_engine.system_output(block_edge_capacity)
+                if_level_output[block_samples[decided]] = \
+                    decided_output[decided]
+                to_solve &= ~decided
+            if not np.all(to_solve):
+                block_samples = block_samples[to_solve]
+                block_functionality = block_functionality[to_solve]
+                block_edge_capacity = block_edge_capacity[to_solve]
+                if not len(block_samples):
+                    continue
+            if flow_engine is not None:
+                if_level_output[block_samples] = \
+                    flow_engine.system_output(block_edge_capacity)
+                continue
+            for block_index, comp_sample_func in \
+                    enumerate(block_functionality):
+                cache_key = output_cache.make_key(comp_sample_func)
+                sample_output = output_cache.get(cache_key)
+                if sample_output is None:
+                    sample_output = self.compute_output_given_capacity(
+                        block_edge_capacity[block_index])
+                    output_cache.put(cache_key, sample_output)
+                if_level_output[block_samples[block_index], :] = \
+                    sample_output
+
+        if scenario.common_random_numbers:
+            self._previous_level = (np.array(component_damage_state_ind),
+                                    if_level_output.copy())
 
         return if_level_loss, \
                if_level_functionality, \
@@ -151,36 +382,54 @@ class Infrastructure(Base):
         else:
             self._component_graph.update_capacity(
                 self.components, comp_level_func)
+        return self._compute_system_output()
 
+    def compute_output_given_capacity(self, edge_capacity):
+        """
+        Calculate the output for the capacities of the edges of the
+        component graph, as given by propagate_dependencies of the
+        compiled model.
+        :param edge_capacity: An array of the capacity of each edge
+        :return: An array of the output level for each output node.
+        """
+        self._component_graph.set_capacity(edge_capacity)
+        return self._compute_system_output()
+
+    def _compute_system_output(self):
+        """
+        Solve the max flow problems on the component graph with its
+        current edge capacities.
+        :return: An array of the output level for each output node.
+        """
         # calculate the capacity
         # system_flows_sample = []
-        system_outflows_sample = np.zeros(len(self.output_nodes))
-        for output_index, (output_comp_id, output_comp) in \
-                enumerate(self.output_nodes.items()):
+        compiled = self.compile()
+        system_outflows_sample = np.zeros(len(compiled.output_ids))
+        for output_index, output_comp_id in enumerate(compiled.output_ids):
             # track the outputs by source type (e.g. water or coal)
             total_supply_flow_by_source = {}
-            for supply_index, (supply_comp_id, supply_comp) in \
-                    enumerate(self.supply_nodes.items()):
-                if_flow_fraction = self._component_graph.maxflow(
-                    supply_comp_id, output_comp_id
-                    )
-                if_sample_flow = if_flow_fraction * \
-                                 supply_comp['capacity_fraction']
-
-                if supply_comp['commodity_type'] not in \
-                        total_supply_flow_by_source:
-                    total_supply_flow_by_source[supply_comp['commodity_type']] \
-                        = if_sample_flow
-                else:
-                    total_supply_flow_by_source[supply_comp['commodity_type']] \
-                        += if_sample_flow
+            # the flow plan leaves out the supplies that add no flow, and
+            # solves supplies with disjoint paths together
+            for commodity_type, sources in compiled.flow_plan[output_index]:
+                total_supply_flow = 0.0
+                for source, supply_positions in sources:
+                    if_flow_fraction = self._component_graph.maxflow(
+                        source, output_comp_id)
+                    total_supply_flow += if_flow_fraction * \
+                        compiled.supply_capacity_fraction[supply_positions[0]]
+                total_supply_flow_by_source[commodity_type] \
+                    = total_supply_flow
+                if total_supply_flow == 0.0:
+                    # the output is zero whatever the other commodities give
+                    break
 
             total_available_flow = min(total_supply_flow_by_source.values())
 
             estimated_capacity_fraction \
-                = min(total_available_flow, output_comp['capacity_fraction'])
+                = min(total_available_flow,
+                      compiled.output_capacity_fraction[output_index])
             system_outflows_sample[output_index] \
-                = estimated_capacity_fraction * self.get_nominal_output()
+                = estimated_capacity_fraction * compiled.nominal_output
 
         return system_outflows_sample
 
@@ -202,66 +451,73 @@ class Infrastructure(Base):
     def calc_response(self,
                       component_loss,
                       comp_sample_func,
-                      component_damage_state_ind):
+                      component_damage_state_ind,
+                      sample_weights=None):
         """
         Convert the arrays into dicts for subsequent analysis
         :param component_loss: The array of component loss values
         :param comp_sample_func: The array of component functionality values
         :param component_damage_state_ind: The array of component damage state
             indicators
+        :param sample_weights: Optional weight of each row of the arrays,
+            e.g. the number of samples a distinct row stands for. The
+            statistics are then weighted means, standard deviations and
+            failure rates.
         :return: A dict of component response statistics
         """
-        component_list_sorted = np.sort(self.components.keys())
-        num_samples = np.shape(component_loss)[0]
+        compiled = self.compile()
         comp_resp_dict = dict()
         comptype_resp_dict = dict()
         # ---------------------------------------------------------------
         # Collate response of individual components:
-        for comp_index, comp_id in enumerate(component_list_sorted):
-            component = self.components[comp_id]
-
-            comp_resp_dict[(comp_id, 'loss_mean')] \
-                = np.mean(component_loss[:, comp_index])
-
-            comp_resp_dict[(comp_id, 'loss_std')] \
-                = np.std(component_loss[:, comp_index])
-
-            comp_resp_dict[(comp_id, 'func_mean')] \
-                = np.mean(comp_sample_func[:, comp_index])
-
-            comp_resp_dict[(comp_id, 'func_std')] \
-                = np.std(comp_sample_func[:, comp_index])
-
-            comp_resp_dict[(comp_id, 'num_failures')] \
-                = np.mean(component_damage_state_ind[:, comp_index]
-                          >= (len(component.damage_states) - 1))
+        loss_mean, loss_std = _column_mean_std(component_loss, sample_weights)
+        func_mean, func_std = _column_mean_std(comp_sample_func,
+                                               sample_weights)
+        num_failures = _column_mean(
+            component_damage_state_ind >= compiled.failure_ds_index,
+            sample_weights)
+
+        for comp_index, comp_id in enumerate(compiled.component_ids):
+            comp_resp_dict[(comp_id, 'loss_mean')] = loss_mean[comp_index]
+            comp_resp_dict[(comp_id, 'loss_std')] = loss_std[comp_index]
+            comp_resp_dict[(comp_id, 'func_mean')] = func_mean[comp_index]
+            comp_resp_dict[(comp_id, 'func_std')] = func_std[comp_index]
+            comp_resp_dict[(comp_id, 'num_failures')] = \
+                num_failures[comp_index]
 
         # ---------------------------------------------------------------
         # Collate aggregate response of component grouped by their type:
-        for ct_index, ct_id in enumerate(self.get_component_types()):
-            comps_of_a_type = sorted(list(self.get_components_for_type(ct_id)))
-            ct_pos_index = [list(component_list_sorted).index(x)
-                            for x in comps_of_a_type]
-
-            comptype_resp_dict[(ct_id, 'loss_mean')] \
-                = np.mean(component_loss[:, ct_pos_index])
-
-            comptype_resp_dict[(ct_id, 'loss_std')] \
-                = np.std(component_loss[:, ct_pos_index])
-
-            comptype_resp_dict[(ct_id, 'loss_tot')] \
-                = np.sum(component_loss[:, ct_pos_index]) / num_samples
-
-            comptype_resp_dict[(ct_id, 'func_mean')] \
-                = np.mean(comp_sample_func[:, ct_pos_index])
-
-            comptype_resp_dict[(ct_id, 'func_std')] \
-                = np.std(comp_sample_func[:, ct_pos_index])
-
-            acomponent = self.components[comps_of_a_type[0]]
-            comptype_resp_dict[(ct_id, 'num_failures')] \
-                = np.mean(component_damage_state_ind[:, ct_pos_index]
-                          >= (len(acomponent.damage_states) - 1))
+        for ct_id in compiled.component_types:
+            ct_pos_index = compiled.type_indices[ct_id]
+            ct_loss = component_loss[:, ct_pos_index]
+            ct_func = comp_sample_func[:, ct_pos_index]
+            ct_failures = component_damage_state_ind[:, ct_pos_index] \
+                >= compiled.failure_ds_index[ct_pos_index[0]]
+
+            if sample_weights is None:
+                comptype_resp_dict[(ct_id, 'loss_mean')] = np.mean(ct_loss)
+                comptype_resp_dict[(ct_id, 'loss_std')] = np.std(ct_loss)
+                comptype_resp_dict[(ct_id, 'loss_tot')] \
+                    = np.sum(ct_loss) / np.shape(component_loss)[0]
+                comptype_resp_dict[(ct_id, 'func_mean')] = np.mean(ct_func)
+                comptype_resp_dict[(ct_id, 'func_std')] = np.std(ct_func)
+                comptype_resp_dict[(ct_id, 'num_failures')] \
+                    = np.mean(ct_failures)
+            else:
+                # weight every component of a type by its sample's weight
+                ct_weights = np.repeat(sample_weights, len(ct_pos_index))
+                ct_loss_mean, ct_loss_std = \
+                    _column_mean_std(ct_loss.reshape(-1, 1), ct_weights)
+                ct_func_mean, ct_func_std = \
+                    _column_mean_std(ct_func.reshape(-1, 1), ct_weights)
+                comptype_resp_dict[(ct_id, 'loss_mean')] = ct_loss_mean[0]
+                comptype_resp_dict[(ct_id, 'loss_std')] = ct_loss_std[0]
+                comptype_resp_dict[(ct_id, 'loss_tot')] \
+                    = ct_loss_mean[0] * len(ct_pos_index)
+                comptype_resp_dict[(ct_id, 'func_mean')] = ct_func_mean[0]
+                comptype_resp_dict[(ct_id, 'func_std')] = ct_func_std[0]
+                comptype_resp_dict[(ct_id, 'num_failures')] \
+                    = _column_mean(ct_failures.reshape(-1, 1), ct_weights)[0]
         # ---------------------------------------------------------------
         return comp_resp_dict, comptype_resp_dict
 
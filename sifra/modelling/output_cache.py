@@ -0,0 +1,83 @@
+from collections import OrderedDict
+
+
+class SystemOutputCache(object):
+    """
+    A bounded cache of the system output for a component functionality
+    vector, evicting the least recently used entry when it is full.
+
+    At low and high hazard intensities most samples share the same
+    component functionality, so the output of the component graph only
+    needs to be solved once for each distinct vector. The cache lives on
+    the infrastructure model, so it is reused across the hazard levels of
+    a run.
+    """
+
+    def __init__(self, max_size):
+        """
+        :param max_size: Maximum number of functionality vectors to keep.
+                         A size of zero disables the cache.
+        """
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(comp_level_func):
+        """
+        The key for a functionality vector: the raw bytes of its values.
+        :param comp_level_func: Array of the functionality of each component
+        """
+        return comp_level_func.tobytes()
+
+    def get(self, key):
+        """
+        Return the cached output for a key, or None if it is not cached.
+        """
+        if key not in self._entries:
+            self.misses += 1
+            return None
+        self.hits += 1
+        # re-insert the entry to mark it as the most recently used
+        output = self._entries.pop(key)
+        self._entries[key] = output
+        return output
+
+    def put(self, key, output):
+        """
+        Store the output for a key, evicting the least recently used
+        entry if the cache is full.
+        """
+        if self.max_size <= 0:
+            return
+        if key in self._entries:
+            self._entries.pop(key)
+        elif len(self._entries) >= self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        self._entries[key] = output
+
+    def clear(self):
+        """Remove all the entries, keeping the statistics."""
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_stats(self):
+        """
+        :return: A dict of the hit/miss statistics of the cache
+        """
+        lookups = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+                'hit_rate': self.hits / float(lookups) if lookups else 0.0}
+
+    def __str__(self):
+        stats = self.get_stats()
+        return "{hits} hits, {misses} misses ({hit_rate:.1%} hit rate), " \
+               "{evictions} evictions, {size} entries".format(**stats)
@@ -0,0 +1,222 @@
+from collections import deque
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+
+# number of samples packed into one word of the bit arrays
+WORD_BITS = 64
+ALL_SAMPLES = np.uint64(2 ** WORD_BITS - 1)
+
+
+def pack_samples(sample_bits):
+    """
+    Pack a boolean array into words of 64 samples each.
+    :param sample_bits: (samples x n) boolean array
+    :return: (n x words) array of np.uint64, with sample i in bit i % 64
+        of word i // 64. The bits of the padding samples are zero.
+    """
+    num_samples, num_columns = sample_bits.shape
+    num_words = -(-num_samples // WORD_BITS)
+    padded = np.zeros((num_columns, num_words * WORD_BITS), dtype=bool)
+    padded[:, :num_samples] = sample_bits.T
+    return np.packbits(padded, axis=1).view(np.uint64)
+
+
+def unpack_samples(words, num_samples):
+    """
+    The inverse of pack_samples.
+    :param words: (... x words) array of np.uint64
+    :param num_samples: Number of samples packed into the words
+    :return: (... x samples) boolean array
+    """
+    bits = np.unpackbits(np.ascontiguousarray(words).view(np.uint8),
+                         axis=words.ndim - 1)
+    return bits[..., :num_samples].astype(bool)
+
+
+class ReachabilityEngine(object):
+    """
+    Decides the system output of many samples at once from which supply
+    nodes can reach each output node, without solving any max flow
+    problem.
+
+    The samples are packed 64 to a machine word, and reachability from
+    every source of the flow plan is propagated through the component
+    graph with bitwise AND and OR, one topological level of edges at a
+    time. Edges inside a cycle share a level, and the levels are swept
+    again until nothing changes.
+
+    Reachability gives the max flow exactly when it settles the output:
+    * no path with capacity from any supply of a commodity type means no
+      flow of that commodity, and no output;
+    * a path of edges of full capacity carries a flow of at least one, so
+      when the reachable supplies already meet the capacity fraction of
+      the output node for every commodity type, the output is at its cap.
+    With all-or-nothing functionality the two kinds of path are the same,
+    and most samples are decided. The others are left to the max flow
+    calculation.
+    """
+
+    def __init__(self, compiled):
+        """
+        :param compiled: The CompiledInfrastructure of the model
+        """
+        self.compiled = compiled
+        self.num_decided = 0
+        self.num_samples = 0
+
+        # the distinct sources of the flow plan, each a set of vertices
+        self.source_position = {}
+        self._source_vertices = []
+        for output_plan in compiled.flow_plan:
+            for _, sources in output_plan:
+                for source, _ in sources:
+                    if source in self.source_position:
+                        continue
+                    self.source_position[source] = len(self._source_vertices)
+                    supply_ids = source if isinstance(source, tuple) \
+                        else (source,)
+                    self._source_vertices.append(np.array(
+                        [compiled.component_index[comp_id]
+                         for comp_id in supply_ids], dtype=int))
+
+        self._levels, self.is_acyclic = self._build_levels()
+
+    def _build_levels(self):
+        """
+        Group the edges by the topological level of their end vertex.
+
+        The strongly connected components of the graph are ordered by the
+        longest path to them in the graph of components, so the parents of
+        the edges in a level are in earlier levels, or in the same cycle.
+
+        :return: A tuple of levels, each an (edge ids, parents, children,
+            starts) tuple of arrays, sorted by child, where starts are the
+            positions at which a new child begins. Also whether the graph
+            has no cycles, in which case one sweep of the levels is enough.
+        """
+        compiled = self.compiled
+        adjacency = csr_matrix(
+            (np.ones(compiled.num_edges),
+             (compiled.edge_parent, compiled.edge_child)),
+            shape=(compiled.num_components, compiled.num_components))
+        num_groups, group = connected_components(
+            adjacency, directed=True, connection='strong')
+        is_acyclic = num_groups == compiled.num_components and \
+            not np.any(compiled.edge_parent == compiled.edge_child)
+
+        # longest path over the graph of strongly connected components
+        group_children = [set() for _ in range(num_groups)]
+        for parent, child in zip(group[compiled.edge_parent],
+                                 group[compiled.edge_child]):
+            if parent != child:
+                group_children[parent].add(child)
+        in_degree = np.zeros(num_groups, dtype=int)
+        for children in group_children:
+            for child in children:
+                in_degree[child] += 1
+        group_level = np.zeros(num_groups, dtype=int)
+        queue = deque(np.flatnonzero(in_degree == 0))
+        while queue:
+            parent = queue.popleft()
+            for child in group_children[parent]:
+                group_level[child] = max(group_level[child],
+                                         group_level[parent] + 1)
+                in_degree[child] -= 1
+                if in_degree[child] == 0:
+                    queue.append(child)
+
+        edge_level = group_level[group[compiled.edge_child]]
+        levels = []
+        for level in np.unique(edge_level):
+            edge_ids = np.flatnonzero(edge_level == level)
+            edge_ids = edge_ids[np.argsort(compiled.edge_child[edge_ids],
+                                           kind='mergesort')]
+            children = compiled.edge_child[edge_ids]
+            starts = np.flatnonzero(np.concatenate(
+                ([True], children[1:] != children[:-1])))
+            levels.append((edge_ids, compiled.edge_parent[edge_ids],
+                           children[starts], starts))
+        return tuple(levels), is_acyclic
+
+    def reachable(self, edge_words):
+        """
+        Find the vertices each source can reach over the open edges.
+        :param edge_words: (edges x words) bit array of the samples in
+            which each edge is open, as given by pack_samples
+        :return: (vertices x sources x words) bit array of the samples in
+            which each vertex can be reached from each source
+        """
+        reach = np.zeros((self.compiled.num_components,
+                          len(self._source_vertices), edge_words.shape[1]),
+                         dtype=np.uint64)
+        for source_index, vertices in enumerate(self._source_vertices):
+            reach[vertices, source_index] = ALL_SAMPLES
+        while True:
+            changed = False
+            for edge_ids, parents, children, starts in self._levels:
+                arriving = np.bitwise_or.reduceat(
+                    reach[parents] & edge_words[edge_ids][:, np.newaxis],
+                    starts, axis=0)
+                reached = reach[children] | arriving
+                if not self.is_acyclic and not changed:
+                    changed = not np.array_equal(reached, reach[children])
+                reach[children] = reached
+            if not changed:
+                return reach
+
+    def system_output(self, edge_capacity):
+        """
+        :param edge_capacity: (samples x edges) array of edge capacities,
+            as given by propagate_dependencies
+        :return: Boolean array, True for the samples whose output is
+            decided, and the (samples x output nodes) array of their
+            output. The output of the other samples is undefined.
+        """
+        compiled = self.compiled
+        num_samples = edge_capacity.shape[0]
+        output_indices = compiled.output_indices
+
+        any_flow_words = pack_samples(edge_capacity > 0)
+        any_flow = unpack_samples(
+            self.reachable(any_flow_words)[output_indices], num_samples)
+        full_flow_words = pack_samples(edge_capacity >= 1)
+        if np.array_equal(full_flow_words, any_flow_words):
+            full_flow = any_flow
+        else:
+            full_flow = unpack_samples(
+                self.reachable(full_flow_words)[output_indices], num_samples)
+
+        decided = np.ones(num_samples, dtype=bool)
+        system_output = np.zeros((num_samples, len(compiled.output_ids)))
+        for output_index, output_plan in enumerate(compiled.flow_plan):
+            capacity_fraction = \
+                compiled.output_capacity_fraction[output_index]
+            no_output = np.zeros(num_samples, dtype=bool)
+            at_capacity = np.ones(num_samples, dtype=bool)
+            for _, sources in output_plan:
+                has_flow = np.zeros(num_samples, dtype=bool)
+                # the smallest total flow the reachable supplies can give,
+                # added up in the same order as the max flow calculation
+                least_supply_flow = np.zeros(num_samples)
+                for source, supply_positions in sources:
+                    source_index = self.source_position[source]
+                    has_flow |= any_flow[output_index, source_index]
+                    least_supply_flow = least_supply_flow + \
+                        full_flow[output_index, source_index] * \
+                        compiled.supply_capacity_fraction[
+                            supply_positions[0]]
+                no_output |= ~has_flow
+                at_capacity &= least_supply_flow >= capacity_fraction
+            decided &= no_output | at_capacity
+            system_output[at_capacity, output_index] = \
+                capacity_fraction * compiled.nominal_output
+            system_output[no_output, output_index] = 0.0
+
+        self.num_samples += num_samples
+        self.num_decided += int(np.sum(decided))
+        return decided, system_output
+
+    def __str__(self):
+        return "{} of {} samples decided by reachability".format(
+            self.num_decided, self.num_samples)
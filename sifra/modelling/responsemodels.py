@@ -272,4 +272,56 @@ class PiecewiseFunction(Base):
             # any other function between the limits
             else:
                 if piecewise_function.lower_limit <= hazard_intensity < piecewise_function.upper_limit:
-                    return self.piecewise_functions[i](hazard_intensity)
\ No newline at end of file
+                    return self.piecewise_functions[i](hazard_intensity)
+
+
+def evaluate_response_functions(response_functions, hazard_intensities):
+    """
+    Evaluate a batch of response functions, each at its own hazard
+    intensity, in as few calls as possible.
+
+    The closed form models are grouped by class and evaluated with one
+    vectorised call per class. Any other model (e.g. step and piecewise
+    functions) falls back to a scalar call.
+
+    :param response_functions: A sequence of response function objects
+    :param hazard_intensities: A sequence of hazard intensities, one for
+                               each of the response functions
+    :return: A numpy array of the response values
+    """
+    hazard_intensities = np.asarray(hazard_intensities, dtype=np.float64)
+    responses = np.zeros(len(response_functions), dtype=np.float64)
+
+    # group the positions of the functions by their response model
+    grouped_indices = {}
+    for index, response_function in enumerate(response_functions):
+        grouped_indices.setdefault(
+            type(response_function), []).append(index)
+
+    for function_class, indices in grouped_indices.items():
+        indices = np.array(indices, dtype=int)
+        functions = [response_functions[i] for i in indices]
+        intensities = hazard_intensities[indices]
+
+        if function_class is LogNormalCDF:
+            responses[indices] = stats.lognorm.cdf(
+                intensities,
+                np.array([f.beta for f in functions], dtype=np.float64),
+                loc=0,
+                scale=np.array([f.median for f in functions],
+                               dtype=np.float64))
+        elif function_class is NormalCDF:
+            responses[indices] = stats.norm.cdf(
+                intensities,
+                loc=np.array([f.norm_mean for f in functions],
+                             dtype=np.float64),
+                scale=np.array([f.norm_stddev for f in functions],
+                               dtype=np.float64))
+        elif function_class is Level0Response:
+            responses[indices] = 0.0
+        elif function_class is ConstantFunction:
+            responses[indices] = [f.amplitude for f in functions]
+        else:
+            responses[indices] = [f(x) for f, x in zip(functions, intensities)]
+
+    return responses
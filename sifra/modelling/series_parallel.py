@@ -0,0 +1,297 @@
+import itertools
+from collections import defaultdict
+import numpy as np
+from scipy.sparse import csr_matrix
+from sifra.modelling.graph_backends import create_backend
+
+# Flow expressions are nested tuples:
+#   ('edge', edge_id)       the capacity of a component graph edge
+#   ('inf',)                an edge of unbounded capacity
+#   ('min', (expr, ...))    edges in series
+#   ('sum', (expr, ...))    edges in parallel
+UNBOUNDED = ('inf',)
+
+
+def _combine(operator, expressions):
+    """
+    Combine expressions with 'min' or 'sum', flattening nested uses of
+    the same operator so the expression trees stay shallow.
+    """
+    children = []
+    for expression in expressions:
+        if expression[0] == operator:
+            children.extend(expression[1])
+        else:
+            children.append(expression)
+    if operator == 'min':
+        # an unbounded edge in series does not limit the flow
+        bounded = [child for child in children if child != UNBOUNDED]
+        children = bounded if bounded else [UNBOUNDED]
+    if len(children) == 1:
+        return children[0]
+    return operator, tuple(children)
+
+
+def evaluate_expression(expression, edge_capacity):
+    """
+    Evaluate a flow expression for every sample.
+    :param expression: A flow expression
+    :param edge_capacity: (samples x edges) array of edge capacities
+    :return: Array of the value of the expression for each sample
+    """
+    if expression[0] == 'edge':
+        return edge_capacity[:, expression[1]]
+    if expression == UNBOUNDED:
+        return np.full(edge_capacity.shape[0], np.inf)
+    values = [evaluate_expression(child, edge_capacity)
+              for child in expression[1]]
+    if expression[0] == 'min':
+        return np.minimum.reduce(values)
+    # add the parallel branches in turn
+    total = values[0]
+    for value in values[1:]:
+        total = total + value
+    return total
+
+
+class ReducedFlowProblem(object):
+    """
+    The max flow problem between a source and a sink of the component
+    graph, after series-parallel reduction.
+
+    Edges in series carry the smallest of their capacities and edges in
+    parallel carry the sum of theirs, so chains of edges and parallel
+    branches are collapsed into flow expressions. When the graph reduces
+    to a single edge from the source to the sink, its expression is the
+    max flow in closed form. Otherwise what remains is a smaller core
+    graph, whose edge capacities are expressions, and the core is solved
+    with a max flow backend.
+    """
+
+    def __init__(self, num_vertices, edge_parent, edge_child, source, sink,
+                 source_edges=()):
+        """
+        :param num_vertices: Number of vertices of the component graph
+        :param edge_parent: Index of the start vertex of each edge
+        :param edge_child: Index of the end vertex of each edge
+        :param source: Index of the source vertex. Pass num_vertices for
+            a virtual source feeding the vertices in source_edges.
+        :param sink: Index of the sink vertex
+        :param source_edges: The vertices joined to a virtual source by
+            an edge of unbounded capacity
+        """
+        edges = [(parent, child, ('edge', edge_id))
+                 for edge_id, (parent, child)
+                 in enumerate(zip(edge_parent, edge_child))]
+        edges.extend((source, child, UNBOUNDED) for child in source_edges)
+        self.source = source
+        self.sink = sink
+        self._reduce(num_vertices + 1, edges)
+
+    @staticmethod
+    def _reachable(num_vertices, parents, children, start):
+        """The vertices that can be reached from start."""
+        reached = np.zeros(num_vertices, dtype=bool)
+        if not len(parents):
+            reached[start] = True
+            return reached
+        graph = csr_matrix((np.ones(len(parents)), (parents, children)),
+                           shape=(num_vertices, num_vertices))
+        stack = [start]
+        reached[start] = True
+        while stack:
+            vertex = stack.pop()
+            for next_vertex in graph.indices[
+                    graph.indptr[vertex]:graph.indptr[vertex + 1]]:
+                if not reached[next_vertex]:
+                    reached[next_vertex] = True
+                    stack.append(next_vertex)
+        return reached
+
+    def _reduce(self, num_vertices, edges):
+        source, sink = self.source, self.sink
+        parents = np.array([edge[0] for edge in edges], dtype=int)
+        children = np.array([edge[1] for edge in edges], dtype=int)
+        from_source = self._reachable(num_vertices, parents, children, source)
+        to_sink = self._reachable(num_vertices, children, parents, sink)
+
+        # only the edges on a path from the source to the sink can carry
+        # flow; flow into the source or out of the sink adds nothing
+        live = {}
+        for edge_index, (parent, child, expression) in enumerate(edges):
+            if from_source[parent] and to_sink[child] \
+                    and child != source and parent != sink \
+                    and parent != child:
+                live[edge_index] = (parent, child, expression)
+        new_edge_index = itertools.count(len(edges))
+
+        out_edges = defaultdict(set)
+        in_edges = defaultdict(set)
+        for edge_index, (parent, child, _) in live.items():
+            out_edges[parent].add(edge_index)
+            in_edges[child].add(edge_index)
+
+        def add_edge(parent, child, expression):
+            edge_index = next(new_edge_index)
+            live[edge_index] = (parent, child, expression)
+            out_edges[parent].add(edge_index)
+            in_edges[child].add(edge_index)
+
+        def remove_edge(edge_index):
+            parent, child, _ = live.pop(edge_index)
+            out_edges[parent].discard(edge_index)
+            in_edges[child].discard(edge_index)
+
+        changed = True
+        while changed:
+            changed = False
+            # merge parallel edges
+            by_end_points = defaultdict(list)
+            for edge_index, (parent, child, _) in live.items():
+                by_end_points[(parent, child)].append(edge_index)
+            for (parent, child), edge_indices in by_end_points.items():
+                if len(edge_indices) > 1:
+                    expression = _combine(
+                        'sum', [live[i][2] for i in sorted(edge_indices)])
+                    for edge_index in edge_indices:
+                        remove_edge(edge_index)
+                    add_edge(parent, child, expression)
+                    changed = True
+            # merge edges in series through a vertex with one edge in and
+            # one edge out
+            for vertex in list(in_edges.keys()):
+                if vertex in (source, sink) or len(in_edges[vertex]) != 1 \
+                        or len(out_edges[vertex]) != 1:
+                    continue
+                in_edge, = in_edges[vertex]
+                out_edge, = out_edges[vertex]
+                parent, _, in_expression = live[in_edge]
+                _, child, out_expression = live[out_edge]
+                remove_edge(in_edge)
+                remove_edge(out_edge)
+                if parent != child:
+                    add_edge(parent, child,
+                             _combine('min', [in_expression, out_expression]))
+                changed = True
+
+        self.is_closed_form = len(live) == 1
+        if not live:
+            # the sink can not be reached from the source
+            self.expression = None
+            self.is_closed_form = True
+        elif self.is_closed_form:
+            self.expression, = [expression for _, _, expression
+                                in live.values()]
+        else:
+            # renumber the vertices of the core
+            core_edges = [live[edge_index] for edge_index in sorted(live)]
+            vertices = sorted(set([edge[0] for edge in core_edges] +
+                                  [edge[1] for edge in core_edges]))
+            vertex_index = {vertex: index for index, vertex
+                            in enumerate(vertices)}
+            self.core_num_vertices = len(vertices)
+            self.core_edge_parent = np.array(
+                [vertex_index[edge[0]] for edge in core_edges], dtype=int)
+            self.core_edge_child = np.array(
+                [vertex_index[edge[1]] for edge in core_edges], dtype=int)
+            self.core_source = vertex_index[source]
+            self.core_sink = vertex_index[sink]
+            self.core_expressions = [edge[2] for edge in core_edges]
+            self._core_backends = {}
+
+    def maxflow(self, edge_capacity, backend_name='igraph'):
+        """
+        The max flow from the source to the sink for every sample.
+        :param edge_capacity: (samples x edges) array of edge capacities
+        :param backend_name: The graph backend that solves the core
+        :return: Array of the max flow of each sample
+        """
+        num_samples = edge_capacity.shape[0]
+        if self.is_closed_form:
+            if self.expression is None:
+                return np.zeros(num_samples)
+            return evaluate_expression(self.expression, edge_capacity)
+
+        core_capacity = np.column_stack(
+            [evaluate_expression(expression, edge_capacity)
+             for expression in self.core_expressions])
+        # solve the core once for each distinct set of capacities
+        unique_capacity, sample_index_map = np.unique(
+            core_capacity, axis=0, return_inverse=True)
+        if backend_name not in self._core_backends:
+            self._core_backends[backend_name] = create_backend(
+                backend_name, self.core_num_vertices,
+                self.core_edge_parent, self.core_edge_child)
+        backend = self._core_backends[backend_name]
+        flows = np.array([backend.maxflow(self.core_source, self.core_sink,
+                                          capacity)
+                          for capacity in unique_capacity])
+        return flows[sample_index_map]
+
+
+class SeriesParallelFlowEngine(object):
+    """
+    Calculates the system output of many samples at once from the flow
+    plan of a compiled infrastructure model, with each max flow problem
+    reduced to a flow expression or a smaller core.
+    """
+
+    def __init__(self, compiled, backend_name='igraph'):
+        """
+        :param compiled: The CompiledInfrastructure of the model
+        :param backend_name: The graph backend that solves the cores
+        """
+        self.compiled = compiled
+        self.backend_name = backend_name
+        self.problems = {}
+        for output_index, output_plan in enumerate(compiled.flow_plan):
+            sink = compiled.output_indices[output_index]
+            for _, sources in output_plan:
+                for source, _ in sources:
+                    if isinstance(source, tuple):
+                        problem = ReducedFlowProblem(
+                            compiled.num_components, compiled.edge_parent,
+                            compiled.edge_child, compiled.num_components,
+                            sink,
+                            [compiled.component_index[comp_id]
+                             for comp_id in source])
+                    else:
+                        problem = ReducedFlowProblem(
+                            compiled.num_components, compiled.edge_parent,
+                            compiled.edge_child,
+                            compiled.component_index[source], sink)
+                    self.problems[(source, output_index)] = problem
+
+    @property
+    def num_closed_form(self):
+        """Number of max flow problems that reduce to closed form."""
+        return sum(problem.is_closed_form
+                   for problem in self.problems.values())
+
+    def system_output(self, edge_capacity):
+        """
+        :param edge_capacity: (samples x edges) array of edge capacities,
+            as given by propagate_dependencies
+        :return: (samples x output nodes) array of the output
+        """
+        compiled = self.compiled
+        num_samples = edge_capacity.shape[0]
+        system_output = np.zeros((num_samples, len(compiled.output_ids)))
+        for output_index, output_plan in enumerate(compiled.flow_plan):
+            total_available_flow = None
+            for _, sources in output_plan:
+                total_supply_flow = np.zeros(num_samples)
+                for source, supply_positions in sources:
+                    flow = self.problems[(source, output_index)].maxflow(
+                        edge_capacity, self.backend_name)
+                    total_supply_flow = total_supply_flow + flow * \
+                        compiled.supply_capacity_fraction[supply_positions[0]]
+                total_available_flow = total_supply_flow \
+                    if total_available_flow is None \
+                    else np.minimum(total_available_flow, total_supply_flow)
+            estimated_capacity_fraction = np.minimum(
+                total_available_flow,
+                compiled.output_capacity_fraction[output_index])
+            system_output[:, output_index] = \
+                estimated_capacity_fraction * compiled.nominal_output
+        return system_output
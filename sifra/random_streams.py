@@ -0,0 +1,95 @@
+import hashlib
+import struct
+import numpy as np
+
+# the constants of the Philox4x32 generator of Salmon et al. (2011),
+# "Parallel random numbers: as easy as 1, 2, 3"
+PHILOX_M0 = np.uint64(0xD2511F53)
+PHILOX_M1 = np.uint64(0xCD9E8D57)
+PHILOX_W0 = np.uint64(0x9E3779B9)
+PHILOX_W1 = np.uint64(0xBB67AE85)
+PHILOX_ROUNDS = 10
+LOW_32_BITS = np.uint64(0xFFFFFFFF)
+
+
+def philox4x32(counter, key):
+    """
+    The Philox4x32-10 block function: a bijection of 128-bit counters,
+    keyed with 64 bits, whose outputs pass as independent random words.
+    :param counter: (4 x n) array of the 32-bit words of n counters
+    :param key: The two 32-bit words of the key
+    :return: (4 x n) array of np.uint32 random words
+    """
+    c0, c1, c2, c3 = (np.asarray(words, dtype=np.uint64)
+                      for words in counter)
+    k0, k1 = np.uint64(key[0]), np.uint64(key[1])
+    for _ in range(PHILOX_ROUNDS):
+        product0 = PHILOX_M0 * c0
+        product1 = PHILOX_M1 * c2
+        c0, c1, c2, c3 = \
+            (product1 >> np.uint64(32)) ^ c1 ^ k0, \
+            product1 & LOW_32_BITS, \
+            (product0 >> np.uint64(32)) ^ c3 ^ k1, \
+            product0 & LOW_32_BITS
+        k0 = (k0 + PHILOX_W0) & LOW_32_BITS
+        k1 = (k1 + PHILOX_W1) & LOW_32_BITS
+    return np.array([c0, c1, c2, c3], dtype=np.uint32)
+
+
+def stream_key(seed, *names):
+    """
+    Derive the key of a random stream from the seed of a run and the
+    names of what the stream is for, e.g. a hazard level. Distinct names
+    give unrelated keys.
+    :return: The two 32-bit words of the key
+    """
+    text = u"\x1f".join([u"{}".format(seed)] +
+                        [u"{}".format(name) for name in names])
+    digest = hashlib.sha256(text.encode('utf-8')).digest()
+    return struct.unpack('<2I', digest[:8])
+
+
+class CounterRandomStream(object):
+    """
+    Uniform random numbers for a (samples x components) matrix, from a
+    counter-based generator.
+
+    The number of each sample and component is the counter of the
+    generator, so any block of the matrix is calculated directly, without
+    generating the numbers before it. The blocks are the same however the
+    matrix is split, e.g. between processes or chunks of samples.
+    """
+
+    def __init__(self, key):
+        """
+        :param key: The two 32-bit words of the key, see stream_key
+        """
+        self.key = tuple(int(word) for word in key)
+
+    def uniform(self, first_sample, num_samples, first_component,
+                num_components):
+        """
+        :return: (samples x components) array of the numbers in [0, 1)
+                 of a block of the matrix, with 53 random bits each
+        """
+        samples = np.arange(first_sample, first_sample + num_samples,
+                            dtype=np.uint64)
+        # each counter gives four words, the numbers of two components
+        first_pair = first_component // 2
+        pairs = np.arange(first_pair,
+                          (first_component + num_components + 1) // 2,
+                          dtype=np.uint64)
+        sample_counter = np.repeat(samples, len(pairs))
+        words = philox4x32(
+            (sample_counter & LOW_32_BITS, sample_counter >> np.uint64(32),
+             np.tile(pairs, num_samples),
+             np.zeros(len(sample_counter), dtype=np.uint64)),
+            self.key)
+        # 27 and 26 bits of two words, as in numpy's random_sample
+        high = (words[0::2] >> 5).astype(np.float64)
+        low = (words[1::2] >> 6).astype(np.float64)
+        numbers = (high * 67108864.0 + low) / 9007199254740992.0
+        # (2 x samples*pairs) -> samples x (pairs*2)
+        numbers = numbers.T.reshape(num_samples, 2 * len(pairs))
+        offset = first_component - 2 * first_pair
+        return numbers[:, offset:offset + num_components]
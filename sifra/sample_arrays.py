@@ -0,0 +1,55 @@
+import numpy as np
+
+
+class CompressedSampleArray(object):
+    """
+    A per-sample array held as its distinct rows, together with the index
+    of the distinct row for each sample.
+
+    When the damage states of many samples are identical, the responses
+    only need to be calculated for the distinct rows. This class stands in
+    for the full (samples x ...) array, and only rebuilds it when it is
+    converted with ``np.asarray`` or ``expand``. Indexing by sample does
+    not rebuild the whole array.
+    """
+
+    def __init__(self, unique_values, sample_index_map):
+        """
+        :param unique_values: Array with the distinct rows in its first axis
+        :param sample_index_map: For each sample, the index of its row in
+                                 unique_values
+        """
+        self.unique_values = np.asarray(unique_values)
+        self.sample_index_map = np.asarray(sample_index_map)
+
+    @property
+    def shape(self):
+        return (len(self.sample_index_map),) + self.unique_values.shape[1:]
+
+    @property
+    def ndim(self):
+        return self.unique_values.ndim
+
+    @property
+    def dtype(self):
+        return self.unique_values.dtype
+
+    def __len__(self):
+        return len(self.sample_index_map)
+
+    def expand(self):
+        """
+        :return: The full per-sample array
+        """
+        return self.unique_values[self.sample_index_map]
+
+    def __array__(self, dtype=None):
+        expanded = self.expand()
+        return expanded if dtype is None else expanded.astype(dtype)
+
+    def __getitem__(self, key):
+        # map the sample part of the index onto the distinct rows
+        if isinstance(key, tuple):
+            return self.unique_values[
+                (self.sample_index_map[key[0]],) + key[1:]]
+        return self.unique_values[self.sample_index_map[key]]
@@ -0,0 +1,100 @@
+import os
+import shutil
+import tempfile
+import numpy as np
+
+
+class SampleArrayStore(object):
+    """
+    Memory-mapped files that hold the per-sample arrays of every hazard
+    level, indexed by hazard level, for a parallel run.
+
+    The parent process allocates the files before the run. Each worker
+    writes the damage states, output and economic loss of its samples
+    straight into the rows of its hazard level, and returns only the
+    statistics of the response. The parent then reads the files, so the
+    per-sample arrays are neither pickled back from the workers nor copied
+    when the hazard levels are stacked. A store is small to pickle, as it
+    only holds the paths and the shapes of the arrays.
+    """
+
+    def __init__(self, hazard_names, max_samples, num_components,
+                 num_outputs, directory=None):
+        """
+        :param hazard_names: Names of the hazard levels, in the order of
+                             the columns of the per-sample arrays
+        :param max_samples: The most samples of any hazard level
+        :param num_components: Number of components of the model
+        :param num_outputs: Number of output nodes of the model
+        :param directory: Directory for the files. Defaults to a new
+                          temporary directory.
+        """
+        self.hazard_index = {hazard_name: hazard_index
+                             for hazard_index, hazard_name
+                             in enumerate(hazard_names)}
+        self.directory = tempfile.mkdtemp(prefix='sifra_samples_',
+                                          dir=directory)
+        num_hazards = len(hazard_names)
+        self.arrays = {
+            'damage_states':
+                (int, (num_hazards, max_samples, num_components)),
+            'output':
+                (np.float64, (num_hazards, max_samples, num_outputs)),
+            'economic_loss': (np.float64, (num_hazards, max_samples))}
+        for name in self.arrays:
+            self._map(name, 'w+').flush()
+
+    def _map(self, name, mode):
+        dtype, shape = self.arrays[name]
+        return np.memmap(os.path.join(self.directory, name + '.dat'),
+                         dtype=dtype, mode=mode, shape=shape)
+
+    def write(self, hazard_name, damage_states, output, economic_loss):
+        """
+        Write the per-sample arrays of a hazard level into its rows. The
+        rows past its samples are NaN, as in stack_sample_arrays.
+        """
+        hazard_index = self.hazard_index[hazard_name]
+        values = {'damage_states': damage_states,
+                  'output': output,
+                  'economic_loss': economic_loss}
+        for name in self.arrays:
+            mapped = self._map(name, 'r+')
+            sample_array = np.asarray(values[name])
+            mapped[hazard_index, :len(sample_array)] = sample_array
+            if mapped.dtype.kind == 'f':
+                mapped[hazard_index, len(sample_array):] = np.nan
+            mapped.flush()
+            del mapped
+
+    def read(self, hazard_name, num_samples):
+        """
+        Copy the per-sample arrays of the first samples of a hazard level.
+        :return: Tuple of the damage states, output and economic loss
+        """
+        hazard_index = self.hazard_index[hazard_name]
+        return tuple(np.array(self._map(name, 'r')[hazard_index,
+                                                   :num_samples])
+                     for name in ('damage_states', 'output',
+                                  'economic_loss'))
+
+    def load(self):
+        """
+        Read the arrays written by the workers, and delete the files. The
+        arrays are copied out of the files, and the mappings closed, before
+        the files are deleted, as open mappings keep them from being
+        deleted on Windows.
+        :return: Dict of the (hazard levels x samples x ...) arrays by name
+        """
+        arrays = {}
+        for name in self.arrays:
+            mapped = self._map(name, 'r')
+            arrays[name] = np.array(mapped)
+            del mapped
+        self.remove()
+        return arrays
+
+    def remove(self):
+        """Delete the files of the store, if they are still there."""
+        if os.path.exists(self.directory):
+            shutil.rmtree(self.directory)
@@ -0,0 +1,170 @@
+from abc import ABCMeta, abstractmethod
+from collections import OrderedDict
+import numpy as np
+from sifra.random_streams import CounterRandomStream
+from sifra.sobol_sequence import ScrambledSobolSequence
+
+
+class UniformSampler(object):
+    """
+    Draws the (samples x components) matrix of uniform numbers that the
+    damage states of the components are sampled from.
+
+    A sampler is made for each hazard level from the random number
+    generator of that level, so the samples stay reproducible per hazard.
+    Successive draws continue from the previous one, so the samples can be
+    drawn in blocks.
+    """
+    __metaclass__ = ABCMeta
+    name = None
+    # whether the sampler has a uniform_block that draws any block of the
+    # samples directly
+    draws_blocks = False
+
+    def __init__(self, random_state, key=None):
+        """
+        :param random_state: The numpy RandomState of the hazard level
+        :param key: The key of the counter-based random stream of the
+                    hazard level, see random_streams.stream_key
+        """
+        self.random_state = random_state
+        self.key = key
+
+    @classmethod
+    def is_available(cls):
+        """
+        Whether the sampler can be used with the installed libraries.
+        """
+        return True
+
+    @abstractmethod
+    def uniform(self, num_samples, num_dimensions):
+        """
+        :param num_samples: Number of samples to draw
+        :param num_dimensions: Number of uniform numbers in each sample
+        :return: (samples x dimensions) array of numbers in [0, 1)
+        """
+
+
+class PseudoRandomSampler(UniformSampler):
+    """Independent pseudo-random numbers of the RandomState."""
+    name = 'random'
+
+    def uniform(self, num_samples, num_dimensions):
+        return self.random_state.uniform(
+            size=(num_samples, num_dimensions))
+
+
+class LatinHypercubeSampler(UniformSampler):
+    """
+    Latin hypercube samples: for every component, each of the num_samples
+    equal strata of [0, 1) holds exactly one sample, at a random position
+    within it. The strata are paired between components at random.
+
+    The mean of a response that is monotone in each component, such as the
+    loss, has a smaller variance than with independent samples. Each draw
+    is stratified on its own, so blocks of samples are each a Latin
+    hypercube.
+    """
+    name = 'lhs'
+
+    def uniform(self, num_samples, num_dimensions):
+        shape = (num_samples, num_dimensions)
+        # the order of uniform numbers is a random permutation of each column
+        strata = np.argsort(self.random_state.uniform(size=shape), axis=0)
+        return (strata + self.random_state.uniform(size=shape)) / num_samples
+
+
+class SobolSampler(UniformSampler):
+    """
+    Scrambled Sobol low-discrepancy sequence, see sobol_sequence. The
+    scramble is drawn from the RandomState, and successive draws continue
+    along the sequence. The balance of the sequence is best when the
+    number of samples is a power of two.
+    """
+    name = 'sobol'
+
+    def __init__(self, random_state, key=None):
+        super(SobolSampler, self).__init__(random_state, key)
+        self._sequence = None
+        self._next_sample = 0
+
+    def uniform(self, num_samples, num_dimensions):
+        if self._sequence is None or \
+                self._sequence.num_dimensions != num_dimensions:
+            self._sequence = ScrambledSobolSequence(num_dimensions,
+                                                    self.random_state)
+            self._next_sample = 0
+        rnd = self._sequence.points(self._next_sample, num_samples)
+        self._next_sample += num_samples
+        return rnd
+
+
+class CounterBasedSampler(UniformSampler):
+    """
+    Pseudo-random numbers of a counter-based generator, Philox4x32-10,
+    keyed on the run and the hazard level. The numbers of a sample and
+    component depend only on their numbers, so any block of the samples
+    is drawn directly, with the same results however the samples are
+    split between blocks, chunks or processes.
+    """
+    name = 'philox'
+    draws_blocks = True
+
+    def __init__(self, random_state, key=None):
+        super(CounterBasedSampler, self).__init__(random_state, key)
+        if key is None:
+            raise ValueError("The '{}' sampler needs the key of a random "
+                             "stream".format(self.name))
+        self._stream = CounterRandomStream(key)
+        self._next_sample = 0
+
+    def uniform(self, num_samples, num_dimensions):
+        rnd = self.uniform_block(self._next_sample, num_samples,
+                                 num_dimensions)
+        self._next_sample += num_samples
+        return rnd
+
+    def uniform_block(self, first_sample, num_samples, num_dimensions):
+        """
+        Draw the numbers of a block of the samples directly, without
+        drawing the samples before it. The blocks are the same as the
+        rows of one draw of all the samples.
+        :param first_sample: Number of the first sample of the block
+        :param num_samples: Number of samples in the block
+        :param num_dimensions: Number of uniform numbers in each sample
+        :return: (samples x dimensions) array of numbers in [0, 1)
+        """
+        return self._stream.uniform(first_sample, num_samples,
+                                    0, num_dimensions)
+
+
+SAMPLERS = OrderedDict(
+    (sampler.name, sampler) for sampler in
+    (PseudoRandomSampler, LatinHypercubeSampler, SobolSampler,
+     CounterBasedSampler))
+
+
+def available_samplers():
+    """
+    :return: The names of the samplers that can be used
+    """
+    return [name for name, sampler in SAMPLERS.items()
+            if sampler.is_available()]
+
+
+def create_sampler(name, random_state, key=None):
+    """
+    Build the named sampler.
+    :param name: One of the names in SAMPLERS
+    :param random_state: The numpy RandomState of the hazard level
+    :param key: The key of the counter-based random stream of the hazard
+                level, which the 'philox' sampler needs
+    """
+    if name not in SAMPLERS:
+        raise ValueError("Unknown sampling method '{}'. Accepted methods "
+                         "are: {}".format(name, ", ".join(SAMPLERS)))
+    if not SAMPLERS[name].is_available():
+        raise ValueError("The sampling method '{}' is not available with "
+                         "the installed libraries".format(name))
+    return SAMPLERS[name](random_state, key)
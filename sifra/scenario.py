@@ -13,6 +13,8 @@ class Scenario:
         self.input_dir_name = configuration.INPUT_DIR_NAME
         self.raw_output_dir = configuration.RAW_OUTPUT_DIR
         self.output_path = configuration.OUTPUT_PATH
+        self.sys_conf_file = configuration.SYS_CONF_FILE
+        self.config_digest = configuration.CONFIG_DIGEST
 
         # need to convert excel doc into json and update the ingest class
         self.algorithm_factory = None
@@ -21,7 +23,40 @@ class Scenario:
         self.fit_restoration_data = configuration.FIT_RESTORATION_DATA
         self.save_vars_npy = configuration.SAVE_VARS_NPY
         self.run_context = configuration.RUN_CONTEXT
+        self.common_random_numbers = configuration.COMMON_RANDOM_NUMBERS
+        self.sampling_method = configuration.SAMPLING_METHOD
+        self.random_seed = configuration.RANDOM_SEED
+        self.deterministic_saturation = \
+            configuration.DETERMINISTIC_SATURATION
+        self.importance_sampling = configuration.IMPORTANCE_SAMPLING
+        self.importance_min_exceedance = \
+            configuration.IMPORTANCE_MIN_EXCEEDANCE
+        self.importance_biased_fraction = \
+            configuration.IMPORTANCE_BIASED_FRACTION
+        self.adaptive_sampling = configuration.ADAPTIVE_SAMPLING
+        self.adaptive_block_size = configuration.ADAPTIVE_BLOCK_SIZE
+        self.adaptive_tolerance = configuration.ADAPTIVE_TOLERANCE
+        self.adaptive_confidence = configuration.ADAPTIVE_CONFIDENCE
+        self.sample_budget = configuration.SAMPLE_BUDGET
+        self.pilot_samples = configuration.PILOT_SAMPLES
+        self.stream_chunk_size = configuration.STREAM_CHUNK_SIZE
+        self.sample_shard_size = configuration.SAMPLE_SHARD_SIZE
         self.run_parallel_proc = configuration.MULTIPROCESS
+        self.num_workers = configuration.NUM_WORKERS
+        self.parallel_chunk_size = configuration.PARALLEL_CHUNK_SIZE
+        self.shared_sample_arrays = configuration.SHARED_SAMPLE_ARRAYS
+        self.parallel_backend = configuration.PARALLEL_BACKEND
+        self.dask_scheduler_address = configuration.DASK_SCHEDULER_ADDRESS
+        self.checkpoint = configuration.CHECKPOINT
+        # resume from the checkpoint in the output folder, set by --resume
+        self.resume = False
+        self.flow_cache_size = configuration.FLOW_CACHE_SIZE
+        self.compress_samples = configuration.COMPRESS_SAMPLES
+        self.graph_backend = configuration.GRAPH_BACKEND
+        self.flow_reduction = configuration.FLOW_REDUCTION
+        self.reachability_fast_path = configuration.REACHABILITY_FAST_PATH
+        self.cut_set_screening = configuration.CUT_SET_SCREENING
+        self.cut_set_max_order = configuration.CUT_SET_MAX_ORDER
 
         self.num_samples = configuration.NUM_SAMPLES
 
@@ -1,8 +1,15 @@
 import time
 from datetime import timedelta
 import numpy as np
+from scipy import stats
 from sifra.logger import rootLogger
-import parmap
+from sifra.sample_arrays import CompressedSampleArray
+from sifra.samplers import SAMPLERS, create_sampler
+from sifra.random_streams import stream_key
+from sifra.accumulators import ResponseAccumulator
+from sifra.executor import parallel_backend, create_executor
+from sifra.sample_store import SampleArrayStore
+from sifra.checkpoint import RunCheckpoint
 import zipfile
 
 
@@ -12,8 +19,8 @@ def calculate_response(hazards, scenario, infrastructure):
     iterating through the range of hazards and calling the infrastructure
     systems expose_to method. This will return the results of the
     infrastructure to each hazard level exposure. A parameter in the
-    scenario file determines whether the parmap.map function spawns threads
-    that will perform parallel calculations.
+    scenario file determines the backend that performs the calculations:
+    serially, on a ModelPool of worker processes, or on a dask cluster.
     :param scenario: Parameters for the simulation.
     :param infrastructure: Model of the infrastructure.
     :param hazards: hazards container.
@@ -21,56 +28,147 @@ def calculate_response(hazards, scenario, infrastructure):
     """
 
     # code_start_time = time.time() # start of the overall response calculation
-    # capture the results from the map call in a list
-    hazards_response = []
-    # Use the parallel option in the scenario to determine how to run
 
-    if scenario.run_parallel_proc:
+    # the store of the per-sample arrays written by the workers, if any
+    sample_store = None
+
+    # the number of samples of each hazard level
+    if scenario.sample_budget:
+        sample_counts = allocate_sample_budget(hazards, scenario,
+                                               infrastructure)
+    else:
+        sample_counts = {hazard.hazard_scenario_name: scenario.num_samples
+                         for hazard in hazards.listOfhazards}
+    hazard_samples = [(hazard, sample_counts[hazard.hazard_scenario_name])
+                      for hazard in hazards.get_listOfhazards()]
+
+    # the responses of the hazard levels by name, starting from the ones
+    # saved in the checkpoint of an earlier run, if any
+    checkpoint = None
+    responses = {}
+    if scenario.checkpoint or scenario.resume:
+        checkpoint = RunCheckpoint(scenario, hazard_samples, scenario.resume)
+        responses = checkpoint.load_completed()
+        rootLogger.info("{} of {} hazard levels already complete".format(
+            len(responses), len(hazard_samples)))
+    pending_samples = [(hazard, num_samples)
+                       for hazard, num_samples in hazard_samples
+                       if hazard.hazard_scenario_name not in responses]
+
+    # Use the parallel option in the scenario to determine how to run
+    if scenario.sample_shard_size and not scenario.adaptive_sampling:
+        rootLogger.info("Start sharded run")
+        for hazard_response in calculate_sharded_response(
+                pending_samples, scenario, infrastructure, checkpoint):
+            responses.update(
+                (key, hazard_response) for key in hazard_response)
+        rootLogger.info("End sharded run")
+    elif parallel_backend(scenario) != 'serial':
         rootLogger.info("Start parallel run")
-        hazards_response.extend(parmap.map(calculate_response_for_hazard,
-                                           hazards.get_listOfhazards(),
-                                           scenario,
-                                           infrastructure,
-                                           parallel=scenario.run_parallel_proc))
+        if scenario.shared_sample_arrays and \
+                parallel_backend(scenario) == 'process' and \
+                keeps_sample_arrays(scenario):
+            # the workers write their per-sample arrays into the store
+            sample_store = SampleArrayStore(
+                [hazard.hazard_scenario_name
+                 for hazard, _ in hazard_samples],
+                max(num_samples for _, num_samples in hazard_samples),
+                len(infrastructure.components),
+                len(infrastructure.output_nodes))
+            # and so do the levels of the checkpoint, that kept them
+            for key, hazard_response in responses.items():
+                value_list = hazard_response[key]
+                if value_list[0] is None:
+                    continue
+                sample_store.write(key, value_list[0], value_list[4],
+                                   value_list[5])
+                value_list[0] = value_list[4] = value_list[5] = None
+            task_function = calculate_response_into_store
+            tasks = [(hazard, num_samples, sample_store)
+                     for hazard, num_samples in pending_samples]
+        else:
+            task_function = calculate_response_for_samples
+            tasks = pending_samples
+        try:
+            if tasks:
+                with create_executor(task_function, scenario,
+                                     infrastructure) as executor:
+                    for hazard_response in executor.imap(tasks):
+                        if checkpoint is not None:
+                            save_hazard_response(checkpoint, hazard_response,
+                                                 sample_store)
+                        responses.update(
+                            (key, hazard_response) for key in hazard_response)
+        except Exception:
+            if sample_store is not None:
+                sample_store.remove()
+            raise
         rootLogger.info("End parallel run")
     else:
         rootLogger.info("Start serial run")
-        for hazard in hazards.listOfhazards:
-            hazards_response.append(
-                calculate_response_for_hazard(hazard, scenario, infrastructure))
+        for hazard, num_samples in pending_samples:
+            hazard_response = calculate_response_for_hazard(
+                hazard, scenario, infrastructure, num_samples)
+            if checkpoint is not None:
+                save_hazard_response(checkpoint, hazard_response)
+            responses.update(
+                (key, hazard_response) for key in hazard_response)
         rootLogger.info("End serial run")
 
+    hazards_response = [responses[hazard.hazard_scenario_name]
+                        for hazard, _ in hazard_samples]
+
     # combine the responses into one list
     post_processing_list = [{},  # hazard level vs component damage state index
                             {},  # hazard level vs infrastructure output
                             {},  # hazard level vs component response
                             {},  # hazard level vs component type response
                             [],  # array of infrastructure output per sample
-                            []]  # array infrastructure econ loss per sample
+                            [],  # array infrastructure econ loss per sample
+                            {},  # hazard level vs number of samples
+                            {},  # hazard level vs likelihood weights
+                            {}]  # hazard level vs streamed statistics
 
     # iterate through the hazards
     for hazard_response in hazards_response:
         # iterate through the hazard response dictionary
         for key, value_list in hazard_response.items():
-            for list_number in range(6):
-                # the first four are dicts
-                if list_number <= 3:
+            for list_number in range(9):
+                # the per-sample arrays are lists, the others are dicts
+                if list_number in (4, 5):
+                    post_processing_list[list_number].append(
+                        None if value_list[list_number] is None
+                        else np.asarray(value_list[list_number]))
+                else:
                     post_processing_list[list_number][key] \
                         = value_list[list_number]
-                else:
-                    # the last two are lists
-                    post_processing_list[list_number]. \
-                        append(value_list[list_number])
 
-    # Convert the last 2 lists into arrays
-    for list_number in range(4, 6):
-        post_processing_list[list_number] \
-            = np.array(post_processing_list[list_number])
+    # Convert the per-sample lists into arrays. Streamed samples without
+    # SAVE_VARS_NPY keep no per-sample arrays, and the statistics are used
+    if sample_store is not None:
+        # the arrays are already stacked by hazard level in the store
+        sample_arrays = sample_store.load()
+        for hazard_index, (hazard, _) in enumerate(hazard_samples):
+            hazard_name = hazard.hazard_scenario_name
+            post_processing_list[0][hazard_name] = \
+                sample_arrays['damage_states'][
+                    hazard_index, :post_processing_list[6][hazard_name]]
+        post_processing_list[4] = sample_arrays['output']
+        post_processing_list[5] = sample_arrays['economic_loss']
+    elif any(sample_array is None
+             for sample_array in post_processing_list[4]):
+        post_processing_list[4] = None
+        post_processing_list[5] = None
+    else:
+        for list_number in range(4, 6):
+            post_processing_list[list_number] \
+                = stack_sample_arrays(post_processing_list[list_number])
 
-    # Convert the calculated output array into the correct format
-    post_processing_list[4] = np.sum(post_processing_list[4],
-                                     axis=2).transpose()
-    post_processing_list[5] = post_processing_list[5].transpose()
+    if post_processing_list[4] is not None:
+        # Convert the calculated output array into the correct format
+        post_processing_list[4] = np.sum(post_processing_list[4],
+                                         axis=2).transpose()
+        post_processing_list[5] = post_processing_list[5].transpose()
 
     # elapsed = timedelta(seconds=(time.time() - code_start_time))
     # logging.info("[ Run time: %s ]\n" % str(elapsed))
@@ -78,13 +176,128 @@ def calculate_response(hazards, scenario, infrastructure):
     return post_processing_list
 
 
-def calculate_response_for_hazard(hazard, scenario, infrastructure):
+def keeps_sample_arrays(scenario):
+    """
+    Whether the responses of the hazard levels hold their per-sample
+    arrays: not when the samples are streamed without SAVE_VARS_NPY.
+    """
+    return bool(scenario.save_vars_npy or not scenario.stream_chunk_size or
+                scenario.adaptive_sampling)
+
+
+def stack_sample_arrays(sample_arrays):
+    """
+    Stack the per-sample arrays of the hazard levels into one array.
+    With adaptive sampling the hazard levels can have different numbers
+    of samples, and the rows past the samples of a level are NaN.
+    :param sample_arrays: List of arrays with a row for each sample
+    :return: (hazard levels x samples x ...) array
+    """
+    max_samples = max(len(sample_array) for sample_array in sample_arrays)
+    stacked = np.full((len(sample_arrays), max_samples) +
+                      sample_arrays[0].shape[1:], np.nan)
+    for hazard_index, sample_array in enumerate(sample_arrays):
+        stacked[hazard_index, :len(sample_array)] = sample_array
+    return stacked
+
+
+def allocate_sample_budget(hazards, scenario, infrastructure):
+    """
+    Share the sample budget of the scenario between the hazard levels.
+
+    A pilot pass draws scenario.pilot_samples samples at every hazard
+    level, and estimates the probability of exceeding each system damage
+    state from the economic loss, as write_system_response does. The
+    system fragility curves are least squares fits to these
+    probabilities, so the rest of the budget goes where their sampling
+    variance is highest: it is shared in proportion to the standard
+    deviation sqrt(sum(p * (1 - p))) of each level, which gives the
+    smallest total variance for the budget (Neyman allocation).
+
+    :param hazards: hazards container.
+    :param scenario: Parameters for the simulation.
+    :param infrastructure: Model of the infrastructure.
+    :return: dict of the number of samples of each hazard level, with
+             at least the pilot samples at every level
+    """
+    pilot_samples = scenario.pilot_samples
+    damage_scale_bounds = infrastructure.get_dmg_scale_bounds(scenario)
+    num_system_damage_states = len(infrastructure.get_system_damage_states())
+
+    hazard_names = []
+    std_devs = []
+    for hazard in hazards.listOfhazards:
+        component_damage_state_ind = \
+            calculate_expected_damage_state_of_components_for_n_simulations(
+                infrastructure, scenario, hazard, pilot_samples)
+        economic_loss = infrastructure.calc_output_loss(
+            scenario, component_damage_state_ind)[3]
+        sys_frag = np.sum(
+            economic_loss[:, np.newaxis] > damage_scale_bounds, axis=1)
+        num_exceeding = np.array(
+            [np.sum(sys_frag >= ds_index)
+             for ds_index in range(1, num_system_damage_states)])
+        # shrink the estimates away from 0 and 1, so that a level where
+        # the pilot saw no change of state is still sampled a little
+        pe_sys = (num_exceeding + 0.5) / (pilot_samples + 1.0)
+        hazard_names.append(hazard.hazard_scenario_name)
+        std_devs.append(np.sqrt(np.sum(pe_sys * (1.0 - pe_sys))))
+
+    std_devs = np.array(std_devs)
+    remaining_samples = max(
+        scenario.sample_budget - pilot_samples * len(hazard_names), 0)
+    shares = remaining_samples * std_devs / np.sum(std_devs)
+    extra_samples = np.floor(shares).astype(int)
+    # hand out the samples lost to rounding by the largest remainders
+    num_left = remaining_samples - np.sum(extra_samples)
+    extra_samples[np.argsort(extra_samples - shares,
+                             kind='mergesort')[:num_left]] += 1
+
+    sample_counts = {hazard_name: pilot_samples + int(extra)
+                     for hazard_name, extra
+                     in zip(hazard_names, extra_samples)}
+    rootLogger.info("Samples allocated to hazard levels: {}".format(
+        sample_counts))
+    return sample_counts
+
+
+def calculate_response_for_samples(hazard_samples, scenario, infrastructure):
+    """
+    Module level function for the map of an executor: calculate the
+    response to a (hazard, number of samples) pair.
+    """
+    hazard, num_samples = hazard_samples
+    return calculate_response_for_hazard(hazard, scenario, infrastructure,
+                                         num_samples)
+
+
+def calculate_response_into_store(task, scenario, infrastructure):
+    """
+    Module level function for the map of a ModelPool: calculate the
+    response to a (hazard, number of samples, SampleArrayStore) task, and
+    write the per-sample arrays into the store instead of returning them.
+    """
+    hazard, num_samples, sample_store = task
+    response = calculate_response_for_hazard(hazard, scenario,
+                                             infrastructure, num_samples)
+    value_list = response[hazard.hazard_scenario_name]
+    sample_store.write(hazard.hazard_scenario_name, value_list[0],
+                       value_list[4], value_list[5])
+    value_list[0] = value_list[4] = value_list[5] = None
+    return response
+
+
+def calculate_response_for_hazard(hazard, scenario, infrastructure,
+                                  num_samples=None):
     """
     Exposes the components of the infrastructure to a hazard level
     within a scenario.
     :param infrastructure: containing for components
     :param hazard: The hazard  that the infrastructure is to be exposed to.
     :param scenario: The parameters for the scenario being simulated.
+    :param num_samples: Number of samples to draw, or with adaptive
+                        sampling the most samples to draw. Defaults to the
+                        number of samples of the scenario.
     :return: The state of the infrastructure after the exposure.
     """
 
@@ -93,39 +306,110 @@ def calculate_response_for_hazard(hazard, scenario, infrastructure):
 
     # calculate the damage state probabilities
     rootLogger.info("Calculate System Response")
-    expected_damage_state_of_components_for_n_simulations = \
-        calculate_expected_damage_state_of_components_for_n_simulations(
-            infrastructure, scenario, hazard)
-    rootLogger.info("System Response: ")
-
-    # calculate the component loss, functionality, output,
-    #  economic loss and recovery output over time
-    component_sample_loss, \
-    comp_sample_func, \
-    infrastructure_sample_output, \
-    infrastructure_sample_economic_loss = \
-        infrastructure.calc_output_loss(
-            scenario,
-            expected_damage_state_of_components_for_n_simulations)
+    # the likelihood weights of the samples, when they are not drawn from
+    # the damage state probabilities themselves
+    likelihood_weights = None
+    if num_samples is None:
+        num_samples = scenario.num_samples
+    if scenario.stream_chunk_size and not scenario.adaptive_sampling:
+        return calculate_streaming_response(hazard, scenario, infrastructure,
+                                            num_samples, code_start_time)
+    saturated_level = False
+    if scenario.deterministic_saturation:
+        saturated, saturated_damage_state_ind = saturated_damage_states(
+            infrastructure.get_exceedance_probabilities(hazard))
+        saturated_level = np.all(saturated)
+
+    if saturated_level:
+        # the damage state of every component is certain, so all the
+        # samples are the same, and the level is evaluated once. The
+        # statistics are exact, with no variance.
+        rootLogger.info("Hazard {}: every component is saturated".format(
+            hazard.hazard_scenario_name))
+        damage_states = saturated_damage_state_ind[np.newaxis, :]
+        sample_index_map = np.zeros(num_samples, dtype=int)
+        expected_damage_state_of_components_for_n_simulations = \
+            CompressedSampleArray(damage_states, sample_index_map)
+    elif scenario.adaptive_sampling:
+        # the samples are drawn and evaluated in blocks until the means
+        # are known to the tolerance
+        expected_damage_state_of_components_for_n_simulations, \
+        component_sample_loss, \
+        comp_sample_func, \
+        infrastructure_sample_output, \
+        infrastructure_sample_economic_loss, \
+        likelihood_weights = \
+            calculate_adaptive_samples(infrastructure, scenario, hazard,
+                                       num_samples)
+    elif scenario.importance_sampling:
+        expected_damage_state_of_components_for_n_simulations, \
+            likelihood_weights = calculate_importance_samples(
+                infrastructure, scenario, hazard, num_samples)
+    else:
+        expected_damage_state_of_components_for_n_simulations = \
+            calculate_expected_damage_state_of_components_for_n_simulations(
+                infrastructure, scenario, hazard, num_samples)
+    num_samples = len(expected_damage_state_of_components_for_n_simulations)
+    rootLogger.info("System Response: {} samples".format(num_samples))
+
+    if saturated_level:
+        # the one row stands for all the samples
+        sample_weights = None
+    elif scenario.compress_samples:
+        damage_states, first_sample_index, sample_index_map, \
+            sample_weights, likelihood_weights = compress_damage_states(
+                expected_damage_state_of_components_for_n_simulations,
+                likelihood_weights)
+    else:
+        damage_states = expected_damage_state_of_components_for_n_simulations
+        sample_weights = likelihood_weights
+
+    if saturated_level or not scenario.adaptive_sampling:
+        # calculate the component loss, functionality, output,
+        #  economic loss and recovery output over time
+        component_sample_loss, \
+        comp_sample_func, \
+        infrastructure_sample_output, \
+        infrastructure_sample_economic_loss = \
+            infrastructure.calc_output_loss(scenario, damage_states)
+    elif scenario.compress_samples:
+        # keep the results of one sample of each distinct row
+        component_sample_loss = component_sample_loss[first_sample_index]
+        comp_sample_func = comp_sample_func[first_sample_index]
+        infrastructure_sample_output = \
+            infrastructure_sample_output[first_sample_index]
+        infrastructure_sample_economic_loss = \
+            infrastructure_sample_economic_loss[first_sample_index]
 
     # Construct the dictionary containing the statistics of the response
     component_response_dict, comptype_response_dict = \
         infrastructure.calc_response(
             component_sample_loss,
             comp_sample_func,
-            expected_damage_state_of_components_for_n_simulations)
+            damage_states,
+            sample_weights=sample_weights)
 
     # determine average output for the output components
     infrastructure_output = {}
     for output_index, (output_comp_id, output_comp) in enumerate(
             infrastructure.output_nodes.items()):
-        infrastructure_output[output_comp_id] = np.mean(
-            infrastructure_sample_output[:, output_index])
+        infrastructure_output[output_comp_id] = np.average(
+            infrastructure_sample_output[:, output_index],
+            weights=sample_weights)
 
-    # log the elapsed time for this hazard level
-    elapsed = timedelta(seconds=(time.time() - code_start_time))
-    rootLogger.info("Hazard {} run time: {}".format(hazard.hazard_scenario_name,
-                                                    str(elapsed)))
+    if saturated_level or scenario.compress_samples:
+        # the per-sample arrays are only expanded when they are used
+        expected_damage_state_of_components_for_n_simulations = \
+            CompressedSampleArray(damage_states, sample_index_map)
+        infrastructure_sample_output = CompressedSampleArray(
+            infrastructure_sample_output, sample_index_map)
+        infrastructure_sample_economic_loss = CompressedSampleArray(
+            infrastructure_sample_economic_loss, sample_index_map)
+        if likelihood_weights is not None:
+            likelihood_weights = CompressedSampleArray(likelihood_weights,
+                                                       sample_index_map)
+
+    log_hazard_run(hazard, scenario, infrastructure, code_start_time)
 
     # We combine the result data into a dictionary for ease of use
     response_for_a_hazard = {hazard.hazard_scenario_name: [
@@ -134,12 +418,446 @@ def calculate_response_for_hazard(hazard, scenario, infrastructure):
         component_response_dict,
         comptype_response_dict,
         infrastructure_sample_output,
-        infrastructure_sample_economic_loss]}
+        infrastructure_sample_economic_loss,
+        num_samples,
+        likelihood_weights,
+        None]}
     return response_for_a_hazard
 
 
+def calculate_streaming_response(hazard, scenario, infrastructure,
+                                 num_samples, code_start_time):
+    """
+    Exposes the components of the infrastructure to a hazard level, with
+    the samples drawn and evaluated in chunks of STREAM_CHUNK_SIZE samples.
+    The statistics of the response are accumulated chunk by chunk in a
+    ResponseAccumulator, so the memory used does not grow with the number
+    of samples. The per-sample arrays are only kept when SAVE_VARS_NPY is
+    set, and are otherwise None in the response.
+    :param hazard: The hazard that the infrastructure is to be exposed to.
+    :param scenario: The parameters for the scenario being simulated.
+    :param infrastructure: containing for components
+    :param num_samples: Number of samples to draw
+    :param code_start_time: Start time of the hazard level
+    :return: The state of the infrastructure after the exposure, as given
+             by calculate_response_for_hazard.
+    """
+    statistics, kept_chunks = accumulate_sample_statistics(
+        hazard, scenario, infrastructure, num_samples)
+    rootLogger.info("System Response: {} samples in chunks of {}".format(
+        num_samples, scenario.stream_chunk_size))
+    log_hazard_run(hazard, scenario, infrastructure, code_start_time)
+    return assemble_streamed_response(hazard, statistics, kept_chunks,
+                                      num_samples)
+
+
+def accumulate_sample_statistics(hazard, scenario, infrastructure,
+                                 level_samples, first_sample=0,
+                                 num_samples=None):
+    """
+    Draw and evaluate a block of the samples of a hazard level, in chunks
+    of STREAM_CHUNK_SIZE samples, or all at once when it is zero, and
+    accumulate the statistics of their response. A block that is not all
+    the samples of the level is drawn directly, with the uniform_block of
+    the sampler, so its random numbers only depend on the numbers of its
+    samples. With DETERMINISTIC_SATURATION, a level whose components are
+    all saturated is evaluated once.
+    :param hazard: The hazard that the infrastructure is to be exposed to.
+    :param scenario: The parameters for the scenario being simulated.
+    :param infrastructure: containing for components
+    :param level_samples: Number of samples of the hazard level
+    :param first_sample: Number of the first sample of the block
+    :param num_samples: Number of samples in the block. Defaults to all
+                        the samples of the level.
+    :return: The ResponseAccumulator, and a list of the (damage state
+             indices, output, economic loss, likelihood weights) of the
+             chunks when SAVE_VARS_NPY is set, or else an empty list
+    """
+    if num_samples is None:
+        num_samples = level_samples
+    block_draws = num_samples < level_samples
+    if block_draws:
+        check_block_draws(scenario)
+    chunk_size = scenario.stream_chunk_size or num_samples
+    sampler = create_hazard_sampler(scenario, hazard)
+    component_pe_ds = infrastructure.get_exceedance_probabilities(hazard)
+    statistics = ResponseAccumulator(infrastructure, scenario)
+    kept_chunks = []
+
+    if scenario.deterministic_saturation:
+        saturated, saturated_damage_state_ind = \
+            saturated_damage_states(component_pe_ds)
+        if np.all(saturated):
+            # every sample of the level is the same, so it is evaluated
+            # once, and the one row weighs for all the samples
+            damage_states = saturated_damage_state_ind[np.newaxis, :]
+            component_sample_loss, \
+            comp_sample_func, \
+            infrastructure_sample_output, \
+            infrastructure_sample_economic_loss = \
+                infrastructure.calc_output_loss(scenario, damage_states)
+            statistics.add(damage_states, component_sample_loss,
+                           comp_sample_func, infrastructure_sample_output,
+                           infrastructure_sample_economic_loss,
+                           np.array([float(num_samples)]))
+            if scenario.save_vars_npy:
+                kept_chunks.append(tuple(
+                    np.repeat(sample_array, num_samples, axis=0)
+                    for sample_array in (
+                        damage_states, infrastructure_sample_output,
+                        infrastructure_sample_economic_loss)) + (None,))
+            return statistics, kept_chunks
+
+    first_biased_sample = level_samples - int(
+        round(scenario.importance_biased_fraction * level_samples))
+
+    for chunk_start in range(first_sample, first_sample + num_samples,
+                             chunk_size):
+        chunk_samples = min(chunk_size,
+                            first_sample + num_samples - chunk_start)
+        rnd = draw_uniform_numbers(
+            sampler, component_pe_ds, chunk_samples, scenario,
+            first_sample=chunk_start if block_draws else None)
+        if scenario.importance_sampling:
+            # the same samples are biased as in one draw of all of them
+            chunk_damage_states, chunk_likelihood_weights = \
+                importance_sample_damage_states(
+                    component_pe_ds, rnd, scenario.importance_min_exceedance,
+                    scenario.importance_biased_fraction,
+                    num_biased_samples=int(np.clip(
+                        chunk_start + chunk_samples - first_biased_sample,
+                        0, chunk_samples)))
+        else:
+            chunk_damage_states = sample_damage_states(component_pe_ds, rnd)
+            chunk_likelihood_weights = None
+
+        if scenario.compress_samples:
+            damage_states, _, sample_index_map, sample_weights, _ = \
+                compress_damage_states(chunk_damage_states,
+                                       chunk_likelihood_weights)
+        else:
+            damage_states = chunk_damage_states
+            sample_weights = chunk_likelihood_weights
+
+        component_sample_loss, \
+        comp_sample_func, \
+        infrastructure_sample_output, \
+        infrastructure_sample_economic_loss = \
+            infrastructure.calc_output_loss(scenario, damage_states)
+        statistics.add(damage_states, component_sample_loss,
+                       comp_sample_func, infrastructure_sample_output,
+                       infrastructure_sample_economic_loss, sample_weights)
+
+        if scenario.save_vars_npy:
+            if scenario.compress_samples:
+                infrastructure_sample_output = \
+                    infrastructure_sample_output[sample_index_map]
+                infrastructure_sample_economic_loss = \
+                    infrastructure_sample_economic_loss[sample_index_map]
+            kept_chunks.append((chunk_damage_states,
+                                infrastructure_sample_output,
+                                infrastructure_sample_economic_loss,
+                                chunk_likelihood_weights))
+    return statistics, kept_chunks
+
+
+def assemble_streamed_response(hazard, statistics, kept_chunks,
+                               num_samples):
+    """
+    The response to a hazard level, as given by
+    calculate_response_for_hazard, from the statistics accumulated over
+    its samples and the chunks of per-sample arrays that were kept.
+    """
+    component_response_dict, comptype_response_dict = \
+        statistics.component_response()
+    if kept_chunks:
+        expected_damage_state_of_components_for_n_simulations, \
+        infrastructure_sample_output, \
+        infrastructure_sample_economic_loss = \
+            [np.concatenate(arrays) for arrays in zip(*kept_chunks)[:3]]
+        likelihood_weights = None if kept_chunks[0][3] is None else \
+            np.concatenate([chunk[3] for chunk in kept_chunks])
+    else:
+        expected_damage_state_of_components_for_n_simulations = None
+        infrastructure_sample_output = None
+        infrastructure_sample_economic_loss = None
+        likelihood_weights = None
+
+    return {hazard.hazard_scenario_name: [
+        expected_damage_state_of_components_for_n_simulations,
+        statistics.mean_output(),
+        component_response_dict,
+        comptype_response_dict,
+        infrastructure_sample_output,
+        infrastructure_sample_economic_loss,
+        num_samples,
+        likelihood_weights,
+        statistics]}
+
+
+def save_hazard_response(checkpoint, hazard_response, sample_store=None):
+    """
+    Save the response of a hazard level in the checkpoint of the run, with
+    the per-sample arrays it wrote into the sample store, if any.
+    """
+    if sample_store is not None:
+        hazard_response = {key: list(value_list)
+                           for key, value_list in hazard_response.items()}
+        for key, value_list in hazard_response.items():
+            value_list[0], value_list[4], value_list[5] = \
+                sample_store.read(key, value_list[6])
+    checkpoint.save(hazard_response)
+
+
+def calculate_sharded_response(hazard_samples, scenario, infrastructure,
+                               checkpoint=None):
+    """
+    Split the samples of each hazard level into shards of
+    SAMPLE_SHARD_SIZE samples, evaluate the shards, on the workers of a
+    parallel backend, and merge the statistics of the shards of each level
+    in the order of the samples.
+
+    The shards and the order they are merged in do not depend on the
+    workers, and the random numbers of a shard only depend on the numbers
+    of its samples, so the results are the same for any number of workers.
+    :param hazard_samples: List of (hazard, number of samples) pairs
+    :param scenario: Parameters for the simulation.
+    :param infrastructure: Model of the infrastructure.
+    :param checkpoint: RunCheckpoint that saves each complete level, if any
+    :return: List of the responses of the hazard levels, as given by
+             calculate_response_for_hazard
+    """
+    check_block_draws(scenario)
+    shard_size = scenario.sample_shard_size
+    shards = [(hazard, num_samples, first_sample,
+               min(shard_size, num_samples - first_sample))
+              for hazard, num_samples in hazard_samples
+              for first_sample in range(0, num_samples, shard_size)]
+    rootLogger.info("{} shards of up to {} samples".format(len(shards),
+                                                          shard_size))
+
+    if not shards:
+        return []
+
+    # the shards of a hazard level follow each other, from its first sample
+    hazards_response = []
+    with create_executor(calculate_sample_shard, scenario,
+                         infrastructure) as executor:
+        for shard, (statistics, kept_chunks) in zip(
+                shards, executor.imap(shards)):
+            hazard, num_samples, first_sample, _ = shard
+            if first_sample == 0:
+                level_statistics = statistics
+                level_chunks = kept_chunks
+            else:
+                level_statistics.merge(statistics)
+                level_chunks.extend(kept_chunks)
+            if first_sample + shard_size >= num_samples:
+                hazard_response = assemble_streamed_response(
+                    hazard, level_statistics, level_chunks, num_samples)
+                if checkpoint is not None:
+                    checkpoint.save(hazard_response)
+                hazards_response.append(hazard_response)
+    return hazards_response
+
+
+def check_block_draws(scenario):
+    """
+    Raise a ValueError unless the sampling method of the scenario draws
+    any block of the samples directly, as the shards of the samples of a
+    hazard level need.
+    """
+    if not SAMPLERS[scenario.sampling_method].draws_blocks:
+        raise ValueError(
+            "SAMPLE_SHARD_SIZE needs a sampling method that draws any block "
+            "of the samples directly, such as 'philox', not '{}'".format(
+                scenario.sampling_method))
+
+
+def calculate_sample_shard(shard, scenario, infrastructure):
+    """
+    Module level function for the map of an executor: accumulate the
+    statistics of a (hazard, number of samples of the level, first sample,
+    number of samples) shard of the samples of a hazard level.
+    """
+    hazard, level_samples, first_sample, num_samples = shard
+    return accumulate_sample_statistics(hazard, scenario, infrastructure,
+                                        level_samples, first_sample,
+                                        num_samples)
+
+
+def compress_damage_states(component_damage_state_ind,
+                           likelihood_weights=None):
+    """
+    Samples with the same damage state of every component have the same
+    response, so only the distinct rows need to be evaluated, each
+    weighted by the number of samples that share it.
+    :param component_damage_state_ind: (samples x components) array of
+                                       damage state indices
+    :param likelihood_weights: Optional likelihood weight of each sample
+    :return: The distinct rows, the index of the first sample of each row,
+             the index of the row of each sample, the weight of each row,
+             and the likelihood weight of each row or None
+    """
+    damage_states, first_sample_index, sample_index_map, \
+        sample_weights = np.unique(
+            component_damage_state_ind,
+            axis=0, return_index=True, return_inverse=True,
+            return_counts=True)
+    rootLogger.info("{} distinct damage state rows in {} samples".format(
+        len(damage_states), len(sample_index_map)))
+    if likelihood_weights is not None:
+        # the likelihood weight only depends on the damage states
+        likelihood_weights = likelihood_weights[first_sample_index]
+        sample_weights = sample_weights * likelihood_weights
+    return damage_states, first_sample_index, sample_index_map, \
+        sample_weights, likelihood_weights
+
+
+def log_hazard_run(hazard, scenario, infrastructure, code_start_time):
+    """
+    Log the statistics of the caches of the infrastructure and the run
+    time of a hazard level.
+    """
+    rootLogger.info("System output cache: {}".format(
+        infrastructure.get_output_cache(scenario.flow_cache_size)))
+    if scenario.reachability_fast_path:
+        rootLogger.info("Reachability fast path: {}".format(
+            infrastructure.get_reachability_engine()))
+    if scenario.cut_set_screening:
+        rootLogger.info("Cut set screening: {}".format(
+            infrastructure.get_cut_set_screen(scenario.cut_set_max_order)))
+
+    # log the elapsed time for this hazard level
+    elapsed = timedelta(seconds=(time.time() - code_start_time))
+    rootLogger.info("Hazard {} run time: {}".format(hazard.hazard_scenario_name,
+                                                    str(elapsed)))
+
+
+def calculate_adaptive_samples(infrastructure, scenario, hazard,
+                               max_samples=None):
+    """
+    Draw and evaluate the samples of a hazard level in blocks, until the
+    confidence intervals of the mean economic loss and of the mean system
+    output, as a fraction of the nominal output, are within the tolerance
+    of the scenario, or the most samples are drawn.
+    The blocks continue the sampler of the hazard level, so with the
+    'random' and 'sobol' methods a run that draws all the samples gives
+    the same results as
+    calculate_expected_damage_state_of_components_for_n_simulations.
+    With 'lhs' each block is a Latin hypercube of its own.
+    :param infrastructure: containing for components
+    :param scenario: Parameters for the scenario
+    :param hazard: Level of the hazard
+    :param max_samples: The most samples to draw. Defaults to the number
+                        of samples of the scenario.
+    :return: The damage state indices of the samples drawn, and their
+             component loss, component functionality, system output and
+             economic loss, as given by calc_output_loss, and their
+             likelihood weights with importance sampling, or None.
+    """
+    if max_samples is None:
+        max_samples = scenario.num_samples
+    sampler = create_hazard_sampler(scenario, hazard)
+    component_pe_ds = infrastructure.get_exceedance_probabilities(hazard)
+    nominal_output = float(infrastructure.get_nominal_output())
+    # the half-width of the confidence interval in standard errors
+    num_std_errors = stats.norm.ppf(0.5 + scenario.adaptive_confidence / 2.0)
+
+    blocks = []
+    num_samples = 0
+    while num_samples < max_samples:
+        block_size = min(scenario.adaptive_block_size,
+                         max_samples - num_samples)
+        rnd = draw_uniform_numbers(sampler, component_pe_ds, block_size,
+                                   scenario)
+        if scenario.importance_sampling:
+            block_damage_states, block_weights = \
+                importance_sample_damage_states(
+                    component_pe_ds, rnd,
+                    scenario.importance_min_exceedance,
+                    scenario.importance_biased_fraction)
+        else:
+            block_damage_states = sample_damage_states(component_pe_ds, rnd)
+            block_weights = None
+        blocks.append((block_damage_states,) +
+                      tuple(infrastructure.calc_output_loss(
+                          scenario, block_damage_states)) +
+                      (block_weights,))
+        num_samples += block_size
+        if num_samples < 2:
+            continue
+
+        economic_loss = np.concatenate([block[4] for block in blocks])
+        output_fraction = np.concatenate(
+            [np.sum(block[3], axis=1) for block in blocks]) / nominal_output
+        if scenario.importance_sampling:
+            # the standard error of a weighted mean is that of the
+            # weighted deviations from it
+            weights = np.concatenate([block[5] for block in blocks])
+            economic_loss = weights * (
+                economic_loss - np.average(economic_loss, weights=weights))
+            output_fraction = weights * (
+                output_fraction - np.average(output_fraction,
+                                             weights=weights))
+        half_width = num_std_errors * max(
+            np.std(economic_loss, ddof=1),
+            np.std(output_fraction, ddof=1)) / np.sqrt(num_samples)
+        if half_width < scenario.adaptive_tolerance:
+            break
+
+    rootLogger.info("Hazard {}: {} samples drawn".format(
+        hazard.hazard_scenario_name, num_samples))
+    block_arrays = list(zip(*blocks))
+    likelihood_weights = np.concatenate(block_arrays[5]) \
+        if scenario.importance_sampling else None
+    return tuple(np.concatenate(arrays) for arrays in block_arrays[:5]) + \
+        (likelihood_weights,)
+
+
+def create_random_state(scenario, hazard):
+    """
+    The random number generator for the samples of a hazard level.
+    :param scenario: Parameters for the scenario
+    :param hazard: Level of the hazard
+    :return: A numpy RandomState
+    """
+    if scenario.run_context and not scenario.common_random_numbers:
+        # TODO check whether to use seed for actual runs or not
+        return np.random.RandomState(seed=hazard.get_seed())
+    # the same random numbers are used for every hazard level
+    return np.random.RandomState(seed=2)
+
+
+def create_stream_key(scenario, hazard):
+    """
+    The key of the counter-based random stream for the samples of a
+    hazard level. As with create_random_state, the hazard levels share
+    one stream in test runs and with common random numbers.
+    :param scenario: Parameters for the scenario
+    :param hazard: Level of the hazard
+    :return: The two 32-bit words of the key
+    """
+    if scenario.run_context and not scenario.common_random_numbers:
+        return stream_key(scenario.random_seed, hazard.hazard_scenario_name)
+    return stream_key(scenario.random_seed)
+
+
+def create_hazard_sampler(scenario, hazard):
+    """
+    The sampler of the uniform numbers for the samples of a hazard level,
+    by the sampling method of the scenario.
+    :param scenario: Parameters for the scenario
+    :param hazard: Level of the hazard
+    :return: A UniformSampler
+    """
+    return create_sampler(scenario.sampling_method,
+                          create_random_state(scenario, hazard),
+                          create_stream_key(scenario, hazard))
+
+
 def calculate_expected_damage_state_of_components_for_n_simulations(
-        infrastructure, scenario, hazard):
+        infrastructure, scenario, hazard, num_samples=None):
     """
     Calculate the probability that being exposed to a hazard level
     will exceed the given damage levels for each component. A monte
@@ -148,87 +866,210 @@ def calculate_expected_damage_state_of_components_for_n_simulations(
     :param infrastructure: containing for components
     :param hazard: Level of the hazard
     :param scenario: Parameters for the scenario
+    :param num_samples: Number of samples to draw. Defaults to the number
+                        of samples of the scenario.
     :return: An array of the probability that each of the damage states
              were exceeded.
     """
-    if scenario.run_context:
-        # TODO check whether to use seed for actual runs or not
-        random_number = np.random.RandomState(seed=hazard.get_seed())
+    if num_samples is None:
+        num_samples = scenario.num_samples
+    sampler = create_hazard_sampler(scenario, hazard)
+    rootLogger.debug("Hazard Intensity {}".format(hazard.hazard_scenario_name))
+
+    # build the (components x damage states) matrix of the probabilities
+    # of exceeding each damage state in one batched evaluation
+    component_pe_ds = infrastructure.get_exceedance_probabilities(hazard)
+    rootLogger.debug("Component pe_ds {}".format(component_pe_ds))
+
+    # create numpy array of uniformly distributed numbers between (0,1),
+    # pseudo-random, stratified or quasi-random by the sampling method
+    rnd = draw_uniform_numbers(sampler, component_pe_ds, num_samples,
+                               scenario)
+
+    return sample_damage_states(component_pe_ds, rnd)
+
+
+def draw_uniform_numbers(sampler, component_pe_ds, num_samples, scenario,
+                         first_sample=None):
+    """
+    Draw the (samples x components) uniform numbers of the samples of a
+    hazard level.
+    With DETERMINISTIC_SATURATION, numbers are only drawn for the
+    components whose damage state is uncertain. Any number gives a
+    saturated component its certain damage state, so they are set to 0.5.
+    With common random numbers every component keeps its own numbers
+    from one hazard level to the next, so all of them are drawn.
+    :param sampler: The UniformSampler of the hazard level
+    :param component_pe_ds: (components x damage states) array of the
+                            probabilities of exceeding each damage state
+    :param num_samples: Number of samples to draw
+    :param scenario: Parameters for the scenario
+    :param first_sample: Number of the first sample, to draw a block of
+                         the samples directly with the uniform_block of the
+                         sampler. By default the draw continues from the
+                         previous one.
+    """
+    if first_sample is None:
+        draw = sampler.uniform
     else:
-        # seeding was not used
-        random_number = np.random.RandomState(seed=2)
+        def draw(num_samples, num_dimensions):
+            return sampler.uniform_block(first_sample, num_samples,
+                                         num_dimensions)
+    number_of_components = component_pe_ds.shape[0]
+    if not scenario.deterministic_saturation or \
+            scenario.common_random_numbers:
+        return draw(num_samples, number_of_components)
+    random_components = ~saturated_damage_states(component_pe_ds)[0]
+    rnd = np.full((num_samples, number_of_components), 0.5)
+    if np.any(random_components):
+        rnd[:, random_components] = draw(
+            num_samples, int(np.sum(random_components)))
+    return rnd
+
 
-    # record the number of component in infrastructure
-    number_of_components = len(infrastructure.components)
+def saturated_damage_states(component_pe_ds):
+    """
+    Find the components whose damage state is certain at a hazard level,
+    because the probability of exceeding each of their damage states is
+    either 0 or 1.
+    :param component_pe_ds: (components x damage states) array of the
+                            probabilities of exceeding each damage state
+    :return: Boolean array, True for the saturated components, and the
+             damage state index of each component when it is saturated
+    """
+    exceeded = component_pe_ds >= 1.0
+    # the damage states a component does not have are NaN or -inf
+    saturated = np.all(exceeded | ~(component_pe_ds > 0.0), axis=1)
+    return saturated, np.sum(exceeded, axis=1)
 
-    # construct a zeroed numpy array that can contain the number of samples
-    # for each element.
-    component_damage_state_ind = np.zeros(
-        (scenario.num_samples, number_of_components), dtype=int)
 
-    # create numpy array of uniformly distributed random numbers between (0,1)
-    rnd = random_number.uniform(
-        size=(scenario.num_samples, number_of_components))
-    rootLogger.debug("Hazard Intensity {}".format(hazard.hazard_scenario_name))
+def calculate_importance_samples(infrastructure, scenario, hazard,
+                                 num_samples=None):
+    """
+    Sample the damage states of the components for a hazard level with
+    importance sampling, see importance_sample_damage_states.
+    :param infrastructure: containing for components
+    :param scenario: Parameters for the scenario
+    :param hazard: Level of the hazard
+    :param num_samples: Number of samples to draw. Defaults to the number
+                        of samples of the scenario.
+    :return: The damage state indices of the samples, and the likelihood
+             weight of each sample
+    """
+    if num_samples is None:
+        num_samples = scenario.num_samples
+    sampler = create_hazard_sampler(scenario, hazard)
+    component_pe_ds = infrastructure.get_exceedance_probabilities(hazard)
+    rnd = draw_uniform_numbers(sampler, component_pe_ds, num_samples,
+                               scenario)
+    return importance_sample_damage_states(
+        component_pe_ds, rnd, scenario.importance_min_exceedance,
+        scenario.importance_biased_fraction)
 
-    # iterate through the components
-    for index, component_key in enumerate(
-            sorted(infrastructure.components.keys())):
-        component = infrastructure.components[component_key]
-        # use the components expose_to method to retrieve the probabilities
-        # of this hazard level exceeding each of the components damage levels
-
-        rootLogger.info(
-            "Start calculating probability of component in a damage state.")
-
-        # create numpy array of length equal to the number of
-        # damage states for the component
-        component_pe_ds = np.zeros(len(component.damage_states))
-
-        # iterate through each damage state for the component
-        for damage_state_index in component.damage_states.keys():
-            # find the hazard intensity component is exposed too
-            longitude, latitude = component.get_location()
-            hazard_intensity = hazard.get_hazard_intensity_at_location(
-                longitude, latitude)
-
-            #
-            component_pe_ds[damage_state_index] = \
-                component.damage_states[damage_state_index].response_function(
-                    hazard_intensity)
-
-        # Drop the default state (DS0 None) because its response will
-        # always be zero which will be always be greater than random variable
-        component_pe_ds = component_pe_ds[1:]
-
-        rootLogger.info("Calculate System Response")
-        rootLogger.info("Component {} : pe_ds {}". \
-                        format(component.component_id, component_pe_ds))
-
-        # This little piece of numpy magic calculates the damage level by
-        # summing how many damage states were exceeded.
-        #
-        # Unpacking the calculation:
-        # component_pe_ds is usually something like [0.01, 0.12, 0.21, 0.33]
-        # rnd[:, index] gives the random numbers created for this component
-        # with the first axis (denoted by :) containing the samples for this
-        # hazard intensity. The [:, np.newaxis] broadcasts each
-        # random number across the supplied component_pe_ds.
-        #
-        # LINK:
-        # https://docs.scipy.org/doc/numpy-1.13.0/user/basics.broadcasting.html
-        #
-        # If the last two numbers in component_pe_ds are greater than the
-        # sample number, the comparison > will return:
-        #       [False, False, True, True]
-        # The np.sum will convert this to [0, 0, 1, 1] and return 2.
-        #
-        # This is the resulting damage level.
-        # This will complete the comparison for all of the samples
-        # for this component.
-
-        component_pe_ds[np.isnan(component_pe_ds)] = -np.inf
-        component_damage_state_ind[:, index] = \
-            np.sum(component_pe_ds > rnd[:, index][:, np.newaxis], axis=1)
+
+def importance_sample_damage_states(component_pe_ds, rnd, min_exceedance,
+                                    biased_fraction, num_biased_samples=None):
+    """
+    Assign a damage state to every component for every sample, with the
+    last biased_fraction of the samples drawn from a proposal that
+    damages the components more often.
+
+    In the proposal, a component that can be damaged at all is damaged
+    with a probability of at least min_exceedance, and once damaged its
+    damage state has the same distribution as before. The other samples
+    are drawn as in sample_damage_states. The two sets of samples are
+    combined as a mixture, so each sample is weighted by the likelihood
+    ratio of the damage state probabilities to the mixture
+        1 / ((1 - biased_fraction) + biased_fraction * proposal / nominal)
+    which is at most 1 / (1 - biased_fraction). The weighted means of the
+    responses are then estimates of the means under the damage state
+    probabilities, with more of the samples in the rare, highly damaged
+    states.
+    :param component_pe_ds: (components x damage states) array of the
+                            probabilities of exceeding each damage state
+    :param rnd: (samples x components) array of uniform random numbers
+    :param min_exceedance: The least probability of damage to a component
+                           in the proposal, below one
+    :param biased_fraction: The fraction of the samples drawn from the
+                            proposal, below one
+    :param num_biased_samples: Number of the last samples that are drawn
+                               from the proposal, when rnd is a chunk of
+                               the samples. Defaults to the biased_fraction
+                               of the samples.
+    :return: (samples x components) array of damage state indices, and
+             the likelihood weight of each sample
+    """
+    num_samples = rnd.shape[0]
+    # the probability of any damage to each component, and in the proposal
+    pe_damage = np.max(np.where(np.isnan(component_pe_ds), 0.0,
+                                component_pe_ds), axis=1)
+    pe_proposal = np.where(pe_damage > 0,
+                           np.maximum(pe_damage, min_exceedance), 0.0)
+    biased = pe_proposal > pe_damage
+
+    # a component is damaged when its uniform number is below pe_damage.
+    # In the proposal, a fraction pe_proposal of the numbers is mapped
+    # into [0, pe_damage) and the rest into [pe_damage, 1)
+    lower_scale = np.ones(len(pe_damage))
+    upper_scale = np.ones(len(pe_damage))
+    lower_scale[biased] = pe_damage[biased] / pe_proposal[biased]
+    upper_scale[biased] = \
+        (1.0 - pe_damage[biased]) / (1.0 - pe_proposal[biased])
+    if num_biased_samples is None:
+        num_biased_samples = int(round(biased_fraction * num_samples))
+    first_biased_sample = num_samples - num_biased_samples
+    rnd = rnd.copy()
+    proposal_rnd = rnd[first_biased_sample:]
+    rnd[first_biased_sample:] = np.where(
+        biased & (proposal_rnd < pe_proposal),
+        proposal_rnd * lower_scale,
+        np.where(biased,
+                 pe_damage + (proposal_rnd - pe_proposal) * upper_scale,
+                 proposal_rnd))
+    component_damage_state_ind = sample_damage_states(component_pe_ds, rnd)
+
+    # the log of the ratio of the proposal to the nominal probability of
+    # the damage of each component, which is one for the unbiased ones
+    damaged = component_damage_state_ind > 0
+    log_damaged_ratio = np.zeros(len(pe_damage))
+    log_undamaged_ratio = np.zeros(len(pe_damage))
+    log_damaged_ratio[biased] = -np.log(lower_scale[biased])
+    log_undamaged_ratio[biased] = -np.log(upper_scale[biased])
+    log_ratio = np.sum(np.where(damaged, log_damaged_ratio,
+                                log_undamaged_ratio), axis=1)
+    with np.errstate(over='ignore'):
+        likelihood_weights = 1.0 / ((1.0 - biased_fraction) +
+                                    biased_fraction * np.exp(log_ratio))
+    return component_damage_state_ind, likelihood_weights
+
+
+def sample_damage_states(component_pe_ds, rnd):
+    """
+    Assign a damage state to every component for every sample.
+    :param component_pe_ds: (components x damage states) array of the
+                            probabilities of exceeding each damage state
+    :param rnd: (samples x components) array of uniform random numbers
+    :return: (samples x components) array of damage state indices
+    """
+    # This little piece of numpy magic calculates the damage level by
+    # summing how many damage states were exceeded.
+    #
+    # Unpacking the calculation:
+    # component_pe_ds[:, ds_index] is the probability of each component
+    # exceeding the damage state, e.g. [0.01, 0.12, 0.21, 0.33]. It is
+    # broadcast across the samples (the first axis of rnd), so one
+    # comparison covers every component of every sample.
+    #
+    # LINK:
+    # https://docs.scipy.org/doc/numpy-1.13.0/user/basics.broadcasting.html
+    #
+    # If the exceedance probabilities of the last two damage states of a
+    # component are greater than its random number, the comparisons over
+    # the damage states will return:
+    #       [False, False, True, True]
+    # Summing these gives [0, 0, 1, 1] -> 2, the resulting damage level.
+    component_damage_state_ind = np.zeros(rnd.shape, dtype=int)
+    for ds_index in range(component_pe_ds.shape[1]):
+        component_damage_state_ind += component_pe_ds[:, ds_index] > rnd
 
     return component_damage_state_ind
@@ -0,0 +1,215 @@
+import numpy as np
+
+# bits of each number of the sequence, and so the most points it holds
+SOBOL_BITS = 32
+# the seed of the initial direction numbers of the dimensions after those
+# of BRATLEY_FOX_NUMBERS
+DIRECTION_SEED = 20180419
+
+# The primitive polynomials and the initial direction numbers m_1 .. m_degree
+# of the dimensions 2 .. 40 of Bratley and Fox (1988), "Algorithm 659:
+# Implementing Sobol's quasirandom sequence generator"
+BRATLEY_FOX_NUMBERS = [
+    (3, [1]), (7, [1, 1]), (11, [1, 3, 7]), (13, [1, 1, 5]),
+    (19, [1, 3, 1, 1]), (25, [1, 1, 3, 7]), (37, [1, 3, 3, 9, 9]),
+    (59, [1, 3, 7, 13, 3]), (47, [1, 1, 5, 11, 27]),
+    (61, [1, 3, 5, 1, 15]), (55, [1, 1, 7, 3, 29]),
+    (41, [1, 3, 7, 7, 21]), (67, [1, 1, 1, 9, 23, 37]),
+    (97, [1, 3, 3, 5, 19, 33]), (91, [1, 1, 3, 13, 11, 7]),
+    (109, [1, 1, 7, 13, 25, 5]), (103, [1, 3, 5, 11, 7, 11]),
+    (115, [1, 1, 1, 3, 13, 39]), (131, [1, 3, 1, 15, 17, 63, 13]),
+    (193, [1, 1, 5, 5, 1, 27, 33]), (137, [1, 3, 3, 3, 25, 17, 115]),
+    (145, [1, 1, 3, 15, 29, 15, 41]), (143, [1, 3, 1, 7, 3, 23, 79]),
+    (241, [1, 3, 7, 9, 31, 29, 17]), (157, [1, 1, 5, 13, 11, 3, 29]),
+    (185, [1, 3, 1, 9, 5, 21, 119]), (167, [1, 1, 3, 1, 23, 13, 75]),
+    (229, [1, 3, 3, 11, 27, 31, 73]), (171, [1, 1, 7, 7, 19, 25, 105]),
+    (213, [1, 3, 5, 5, 21, 9, 7]), (191, [1, 1, 1, 15, 5, 49, 59]),
+    (253, [1, 1, 1, 1, 1, 33, 65]), (203, [1, 3, 5, 15, 17, 19, 21]),
+    (211, [1, 1, 7, 11, 13, 29, 3]), (239, [1, 3, 7, 5, 7, 11, 113]),
+    (247, [1, 1, 5, 3, 15, 19, 61]), (285, [1, 3, 1, 1, 9, 27, 89, 7]),
+    (369, [1, 1, 3, 7, 31, 15, 45, 23]),
+    (299, [1, 3, 3, 9, 9, 25, 107, 39])]
+
+
+def _polynomial_mod(value, modulus):
+    """Remainder of the GF(2) polynomial value, divided by modulus."""
+    degree = modulus.bit_length() - 1
+    while value.bit_length() - 1 >= degree:
+        value ^= modulus << (value.bit_length() - 1 - degree)
+    return value
+
+
+def _power_of_x(exponent, modulus):
+    """x ** exponent modulo a GF(2) polynomial."""
+    result, base = 1, _polynomial_mod(2, modulus)
+    while exponent:
+        if exponent & 1:
+            result = _polynomial_mod(_multiply(result, base), modulus)
+        base = _polynomial_mod(_multiply(base, base), modulus)
+        exponent >>= 1
+    return result
+
+
+def _multiply(first, second):
+    """Product of two GF(2) polynomials."""
+    product = 0
+    while second:
+        if second & 1:
+            product ^= first
+        first <<= 1
+        second >>= 1
+    return product
+
+
+def _prime_factors(number):
+    factors = set()
+    factor = 2
+    while factor * factor <= number:
+        while number % factor == 0:
+            factors.add(factor)
+            number //= factor
+        factor += 1
+    if number > 1:
+        factors.add(number)
+    return factors
+
+
+def is_primitive(polynomial):
+    """
+    Whether a GF(2) polynomial, as the bits of an integer, is primitive:
+    x has the largest possible order, 2 ** degree - 1, modulo it.
+    """
+    degree = polynomial.bit_length() - 1
+    if degree < 1 or not polynomial & 1:
+        return False
+    order = 2 ** degree - 1
+    return _power_of_x(order, polynomial) == 1 and all(
+        _power_of_x(order // factor, polynomial) != 1
+        for factor in _prime_factors(order))
+
+
+_primitive_polynomials = []
+
+
+def primitive_polynomials(count):
+    """
+    :return: The first count primitive GF(2) polynomials, by degree and
+             then by value
+    """
+    candidate = _primitive_polynomials[-1] + 1 \
+        if _primitive_polynomials else 2
+    while len(_primitive_polynomials) < count:
+        if is_primitive(candidate):
+            _primitive_polynomials.append(candidate)
+        candidate += 1
+    return _primitive_polynomials[:count]
+
+
+def direction_numbers(num_dimensions):
+    """
+    The direction numbers of the Sobol sequence of Bratley and Fox (1988).
+    The first dimension is the van der Corput sequence, and each of the
+    others has a primitive polynomial of its own. The dimensions after
+    those of BRATLEY_FOX_NUMBERS take the next primitive polynomials, with
+    odd initial direction numbers drawn with DIRECTION_SEED, so any number
+    of dimensions is supported. These keep the stratification of a Sobol
+    sequence in each dimension, but not the uniformity of the tabulated
+    dimensions in their two dimensional projections.
+    :return: (SOBOL_BITS x dimensions) array of the np.uint64 direction
+             numbers, as SOBOL_BITS bit fractions
+    """
+    tabulated = [polynomial for polynomial, _ in BRATLEY_FOX_NUMBERS]
+    drawn = [polynomial for polynomial in primitive_polynomials(
+        max(num_dimensions - 1, 0) + len(tabulated))
+        if polynomial not in tabulated]
+    random_state = np.random.RandomState(DIRECTION_SEED)
+    directions = np.zeros((SOBOL_BITS, num_dimensions), dtype=np.uint64)
+    directions[:, 0] = 1
+    for dimension in range(1, num_dimensions):
+        if dimension <= len(BRATLEY_FOX_NUMBERS):
+            polynomial, m = BRATLEY_FOX_NUMBERS[dimension - 1]
+            m = list(m)
+        else:
+            polynomial = drawn[dimension - 1 - len(BRATLEY_FOX_NUMBERS)]
+            # odd initial numbers m_k < 2 ** k
+            m = [2 * random_state.randint(0, 2 ** (k - 1)) + 1
+                 for k in range(1, polynomial.bit_length())]
+        degree = polynomial.bit_length() - 1
+        for k in range(degree, SOBOL_BITS):
+            value = m[k - degree] ^ (m[k - degree] << degree)
+            for bit in range(1, degree):
+                if (polynomial >> (degree - bit)) & 1:
+                    value ^= m[k - bit] << bit
+            m.append(value)
+        directions[:, dimension] = m[:SOBOL_BITS]
+    shifts = np.arange(SOBOL_BITS - 1, -1, -1, dtype=np.uint64)
+    return directions << shifts[:, np.newaxis]
+
+
+def _parity(words):
+    for shift in (32, 16, 8, 4, 2, 1):
+        words = words ^ (words >> np.uint64(shift))
+    return words & np.uint64(1)
+
+
+class ScrambledSobolSequence(object):
+    """
+    A Sobol sequence with the linear matrix scramble and the digital
+    shift of Matousek (1998), "On the L2-discrepancy for anchored boxes".
+    The scramble keeps the stratification of the sequence: the first
+    2 ** m points of each dimension hold one point in each interval of
+    length 2 ** -m. Any block of the points is calculated directly.
+    """
+
+    def __init__(self, num_dimensions, random_state):
+        """
+        :param num_dimensions: Number of numbers in each point
+        :param random_state: The numpy RandomState of the scramble
+        """
+        self.num_dimensions = num_dimensions
+        directions = direction_numbers(num_dimensions)
+        # a lower triangular matrix with a unit diagonal for each dimension,
+        # as rows of bits from the most significant bit down
+        lower = np.tril(random_state.randint(
+            0, 2, size=(num_dimensions, SOBOL_BITS, SOBOL_BITS)), -1)
+        lower[:, np.arange(SOBOL_BITS), np.arange(SOBOL_BITS)] = 1
+        bit_values = np.uint64(1) << np.arange(
+            SOBOL_BITS - 1, -1, -1, dtype=np.uint64)
+        rows = np.sum(lower.astype(np.uint64) * bit_values, axis=2,
+                      dtype=np.uint64)
+        # each bit of a scrambled direction number is the parity of a row
+        # of the matrix and the bits of the direction number
+        self.directions = np.zeros_like(directions)
+        for row in range(SOBOL_BITS):
+            self.directions |= _parity(
+                directions & rows[np.newaxis, :, row]) << (
+                    np.uint64(SOBOL_BITS - 1 - row))
+        self.shift = random_state.randint(
+            0, 2 ** SOBOL_BITS, size=num_dimensions,
+            dtype=np.int64).astype(np.uint64)
+
+    def points(self, first_point, num_points):
+        """
+        :return: (points x dimensions) array of the numbers in [0, 1) of
+                 the points first_point .. first_point + num_points - 1
+        """
+        if first_point + num_points > 2 ** SOBOL_BITS:
+            raise ValueError("A Sobol sequence holds at most 2 ** {} "
+                             "points".format(SOBOL_BITS))
+        if num_points == 0:
+            return np.zeros((0, self.num_dimensions))
+        # the points are in the Gray code order of Antonov and Saleev
+        # (1979): the point after i differs from it by the direction number
+        # of the lowest set bit of i + 1
+        start = self.shift.copy()
+        gray_code = first_point ^ (first_point >> 1)
+        for bit in range(int(gray_code).bit_length()):
+            if (gray_code >> bit) & 1:
+                start ^= self.directions[bit]
+        indices = np.arange(first_point + 1, first_point + num_points,
+                            dtype=np.int64)
+        lowest_bits = np.log2(indices & -indices).astype(int)
+        words = np.bitwise_xor.accumulate(
+            np.vstack([start[np.newaxis], self.directions[lowest_bits]]),
+            axis=0)
+        return words / float(2 ** SOBOL_BITS)
@@ -0,0 +1,140 @@
+import os
+import unittest
+import numpy as np
+from sifra.logger import rootLogger, logging
+from sifra.configuration import Configuration
+from sifra.scenario import Scenario
+from sifra.modelling.hazard import HazardsContainer
+from sifra.model_ingest import ingest_model
+from sifra.accumulators import RunningMoments, WeightedHistogram
+from sifra.simulation import calculate_response_for_hazard, \
+    accumulate_sample_statistics
+rootLogger.set_log_level(logging.CRITICAL)
+
+
+class TestRunningMoments(unittest.TestCase):
+
+    def setUp(self):
+        random_state = np.random.RandomState(seed=3)
+        self.values = random_state.lognormal(size=(300, 4))
+        self.weights = random_state.uniform(0.5, 2.0, size=300)
+
+    def test_blocks_match_the_whole_array(self):
+        moments = RunningMoments(4)
+        for first_sample in range(0, 300, 70):
+            moments.add(self.values[first_sample:first_sample + 70])
+        self.assertTrue(np.allclose(moments.mean,
+                                    np.mean(self.values, axis=0)))
+        self.assertTrue(np.allclose(moments.std,
+                                    np.std(self.values, axis=0)))
+
+    def test_weighted_blocks_and_merge(self):
+        first = RunningMoments(4)
+        first.add(self.values[:100], self.weights[:100])
+        second = RunningMoments(4)
+        second.add(self.values[100:], self.weights[100:])
+        first.merge(second)
+        mean = np.average(self.values, axis=0, weights=self.weights)
+        variance = np.average((self.values - mean) ** 2, axis=0,
+                              weights=self.weights)
+        self.assertAlmostEqual(first.total_weight, np.sum(self.weights))
+        self.assertTrue(np.allclose(first.mean, mean))
+        self.assertTrue(np.allclose(first.variance, variance))
+
+    def test_histogram_exceedance(self):
+        histogram = WeightedHistogram(4)
+        histogram.add(np.array([0, 1, 1, 3]), np.array([1.0, 2.0, 1.0, 4.0]))
+        self.assertEqual(histogram.exceedance(0), 1.0)
+        self.assertEqual(histogram.exceedance(2), 0.5)
+        self.assertEqual(histogram.exceedance(4), 0.0)
+
+
+class TestStreamingResponse(unittest.TestCase):
+
+    def setUp(self):
+        root_dir = os.path.dirname(os.path.abspath(__file__))
+        config = Configuration(os.path.join(
+            root_dir, "simulation_setup",
+            "test_scenario_pscoal_test_case.json"))
+        self.scenario = Scenario(config)
+        self.hazards = HazardsContainer(config)
+        self.infrastructure = ingest_model(config)
+        self.scenario.num_samples = 250
+
+    def test_streamed_statistics_match_the_full_response(self):
+        for compress_samples in (False, True):
+            self.scenario.compress_samples = compress_samples
+            for hazard in self.hazards.listOfhazards:
+                name = hazard.hazard_scenario_name
+                self.scenario.stream_chunk_size = 0
+                full = calculate_response_for_hazard(
+                    hazard, self.scenario, self.infrastructure)[name]
+                self.scenario.stream_chunk_size = 60
+                self.scenario.save_vars_npy = False
+                streamed = calculate_response_for_hazard(
+                    hazard, self.scenario, self.infrastructure)[name]
+
+                # no per-sample arrays are kept
+                self.assertIsNone(streamed[0])
+                self.assertIsNone(streamed[5])
+                self.assertEqual(streamed[6], 250)
+                for list_number in (1, 2, 3):
+                    for key, value in full[list_number].items():
+                        self.assertAlmostEqual(
+                            streamed[list_number][key], value, places=9)
+                statistics = streamed[8]
+                economic_loss = np.asarray(full[5])
+                self.assertAlmostEqual(statistics.economic_loss.mean[0],
+                                       np.mean(economic_loss))
+                bounds = self.infrastructure.get_dmg_scale_bounds(
+                    self.scenario)
+                self.assertAlmostEqual(
+                    statistics.system_damage.exceedance(2),
+                    np.mean(np.sum(economic_loss[:, np.newaxis] > bounds,
+                                   axis=1) >= 2))
+
+    def test_merged_blocks_match_one_block(self):
+        self.scenario.sampling_method = 'philox'
+        hazard = self.hazards.listOfhazards[3]
+        whole, _ = accumulate_sample_statistics(
+            hazard, self.scenario, self.infrastructure, 250)
+        merged, _ = accumulate_sample_statistics(
+            hazard, self.scenario, self.infrastructure, 250, 0, 100)
+        for first_sample in (100, 180):
+            block, _ = accumulate_sample_statistics(
+                hazard, self.scenario, self.infrastructure, 250,
+                first_sample, min(80, 250 - first_sample))
+            merged.merge(block)
+        self.assertEqual(merged.economic_loss.total_weight, 250)
+        self.assertTrue(np.array_equal(merged.system_damage.counts,
+                                       whole.system_damage.counts))
+        merged_response = merged.component_response()
+        for whole_dict, merged_dict in zip(whole.component_response(),
+                                           merged_response):
+            for key, value in whole_dict.items():
+                self.assertAlmostEqual(merged_dict[key], value, places=9)
+
+    def test_blocks_need_a_sampler_that_draws_blocks(self):
+        self.scenario.sampling_method = 'lhs'
+        with self.assertRaises(ValueError):
+            accumulate_sample_statistics(
+                self.hazards.listOfhazards[3], self.scenario,
+                self.infrastructure, 250, 100, 80)
+
+    def test_kept_samples_are_the_same(self):
+        hazard = self.hazards.listOfhazards[3]
+        name = hazard.hazard_scenario_name
+        self.scenario.stream_chunk_size = 0
+        full = calculate_response_for_hazard(
+            hazard, self.scenario, self.infrastructure)[name]
+        self.scenario.stream_chunk_size = 60
+        self.scenario.save_vars_npy = True
+        streamed = calculate_response_for_hazard(
+            hazard, self.scenario, self.infrastructure)[name]
+        self.assertTrue(np.array_equal(streamed[0], full[0]))
+        self.assertTrue(np.allclose(streamed[4], full[4]))
+        self.assertTrue(np.allclose(streamed[5], full[5]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from sifra.logger import rootLogger, logging
+from sifra.configuration import Configuration
+from sifra.scenario import Scenario
+from sifra.modelling.hazard import HazardsContainer
+from sifra.model_ingest import ingest_model
+from sifra.simulation import calculate_response
+rootLogger.set_log_level(logging.CRITICAL)
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        root_dir = os.path.dirname(os.path.abspath(__file__))
+        self.config = Configuration(os.path.join(
+            root_dir, "simulation_setup",
+            "test_scenario_pscoal_test_case.json"))
+        self.hazards = HazardsContainer(self.config)
+        self.infrastructure = ingest_model(self.config)
+        self.raw_output_dir = tempfile.mkdtemp()
+        self.checkpoint_dir = os.path.join(self.raw_output_dir, 'checkpoint')
+
+    def tearDown(self):
+        shutil.rmtree(self.raw_output_dir, ignore_errors=True)
+
+    def run_scenario(self, **switches):
+        scenario = Scenario(self.config)
+        scenario.num_samples = 60
+        scenario.raw_output_dir = self.raw_output_dir
+        for name, value in switches.items():
+            setattr(scenario, name, value)
+        return calculate_response(self.hazards, scenario,
+                                  self.infrastructure)
+
+    def stop_part_way(self):
+        # a run that stopped part way keeps the levels saved before it
+        saved = sorted(name for name in os.listdir(self.checkpoint_dir)
+                       if name.startswith('hazard_'))
+        self.assertEqual(len(saved), len(self.hazards.listOfhazards))
+        for name in saved[::2]:
+            os.remove(os.path.join(self.checkpoint_dir, name))
+        return saved
+
+    def assert_same_response(self, resumed, complete):
+        for list_number in (1, 2, 3, 6):
+            self.assertEqual(resumed[list_number], complete[list_number])
+        for hazard_name, damage_states in complete[0].items():
+            self.assertTrue(np.array_equal(np.asarray(resumed[0][hazard_name]),
+                                           np.asarray(damage_states)))
+        self.assertTrue(np.array_equal(resumed[4], complete[4]))
+        self.assertTrue(np.array_equal(resumed[5], complete[5]))
+
+    def test_resumed_run_matches_the_complete_run(self):
+        complete = self.run_scenario(checkpoint=True)
+        saved = self.stop_part_way()
+        kept = os.path.join(self.checkpoint_dir, saved[1])
+        kept_time = os.path.getmtime(kept)
+        resumed = self.run_scenario(resume=True)
+        self.assert_same_response(resumed, complete)
+        # the saved levels are not calculated again
+        self.assertEqual(os.path.getmtime(kept), kept_time)
+        self.assertEqual(sorted(name for name in os.listdir(
+            self.checkpoint_dir) if name.startswith('hazard_')), saved)
+
+    def test_resume_with_workers_and_shared_arrays(self):
+        complete = self.run_scenario(checkpoint=True)
+        self.stop_part_way()
+        resumed = self.run_scenario(resume=True, run_parallel_proc=1,
+                                    num_workers=2, shared_sample_arrays=True)
+        self.assert_same_response(resumed, complete)
+
+    def test_resume_sharded_run(self):
+        switches = dict(sampling_method='philox', sample_shard_size=25,
+                        save_vars_npy=False)
+        complete = self.run_scenario(checkpoint=True, **switches)
+        self.stop_part_way()
+        resumed = self.run_scenario(resume=True, **switches)
+        for list_number in (1, 2, 3, 6):
+            self.assertEqual(resumed[list_number], complete[list_number])
+
+    def test_other_manifest_is_not_resumed(self):
+        self.run_scenario(checkpoint=True)
+        with self.assertRaises(ValueError):
+            self.run_scenario(resume=True, num_samples=80)
+
+    def test_changed_hazard_is_not_resumed(self):
+        self.run_scenario(checkpoint=True)
+        # the same hazard levels, with another intensity for one of them
+        self.hazards = HazardsContainer(self.config)
+        location = self.hazards.listOfhazards[2].scenario_hazard_data[0]
+        location['hazard_intensity'] = \
+            float(location['hazard_intensity']) + 0.1
+        with self.assertRaises(ValueError):
+            self.run_scenario(resume=True)
+
+    def test_resume_streamed_run_with_shared_arrays(self):
+        switches = dict(stream_chunk_size=25, save_vars_npy=False,
+                        run_parallel_proc=1, num_workers=2,
+                        shared_sample_arrays=True)
+        complete = self.run_scenario(checkpoint=True, **switches)
+        self.stop_part_way()
+        resumed = self.run_scenario(resume=True, **switches)
+        self.assertIsNone(resumed[4])
+        for list_number in (1, 2, 3, 6):
+            self.assertEqual(resumed[list_number], complete[list_number])
+
+
+if __name__ == '__main__':
+    unittest.main()
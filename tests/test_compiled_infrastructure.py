@@ -0,0 +1,107 @@
+import os
+import pickle
+import unittest
+import numpy as np
+from sifra.logger import rootLogger, logging
+from sifra.configuration import Configuration
+from sifra.model_ingest import ingest_model
+from sifra.modelling.component_graph import ComponentGraph
+rootLogger.set_log_level(logging.CRITICAL)
+
+
+class TestCompiledInfrastructure(unittest.TestCase):
+
+    def setUp(self):
+        root_dir = os.path.dirname(os.path.abspath(__file__))
+        config = Configuration(os.path.join(
+            root_dir, "simulation_setup", "test_scenario_ss_230kv.json"))
+        self.infrastructure = ingest_model(config)
+        self.compiled = self.infrastructure.compile()
+
+    def test_compile_is_cached(self):
+        self.assertIs(self.infrastructure.compile(), self.compiled)
+
+    def test_component_order_and_tables(self):
+        components = self.infrastructure.components
+        self.assertEqual(list(self.compiled.component_ids),
+                         sorted(components.keys()))
+        for comp_index, comp_id in enumerate(self.compiled.component_ids):
+            component = components[comp_id]
+            self.assertEqual(self.compiled.num_damage_states[comp_index],
+                             len(component.damage_states))
+            for ds_index, damage_state in component.damage_states.items():
+                self.assertEqual(
+                    self.compiled.ds_loss[comp_index, ds_index],
+                    damage_state.damage_ratio * component.cost_fraction)
+                self.assertEqual(
+                    self.compiled.ds_functionality[comp_index, ds_index],
+                    damage_state.functionality)
+
+    def test_adjacency_matches_destination_components(self):
+        compiled = self.compiled
+        for comp_index, comp_id in enumerate(compiled.component_ids):
+            row = slice(compiled.adjacency_indptr[comp_index],
+                        compiled.adjacency_indptr[comp_index + 1])
+            children = [compiled.component_ids[i]
+                        for i in compiled.adjacency_indices[row]]
+            self.assertEqual(
+                sorted(children),
+                sorted(self.infrastructure.components[comp_id].
+                       destination_components.keys()))
+            edges = compiled.adjacency_edges[row]
+            self.assertTrue(np.all(compiled.edge_parent[edges] == comp_index))
+
+    def test_arrays_are_read_only_after_pickling(self):
+        compiled = pickle.loads(pickle.dumps(self.compiled, protocol=2))
+        self.assertEqual(compiled.component_ids, self.compiled.component_ids)
+        self.assertTrue(np.array_equal(compiled.ds_loss, self.compiled.ds_loss))
+        with self.assertRaises(ValueError):
+            compiled.ds_loss[0, 0] = 1.0
+        with self.assertRaises(ValueError):
+            compiled.type_indices.values()[0][0] = 1
+
+    def test_edges_follow_the_graph_of_a_pickled_model(self):
+        # the destination dicts of this model iterate in another order
+        # once restored, while its component graph keeps the edge order
+        root_dir = os.path.dirname(os.path.abspath(__file__))
+        config = Configuration(os.path.join(
+            root_dir, "simulation_setup", "test_scenario_pwtp_400ML.json"))
+        infrastructure = pickle.loads(
+            pickle.dumps(ingest_model(config), protocol=2))
+        compiled = infrastructure.compile()
+        component_graph = infrastructure._component_graph
+        self.assertTrue(np.array_equal(compiled.edge_parent,
+                                       component_graph.edge_parent))
+        self.assertTrue(np.array_equal(compiled.edge_child,
+                                       component_graph.edge_child))
+
+
+class TestDependencyPropagation(unittest.TestCase):
+
+    def test_matches_sample_by_sample_capacity_updates(self):
+        root_dir = os.path.dirname(os.path.abspath(__file__))
+        random_state = np.random.RandomState(seed=2)
+        for setup_file_name in ("test_scenario_simple_linear_dep.json",
+                                "test_scenario_pwtp_400ML.json",
+                                "test_scenario_ss_230kv.json"):
+            infrastructure = ingest_model(Configuration(os.path.join(
+                root_dir, "simulation_setup", setup_file_name)))
+            compiled = infrastructure.compile()
+            comp_sample_func = random_state.choice(
+                [0.0, 0.25, 0.5, 1.0], size=(50, compiled.num_components))
+
+            functionality, edge_capacity = \
+                compiled.propagate_dependencies(comp_sample_func)
+
+            graph = ComponentGraph(infrastructure.components)
+            for sample_index, sample_func in enumerate(comp_sample_func):
+                sample_func = sample_func.copy()
+                graph.update_capacity(infrastructure.components, sample_func)
+                self.assertTrue(np.array_equal(
+                    functionality[sample_index], sample_func))
+                self.assertTrue(np.array_equal(
+                    edge_capacity[sample_index], graph.edge_capacity))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import os
+import time
+import unittest
+import numpy as np
+from sifra.logger import rootLogger, logging
+from sifra.configuration import Configuration
+from sifra.model_ingest import ingest_model
+from sifra.modelling.component_graph import ComponentGraph
+rootLogger.set_log_level(logging.CRITICAL)
+
+
+def update_capacity_by_edge(components, comp_sample_func):
+    """
+    The edge capacities from visiting the edges one at a time, updating
+    the dependent components as they are reached.
+    """
+    id_index_map = {comp_id: comp_index for comp_index, comp_id
+                    in enumerate(sorted(components.keys()))}
+    edge_capacity = []
+    for comp_id, component in components.items():
+        comp_index = id_index_map[comp_id]
+        for dest_comp_id in component.destination_components.keys():
+            dest_index = id_index_map[dest_comp_id]
+            if component.node_type == 'dependency':
+                comp_sample_func[dest_index] = min(
+                    comp_sample_func[comp_index], comp_sample_func[dest_index])
+            edge_capacity.append(comp_sample_func[comp_index])
+    return np.array(edge_capacity)
+
+
+class StubComponent(object):
+    def __init__(self, node_type='transshipment'):
+        self.node_type = node_type
+        self.destination_components = {}
+
+
+class TestComponentGraph(unittest.TestCase):
+
+    def load_components(self, setup_file_name):
+        root_dir = os.path.dirname(os.path.abspath(__file__))
+        config = Configuration(os.path.join(
+            root_dir, "simulation_setup", setup_file_name))
+        return ingest_model(config).components
+
+    def test_graph_matches_components(self):
+        components = self.load_components("test_scenario_pscoal_test_case.json")
+        graph = ComponentGraph(components)
+        edges = set()
+        for edge in graph.digraph.es:
+            edges.add((graph.digraph.vs[edge.source]['name'],
+                       graph.digraph.vs[edge.target]['name']))
+        expected = set((comp_id, dest_comp_id)
+                       for comp_id, component in components.items()
+                       for dest_comp_id in component.destination_components)
+        self.assertEqual(edges, expected)
+        self.assertEqual(sorted(graph.digraph.vs['name']),
+                         sorted(components.keys()))
+
+    def test_capacity_updates_match_edge_by_edge_updates(self):
+        random_state = np.random.RandomState(seed=2)
+        for setup_file_name in ("test_scenario_simple_linear_dep.json",
+                                "test_scenario_pwtp_400ML.json",
+                                "test_scenario_ss_230kv.json"):
+            components = self.load_components(setup_file_name)
+            graph = ComponentGraph(components)
+            for _ in range(20):
+                comp_sample_func = random_state.choice(
+                    [0.0, 0.5, 1.0], size=len(components))
+                expected_func = comp_sample_func.copy()
+                expected = update_capacity_by_edge(components, expected_func)
+                graph.update_capacity(components, comp_sample_func)
+                self.assertTrue(np.array_equal(graph.edge_capacity, expected))
+                self.assertTrue(np.array_equal(comp_sample_func,
+                                               expected_func))
+            # the igraph graph, as exported, has the capacities of the sample
+            self.assertEqual(graph.digraph.es['capacity'],
+                             graph.edge_capacity.tolist())
+
+    def test_large_graph_builds_in_linear_time(self):
+        # a long chain of components with a dependency every tenth node
+        num_components = 20000
+        components = {}
+        for comp_index in range(num_components):
+            node_type = 'dependency' if comp_index % 10 == 0 \
+                else 'transshipment'
+            components['node_{:05d}'.format(comp_index)] = \
+                StubComponent(node_type)
+        comp_ids = sorted(components.keys())
+        for parent, child in zip(comp_ids[:-1], comp_ids[1:]):
+            components[parent].destination_components[child] = \
+                components[child]
+
+        start_time = time.time()
+        graph = ComponentGraph(components)
+        self.assertLess(time.time() - start_time, 30)
+        self.assertEqual(graph.digraph.vcount(), num_components)
+        self.assertEqual(graph.digraph.ecount(), num_components - 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import os
+import unittest
+import numpy as np
+from sifra.logger import rootLogger, logging
+from sifra.configuration import Configuration
+from sifra.scenario import Scenario
+from sifra.modelling.hazard import HazardsContainer
+from sifra.model_ingest import ingest_model
+from sifra.simulation import \
+    calculate_expected_damage_state_of_components_for_n_simulations
+rootLogger.set_log_level(logging.CRITICAL)
+
+
+def load_simulation_objects(setup_file_name):
+    root_dir = os.path.dirname(os.path.abspath(__file__))
+    config = Configuration(os.path.join(
+        root_dir, "simulation_setup", setup_file_name))
+    return Scenario(config), HazardsContainer(config), ingest_model(config)
+
+
+class TestMinimalCutSets(unittest.TestCase):
+
+    def test_series_components_are_single_cut_sets(self):
+        _, _, infrastructure = \
+            load_simulation_objects("test_scenario_simple_linear.json")
+        compiled = infrastructure.compile()
+        cut_sets = infrastructure._component_graph.minimal_cut_sets(
+            'materiel_supply', compiled.output_ids[0])
+        # the output node itself is not part of any cut set
+        self.assertEqual(cut_sets, ((0,), (1,), (2,)))
+
+    def test_parallel_components_are_cut_together(self):
+        _, _, infrastructure = \
+            load_simulation_objects("test_scenario_simple_parallel.json")
+        compiled = infrastructure.compile()
+        graph = infrastructure._component_graph
+        node_2 = compiled.component_index['node_2']
+        node_4 = compiled.component_index['node_4']
+        cut_sets = graph.minimal_cut_sets('materiel_supply',
+                                          compiled.output_ids[0])
+        self.assertIn((node_2, node_4), cut_sets)
+        self.assertNotIn((node_2,), cut_sets)
+        self.assertEqual(graph.minimal_cut_sets('materiel_supply',
+                                                compiled.output_ids[0],
+                                                max_order=1),
+                         tuple(cut_set for cut_set in cut_sets
+                               if len(cut_set) == 1))
+
+    def test_cut_sets_disconnect_the_output(self):
+        _, _, infrastructure = \
+            load_simulation_objects("test_scenario_pwtp_400ML.json")
+        compiled = infrastructure.compile()
+        graph = infrastructure._component_graph
+        for output_index, output_id in enumerate(compiled.output_ids):
+            for supply_id in compiled.supply_ids:
+                for cut_set in graph.minimal_cut_sets(supply_id, output_id):
+                    func = np.ones(compiled.num_components)
+                    func[list(cut_set)] = 0.0
+                    graph.set_capacity(func[compiled.edge_parent])
+                    self.assertEqual(graph.maxflow(supply_id, output_id), 0)
+
+
+class TestCutSetScreening(unittest.TestCase):
+
+    def test_screened_output_matches_max_flow(self):
+        for setup_file_name in ("test_scenario_pscoal_test_case.json",
+                                "test_scenario_pwtp_400ML.json"):
+            scenario, hazards, infrastructure = \
+                load_simulation_objects(setup_file_name)
+            for hazard in hazards.listOfhazards:
+                component_damage_state_ind = \
+                    calculate_expected_damage_state_of_components_for_n_simulations(
+                        infrastructure, scenario, hazard)
+                results = []
+                for cut_set_screening in (False, True):
+                    scenario.cut_set_screening = cut_set_screening
+                    infrastructure._output_cache = None
+                    results.append(infrastructure.calc_output_loss(
+                        scenario, component_damage_state_ind))
+                for expected, screened in zip(*results):
+                    self.assertTrue(np.array_equal(expected, screened),
+                                    setup_file_name)
+
+    def test_failed_supply_is_screened(self):
+        _, _, infrastructure = \
+            load_simulation_objects("test_scenario_pscoal_test_case.json")
+        compiled = infrastructure.compile()
+        screen = infrastructure.get_cut_set_screen(2)
+        func = np.ones((2, compiled.num_components))
+        func[1, compiled.supply_indices] = 0.0
+        _, edge_capacity = compiled.propagate_dependencies(func)
+        self.assertTrue(np.array_equal(screen.screen(edge_capacity),
+                                       [False, True]))
+        self.assertEqual(screen.num_screened, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
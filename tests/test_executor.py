@@ -0,0 +1,141 @@
+import os
+import unittest
+import numpy as np
+from sifra.logger import rootLogger, logging
+from sifra.configuration import Configuration
+from sifra.scenario import Scenario
+from sifra.modelling.hazard import HazardsContainer
+from sifra.model_ingest import ingest_model
+from sifra.executor import ModelPool, DaskExecutor, create_executor
+from sifra.simulation import calculate_response_for_samples, \
+    calculate_response
+rootLogger.set_log_level(logging.CRITICAL)
+
+
+def model_identity(task, scenario, infrastructure):
+    return os.getpid(), id(infrastructure), task
+
+
+class TestModelPool(unittest.TestCase):
+
+    def setUp(self):
+        root_dir = os.path.dirname(os.path.abspath(__file__))
+        config = Configuration(os.path.join(
+            root_dir, "simulation_setup",
+            "test_scenario_pscoal_test_case.json"))
+        self.scenario = Scenario(config)
+        self.hazards = HazardsContainer(config)
+        self.infrastructure = ingest_model(config)
+
+    def test_each_worker_keeps_one_model(self):
+        with ModelPool(model_identity, self.scenario, self.infrastructure,
+                       num_workers=2, chunk_size=3) as pool:
+            results = pool.map(range(20))
+        self.assertEqual([task for _, _, task in results], range(20))
+        models = {}
+        for pid, model_id, _ in results:
+            models.setdefault(pid, set()).add(model_id)
+        self.assertTrue(len(models) <= 2)
+        self.assertTrue(all(len(ids) == 1 for ids in models.values()))
+
+    def test_matches_the_serial_response(self):
+        hazard_samples = [(hazard, 50)
+                          for hazard in self.hazards.listOfhazards]
+        with ModelPool(calculate_response_for_samples, self.scenario,
+                       self.infrastructure, num_workers=2) as pool:
+            parallel = pool.map(hazard_samples)
+        for (hazard, num_samples), response in zip(hazard_samples, parallel):
+            serial = calculate_response_for_samples(
+                (hazard, num_samples), self.scenario, self.infrastructure)
+            name = hazard.hazard_scenario_name
+            self.assertTrue(np.array_equal(response[name][0],
+                                           serial[name][0]))
+            self.assertEqual(response[name][1], serial[name][1])
+            self.assertEqual(response[name][2], serial[name][2])
+
+
+class TestShardedResponse(unittest.TestCase):
+
+    def setUp(self):
+        root_dir = os.path.dirname(os.path.abspath(__file__))
+        self.config = Configuration(os.path.join(
+            root_dir, "simulation_setup", "test_scenario_ss_230kv.json"))
+        self.hazards = HazardsContainer(self.config)
+        self.infrastructure = ingest_model(self.config)
+
+    def run_scenario(self, **switches):
+        scenario = Scenario(self.config)
+        scenario.num_samples = 300
+        scenario.sampling_method = 'philox'
+        scenario.save_vars_npy = False
+        for name, value in switches.items():
+            setattr(scenario, name, value)
+        return calculate_response(self.hazards, scenario,
+                                  self.infrastructure)
+
+    def test_same_results_for_any_number_of_workers(self):
+        serial = self.run_scenario(sample_shard_size=70, run_parallel_proc=0)
+        for num_workers in (1, 3):
+            parallel = self.run_scenario(sample_shard_size=70,
+                                         run_parallel_proc=1,
+                                         num_workers=num_workers)
+            for list_number in (1, 2, 3):
+                self.assertEqual(parallel[list_number], serial[list_number])
+
+        # and the same as the samples in one block, up to rounding
+        whole = self.run_scenario(run_parallel_proc=0)
+        for name, component_response in whole[2].items():
+            for key, value in component_response.items():
+                self.assertAlmostEqual(serial[2][name][key], value, places=9)
+
+    def test_needs_a_sampler_that_draws_blocks(self):
+        with self.assertRaises(ValueError):
+            self.run_scenario(sample_shard_size=70, sampling_method='random')
+
+    def test_unknown_backend(self):
+        scenario = Scenario(self.config)
+        scenario.parallel_backend = 'mpi'
+        with self.assertRaises(ValueError):
+            create_executor(calculate_response_for_samples, scenario,
+                            self.infrastructure)
+
+
+@unittest.skipUnless(DaskExecutor.is_available(),
+                     "dask.distributed is not installed")
+class TestDaskExecutor(unittest.TestCase):
+
+    def setUp(self):
+        root_dir = os.path.dirname(os.path.abspath(__file__))
+        self.config = Configuration(os.path.join(
+            root_dir, "simulation_setup", "test_scenario_ss_230kv.json"))
+        self.hazards = HazardsContainer(self.config)
+        self.infrastructure = ingest_model(self.config)
+
+    def run_scenario(self, **switches):
+        scenario = Scenario(self.config)
+        scenario.num_samples = 300
+        scenario.sampling_method = 'philox'
+        scenario.save_vars_npy = False
+        for name, value in switches.items():
+            setattr(scenario, name, value)
+        return calculate_response(self.hazards, scenario,
+                                  self.infrastructure)
+
+    def test_matches_the_serial_response(self):
+        serial = self.run_scenario(run_parallel_proc=0)
+        distributed = self.run_scenario(parallel_backend='dask',
+                                        num_workers=2)
+        for list_number in (1, 2, 3):
+            self.assertEqual(distributed[list_number], serial[list_number])
+
+    def test_sharded_run_matches_the_serial_run(self):
+        serial = self.run_scenario(sample_shard_size=70, run_parallel_proc=0)
+        distributed = self.run_scenario(sample_shard_size=70,
+                                        parallel_backend='dask',
+                                        num_workers=2)
+        for list_number in (1, 2, 3):
+            self.assertEqual(distributed[list_number], serial[list_number])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import os
+import copy
+import json
+import shutil
+import tempfile
+import unittest
+from collections import OrderedDict
+import numpy as np
+from sifra.logger import rootLogger, logging
+from sifra.configuration import Configuration
+from sifra.model_ingest import ingest_model
+from sifra.modelling.component_graph import ComponentGraph
+rootLogger.set_log_level(logging.CRITICAL)
+
+
+class TestFlowPlan(unittest.TestCase):
+    """
+    Compare the planned max flow problems with the pairwise max flow of
+    every supply and output node.
+    """
+
+    def setUp(self):
+        self.root_dir = os.path.dirname(os.path.abspath(__file__))
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def load_model(self, setup_file_name, edit_model=None):
+        config = Configuration(os.path.join(
+            self.root_dir, "simulation_setup", setup_file_name))
+        if edit_model:
+            with open(config.SYS_CONF_FILE, 'r') as f:
+                model = json.load(f, object_pairs_hook=OrderedDict)
+            edit_model(model)
+            config.SYS_CONF_FILE = os.path.join(self.temp_dir, 'model.json')
+            with open(config.SYS_CONF_FILE, 'w') as f:
+                json.dump(model, f)
+        return ingest_model(config)
+
+    @staticmethod
+    def two_supplies(model, shared_edge=False):
+        """
+        Rewire the simple parallel model so that a second supply feeds
+        the output through node_2 and node_4.
+        """
+        model['component_list']['supply_2'] = copy.deepcopy(
+            model['component_list']['materiel_supply'])
+        links = [('materiel_supply', 'node_1'), ('node_1', 'node_3'),
+                 ('node_3', 'output_1'), ('supply_2', 'node_2'),
+                 ('node_2', 'node_4'), ('node_4', 'output_1')]
+        if shared_edge:
+            links.append(('node_1', 'node_4'))
+        model['node_conn_df'] = OrderedDict(
+            (str(link_index), {'origin': origin, 'destination': destination,
+                               'weight': 1, 'link_capacity': 1})
+            for link_index, (origin, destination) in enumerate(links))
+        for supply_id in ('materiel_supply', 'supply_2'):
+            model['sysinp_setup'][supply_id] = {
+                'commodity_type': 'coal', 'capacity_fraction': 0.5,
+                'input_capacity': 100}
+
+    def pairwise_output(self, infrastructure, comp_level_func):
+        """The output from the max flow of each supply and output pair."""
+        graph = ComponentGraph(infrastructure.components,
+                               comp_level_func.copy())
+        outputs = []
+        for output_id, output_node in infrastructure.output_nodes.items():
+            flow_by_commodity = {}
+            for supply_id, supply_node in infrastructure.supply_nodes.items():
+                commodity_type = supply_node['commodity_type']
+                flow_by_commodity[commodity_type] = \
+                    flow_by_commodity.get(commodity_type, 0.0) + \
+                    graph.maxflow(supply_id, output_id) * \
+                    supply_node['capacity_fraction']
+            outputs.append(
+                min(min(flow_by_commodity.values()),
+                    output_node['capacity_fraction']) *
+                infrastructure.get_nominal_output())
+        return np.array(outputs)
+
+    def check_random_functionality(self, infrastructure, exact):
+        random_state = np.random.RandomState(seed=2)
+        for _ in range(50):
+            comp_level_func = random_state.choice(
+                [0.0, 0.25, 0.5, 1.0], size=len(infrastructure.components))
+            output = infrastructure.compute_output_given_ds(
+                comp_level_func.copy())
+            expected = self.pairwise_output(infrastructure, comp_level_func)
+            if exact:
+                self.assertTrue(np.array_equal(output, expected))
+            else:
+                self.assertTrue(np.allclose(output, expected))
+
+    def test_disjoint_supplies_share_a_super_source(self):
+        infrastructure = self.load_model(
+            "test_scenario_simple_parallel.json", self.two_supplies)
+        compiled = infrastructure.compile()
+        (commodity_type, sources), = compiled.flow_plan[0]
+        (source, supply_positions), = sources
+        self.assertEqual(sorted(source), ['materiel_supply', 'supply_2'])
+        self.check_random_functionality(infrastructure, exact=False)
+
+    def test_supplies_with_a_shared_edge_are_solved_separately(self):
+        infrastructure = self.load_model(
+            "test_scenario_simple_parallel.json",
+            lambda model: self.two_supplies(model, shared_edge=True))
+        compiled = infrastructure.compile()
+        (commodity_type, sources), = compiled.flow_plan[0]
+        self.assertEqual([source for source, _ in sources],
+                         ['materiel_supply', 'supply_2'])
+        self.check_random_functionality(infrastructure, exact=True)
+
+    def test_supplies_without_flow_are_left_out(self):
+        infrastructure = self.load_model("test_scenario_ss_230kv.json")
+        compiled = infrastructure.compile()
+        zero_supplies = [
+            supply_id for supply_id, capacity_fraction in zip(
+                compiled.supply_ids, compiled.supply_capacity_fraction)
+            if capacity_fraction == 0.0]
+        self.assertTrue(zero_supplies)
+        for output_plan in compiled.flow_plan:
+            for commodity_type, sources in output_plan:
+                for source, supply_positions in sources:
+                    self.assertNotIn(source, zero_supplies)
+        self.check_random_functionality(infrastructure, exact=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
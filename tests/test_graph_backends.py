@@ -0,0 +1,77 @@
+import os
+import unittest
+import numpy as np
+from sifra.logger import rootLogger, logging
+from sifra.configuration import Configuration
+from sifra.model_ingest import ingest_model
+from sifra.modelling.graph_backends import \
+    GRAPH_BACKENDS, available_backends, create_backend, select_backend
+rootLogger.set_log_level(logging.CRITICAL)
+
+
+class TestGraphBackends(unittest.TestCase):
+
+    def setUp(self):
+        root_dir = os.path.dirname(os.path.abspath(__file__))
+        config = Configuration(os.path.join(
+            root_dir, "simulation_setup", "test_scenario_pwtp_400ML.json"))
+        self.infrastructure = ingest_model(config)
+        self.compiled = self.infrastructure.compile()
+        self.flow_pairs = [(supply_index, output_index)
+                           for supply_index in self.compiled.supply_indices
+                           for output_index in self.compiled.output_indices]
+
+    def solve_all(self, backend_name, capacities):
+        backend = create_backend(backend_name, self.compiled.num_components,
+                                 self.compiled.edge_parent,
+                                 self.compiled.edge_child)
+        return np.array([[backend.maxflow(source, sink, capacity)
+                          for source, sink in self.flow_pairs]
+                         for capacity in capacities])
+
+    def test_backends_agree_with_igraph(self):
+        capacities = np.random.RandomState(seed=2).choice(
+            [0.0, 0.25, 0.5, 1.0], size=(20, self.compiled.num_edges))
+        expected = self.solve_all('igraph', capacities)
+        for backend_name in available_backends(self.compiled.num_components):
+            self.assertTrue(np.allclose(
+                self.solve_all(backend_name, capacities), expected,
+                atol=1e-6), backend_name)
+
+    def test_unknown_backend_is_rejected(self):
+        with self.assertRaises(ValueError):
+            create_backend('no_such_backend', 2, [0], [1])
+
+    def test_numpy_backend_is_limited_to_small_graphs(self):
+        too_many = GRAPH_BACKENDS['numpy'].MAX_VERTICES + 1
+        self.assertNotIn('numpy', available_backends(too_many))
+        with self.assertRaises(ValueError):
+            create_backend('numpy', too_many, [0], [1])
+
+    def test_selected_backend_is_available(self):
+        selected = select_backend(self.compiled.num_components,
+                                  self.compiled.edge_parent,
+                                  self.compiled.edge_child,
+                                  self.flow_pairs)
+        self.assertIn(selected,
+                      available_backends(self.compiled.num_components))
+
+    def test_system_output_with_each_backend(self):
+        random_state = np.random.RandomState(seed=2)
+        comp_level_funcs = random_state.choice(
+            [0.0, 0.5, 1.0], p=[0.1, 0.2, 0.7],
+            size=(20, self.compiled.num_components))
+        self.infrastructure.set_graph_backend('igraph')
+        expected = [self.infrastructure.compute_output_given_ds(func.copy())
+                    for func in comp_level_funcs]
+        for backend_name in available_backends(self.compiled.num_components):
+            self.infrastructure.set_graph_backend(backend_name)
+            outputs = [
+                self.infrastructure.compute_output_given_ds(func.copy())
+                for func in comp_level_funcs]
+            self.assertTrue(np.allclose(outputs, expected, atol=1e-4),
+                            backend_name)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+import numpy as np
+from sifra.modelling.output_cache import SystemOutputCache
+
+
+class TestSystemOutputCache(unittest.TestCase):
+
+    def test_hits_and_misses(self):
+        cache = SystemOutputCache(10)
+        key = cache.make_key(np.array([1.0, 0.5, 0.0]))
+        self.assertIsNone(cache.get(key))
+        cache.put(key, np.array([250.0]))
+        self.assertEqual(cache.get(key)[0], 250.0)
+        stats = cache.get_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+        self.assertEqual(stats['hit_rate'], 0.5)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = SystemOutputCache(2)
+        keys = [cache.make_key(np.array([float(i)])) for i in range(3)]
+        cache.put(keys[0], 0)
+        cache.put(keys[1], 1)
+        # use the first entry so the second is the least recently used
+        cache.get(keys[0])
+        cache.put(keys[2], 2)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get(keys[0]), 0)
+        self.assertIsNone(cache.get(keys[1]))
+        self.assertEqual(cache.get(keys[2]), 2)
+        self.assertEqual(cache.get_stats()['evictions'], 1)
+
+    def test_zero_size_disables_cache(self):
+        cache = SystemOutputCache(0)
+        key = cache.make_key(np.array([1.0]))
+        cache.put(key, 1)
+        self.assertIsNone(cache.get(key))
+        self.assertEqual(len(cache), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import os
+import unittest
+import numpy as np
+from sifra.logger import rootLogger, logging
+from sifra.configuration import Configuration
+from sifra.scenario import Scenario
+from sifra.modelling.hazard import HazardsContainer
+from sifra.model_ingest import ingest_model
+from sifra.modelling.reachability import pack_samples, unpack_samples
+from sifra.simulation import \
+    calculate_expected_damage_state_of_components_for_n_simulations
+rootLogger.set_log_level(logging.CRITICAL)
+
+
+def load_simulation_objects(setup_file_name):
+    root_dir = os.path.dirname(os.path.abspath(__file__))
+    config = Configuration(os.path.join(
+        root_dir, "simulation_setup", setup_file_name))
+    return Scenario(config), HazardsContainer(config), ingest_model(config)
+
+
+class TestSamplePacking(unittest.TestCase):
+
+    def test_unpack_reverses_pack(self):
+        sample_bits = np.random.RandomState(seed=2).uniform(
+            size=(130, 7)) < 0.5
+        words = pack_samples(sample_bits)
+        self.assertEqual(words.shape, (7, 3))
+        self.assertEqual(words.dtype, np.uint64)
+        self.assertTrue(np.array_equal(unpack_samples(words, 130),
+                                       sample_bits.T))
+
+
+class TestReachabilityEngine(unittest.TestCase):
+
+    def test_decided_output_matches_max_flow(self):
+        random_state = np.random.RandomState(seed=2)
+        # ss_230kv and pscoal have cycles, pwtp has fractional functionality
+        for setup_file_name in ("test_scenario_ss_230kv.json",
+                                "test_scenario_pscoal_test_case.json",
+                                "test_scenario_pwtp_400ML.json"):
+            _, _, infrastructure = load_simulation_objects(setup_file_name)
+            compiled = infrastructure.compile()
+            comp_sample_func = random_state.choice(
+                np.unique(compiled.ds_functionality),
+                size=(200, compiled.num_components))
+            comp_sample_func[
+                random_state.uniform(size=comp_sample_func.shape) < 0.7] = 1.0
+            _, edge_capacity = \
+                compiled.propagate_dependencies(comp_sample_func)
+
+            decided, output = infrastructure.get_reachability_engine().\
+                system_output(edge_capacity)
+
+            expected = np.array(
+                [infrastructure.compute_output_given_capacity(capacity)
+                 for capacity in edge_capacity])
+            self.assertTrue(np.any(decided), setup_file_name)
+            self.assertTrue(np.array_equal(output[decided],
+                                           expected[decided]),
+                            setup_file_name)
+
+    def test_all_or_nothing_samples_are_decided(self):
+        _, _, infrastructure = \
+            load_simulation_objects("test_scenario_simple_parallel.json")
+        compiled = infrastructure.compile()
+        engine = infrastructure.get_reachability_engine()
+        self.assertTrue(engine.is_acyclic)
+        comp_sample_func = np.random.RandomState(seed=2).choice(
+            [0.0, 1.0], size=(100, compiled.num_components))
+        _, edge_capacity = compiled.propagate_dependencies(comp_sample_func)
+        decided, output = engine.system_output(edge_capacity)
+        self.assertTrue(np.all(decided))
+        expected = [infrastructure.compute_output_given_capacity(capacity)
+                    for capacity in edge_capacity]
+        self.assertTrue(np.array_equal(output, expected))
+
+    def test_output_loss_with_and_without_fast_path(self):
+        scenario, hazards, infrastructure = \
+            load_simulation_objects("test_scenario_ss_230kv.json")
+        for hazard in hazards.listOfhazards:
+            component_damage_state_ind = \
+                calculate_expected_damage_state_of_components_for_n_simulations(
+                    infrastructure, scenario, hazard)
+            results = []
+            for reachability_fast_path in (False, True):
+                scenario.reachability_fast_path = reachability_fast_path
+                infrastructure._output_cache = None
+                results.append(infrastructure.calc_output_loss(
+                    scenario, component_damage_state_ind))
+            for expected, fast in zip(*results):
+                self.assertTrue(np.array_equal(expected, fast))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import os
+import unittest
+import numpy as np
+from sifra.logger import rootLogger, logging
+from sifra.configuration import Configuration
+from sifra.scenario import Scenario
+from sifra.modelling.hazard import HazardsContainer
+from sifra.model_ingest import ingest_model
+from sifra.sample_arrays import CompressedSampleArray
+from sifra.sample_store import SampleArrayStore
+from sifra.simulation import calculate_response
+rootLogger.set_log_level(logging.CRITICAL)
+
+
+class TestSampleArrayStore(unittest.TestCase):
+
+    def test_rows_are_written_by_hazard_level(self):
+        store = SampleArrayStore(['s_0', 's_1'], 4, 3, 2)
+        damage_states = np.arange(12).reshape(4, 3)
+        store.write('s_1', damage_states, np.ones((4, 2)), np.arange(4.0))
+        # a shorter level, with its arrays compressed
+        store.write('s_0', CompressedSampleArray(damage_states[:1], [0, 0]),
+                    np.zeros((2, 2)), np.array([0.5, 0.5]))
+        arrays = store.load()
+        self.assertFalse(os.path.exists(store.directory))
+        # the arrays are read into memory, and the store is removed once
+        self.assertNotIsInstance(arrays['output'], np.memmap)
+        store.remove()
+        self.assertTrue(np.array_equal(arrays['damage_states'][1],
+                                       damage_states))
+        self.assertTrue(np.array_equal(arrays['damage_states'][0, :2],
+                                       damage_states[[0, 0]]))
+        self.assertTrue(np.array_equal(arrays['economic_loss'][1],
+                                       np.arange(4.0)))
+        # the rows past the samples of a level are padding
+        self.assertTrue(np.all(np.isnan(arrays['economic_loss'][0, 2:])))
+        self.assertTrue(np.all(np.isnan(arrays['output'][0, 2:])))
+
+    def test_parallel_run_matches_returned_arrays(self):
+        root_dir = os.path.dirname(os.path.abspath(__file__))
+        config = Configuration(os.path.join(
+            root_dir, "simulation_setup",
+            "test_scenario_pscoal_test_case.json"))
+        hazards = HazardsContainer(config)
+        infrastructure = ingest_model(config)
+        responses = []
+        for shared_sample_arrays in (False, True):
+            scenario = Scenario(config)
+            scenario.num_samples = 100
+            scenario.run_parallel_proc = 1
+            scenario.num_workers = 2
+            scenario.shared_sample_arrays = shared_sample_arrays
+            responses.append(
+                calculate_response(hazards, scenario, infrastructure))
+        returned, shared = responses
+        for hazard_name, damage_states in returned[0].items():
+            self.assertTrue(np.array_equal(shared[0][hazard_name],
+                                           damage_states))
+        self.assertTrue(np.array_equal(shared[4], returned[4]))
+        self.assertTrue(np.array_equal(shared[5], returned[5]))
+        self.assertEqual(shared[2], returned[2])
+
+    def test_streamed_samples_without_arrays_need_no_store(self):
+        root_dir = os.path.dirname(os.path.abspath(__file__))
+        config = Configuration(os.path.join(
+            root_dir, "simulation_setup",
+            "test_scenario_pscoal_test_case.json"))
+        hazards = HazardsContainer(config)
+        infrastructure = ingest_model(config)
+        responses = []
+        for shared_sample_arrays in (False, True):
+            scenario = Scenario(config)
+            scenario.num_samples = 100
+            scenario.run_parallel_proc = 1
+            scenario.num_workers = 2
+            scenario.stream_chunk_size = 50
+            scenario.save_vars_npy = False
+            scenario.shared_sample_arrays = shared_sample_arrays
+            responses.append(
+                calculate_response(hazards, scenario, infrastructure))
+        returned, shared = responses
+        self.assertIsNone(shared[4])
+        self.assertIsNone(shared[5])
+        self.assertEqual(shared[2], returned[2])
+
+
+if __name__ == '__main__':
+    unittest.main()
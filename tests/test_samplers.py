@@ -0,0 +1,194 @@
+import os
+import unittest
+import numpy as np
+from sifra.logger import rootLogger, logging
+from sifra.configuration import Configuration
+from sifra.scenario import Scenario
+from sifra.modelling.hazard import HazardsContainer
+from sifra.model_ingest import ingest_model
+from sifra.samplers import UniformSampler, available_samplers, \
+    create_sampler
+from sifra.sobol_sequence import primitive_polynomials, is_primitive, \
+    direction_numbers, BRATLEY_FOX_NUMBERS
+from sifra.random_streams import philox4x32, stream_key, \
+    CounterRandomStream
+from sifra.simulation import \
+    calculate_expected_damage_state_of_components_for_n_simulations, \
+    calculate_adaptive_samples
+rootLogger.set_log_level(logging.CRITICAL)
+
+
+def load_simulation_objects(setup_file_name):
+    root_dir = os.path.dirname(os.path.abspath(__file__))
+    config = Configuration(os.path.join(
+        root_dir, "simulation_setup", setup_file_name))
+    return Scenario(config), HazardsContainer(config), ingest_model(config)
+
+
+class TestSamplers(unittest.TestCase):
+
+    def test_random_sampler_matches_random_state(self):
+        sampler = create_sampler('random', np.random.RandomState(seed=2))
+        self.assertTrue(np.array_equal(
+            np.concatenate([sampler.uniform(30, 5), sampler.uniform(70, 5)]),
+            np.random.RandomState(seed=2).uniform(size=(100, 5))))
+
+    def test_latin_hypercube_is_stratified(self):
+        rnd = create_sampler('lhs', np.random.RandomState(seed=2)).\
+            uniform(50, 7)
+        self.assertEqual(rnd.shape, (50, 7))
+        # every stratum of every component holds exactly one sample
+        strata = np.sort(np.floor(rnd * 50).astype(int), axis=0)
+        self.assertTrue(np.array_equal(
+            strata, np.tile(np.arange(50)[:, np.newaxis], (1, 7))))
+
+    def test_samplers_are_reproducible(self):
+        for name in available_samplers():
+            first = create_sampler(name, np.random.RandomState(seed=5),
+                                   stream_key(5)).uniform(64, 9)
+            second = create_sampler(name, np.random.RandomState(seed=5),
+                                    stream_key(5)).uniform(64, 9)
+            other = create_sampler(name, np.random.RandomState(seed=6),
+                                   stream_key(6)).uniform(64, 9)
+            self.assertTrue(np.array_equal(first, second), name)
+            self.assertFalse(np.array_equal(first, other), name)
+            self.assertTrue(np.all((first >= 0) & (first < 1)), name)
+
+    def test_sobol_blocks_continue_the_sequence(self):
+        sampler = create_sampler('sobol', np.random.RandomState(seed=2))
+        blocks = np.concatenate([sampler.uniform(32, 4),
+                                 sampler.uniform(32, 4)])
+        whole = create_sampler('sobol', np.random.RandomState(seed=2)).\
+            uniform(64, 4)
+        self.assertTrue(np.array_equal(blocks, whole))
+
+    def test_sobol_sequence_is_stratified(self):
+        rnd = create_sampler('sobol', np.random.RandomState(seed=2)).\
+            uniform(256, 40)
+        # the first 2 ** m points hold one point in each stratum of every
+        # component, as the scramble keeps the structure of the sequence
+        strata = np.sort(np.floor(rnd * 256).astype(int), axis=0)
+        self.assertTrue(np.array_equal(
+            strata, np.tile(np.arange(256)[:, np.newaxis], (1, 40))))
+
+    def test_sobol_direction_numbers(self):
+        directions = direction_numbers(len(BRATLEY_FOX_NUMBERS) + 8)
+        # the first points of the unscrambled sequence of Bratley and Fox
+        words = np.bitwise_xor.accumulate(directions[[0, 1, 0, 2]], axis=0)
+        self.assertTrue(np.allclose(words[:, :4] / 2.0 ** 32, [
+            [0.5, 0.5, 0.5, 0.5], [0.75, 0.25, 0.75, 0.25],
+            [0.25, 0.75, 0.25, 0.75], [0.375, 0.375, 0.625, 0.125]]))
+        # the last direction number of each dimension is odd
+        self.assertTrue(np.all(directions[-1] & np.uint64(1)))
+
+    def test_primitive_polynomials(self):
+        # x + 1, x^2 + x + 1, x^3 + x + 1, x^3 + x^2 + 1, x^4 + x + 1, ...
+        self.assertEqual(primitive_polynomials(6), [3, 7, 11, 13, 19, 25])
+        # x^4 + x^3 + x^2 + x + 1 is irreducible, but not primitive
+        self.assertFalse(is_primitive(31))
+
+    def test_counter_based_blocks_match_one_draw(self):
+        sampler = create_sampler('philox', np.random.RandomState(seed=2),
+                                 stream_key(2, 's_1'))
+        whole = sampler.uniform(50, 9)
+        self.assertTrue(np.array_equal(
+            np.concatenate([sampler.uniform_block(first_sample, 10, 9)
+                            for first_sample in (40, 30, 20, 10, 0)][::-1]),
+            whole))
+        # the draws continue along the stream
+        self.assertTrue(np.array_equal(sampler.uniform(5, 9),
+                                       sampler.uniform_block(50, 5, 9)))
+
+    def test_samplers_implement_uniform(self):
+        with self.assertRaises(TypeError):
+            UniformSampler(np.random.RandomState(seed=2))
+
+    def test_unknown_sampler_is_rejected(self):
+        with self.assertRaises(ValueError):
+            create_sampler('halton', np.random.RandomState(seed=2))
+
+
+class TestRandomStreams(unittest.TestCase):
+
+    def test_philox_known_answers(self):
+        # the known answer tests of the Random123 library
+        for counter, key, expected in (
+                ((0, 0, 0, 0), (0, 0),
+                 (0x6627e8d5, 0xe169c58d, 0xbc57ac4c, 0x9b00dbd8)),
+                ((0xffffffff,) * 4, (0xffffffff,) * 2,
+                 (0x408f276d, 0x41c83b0e, 0xa20bc7c6, 0x6d5451fd)),
+                ((0x243f6a88, 0x85a308d3, 0x13198a2e, 0x03707344),
+                 (0xa4093822, 0x299f31d0),
+                 (0xd16cfe09, 0x94fdcceb, 0x5001e420, 0x24126ea1))):
+            words = philox4x32(np.array(counter)[:, np.newaxis], key)
+            self.assertEqual(tuple(words[:, 0]), expected)
+
+    def test_any_block_of_the_matrix_is_the_same(self):
+        stream = CounterRandomStream(stream_key(0, 's_2'))
+        whole = stream.uniform(0, 20, 0, 11)
+        self.assertTrue(np.all((whole >= 0) & (whole < 1)))
+        for first_sample, num_samples, first_component, num_components in (
+                (0, 20, 0, 11), (7, 5, 3, 1), (19, 1, 4, 7), (2, 9, 1, 10)):
+            block = stream.uniform(first_sample, num_samples,
+                                   first_component, num_components)
+            self.assertTrue(np.array_equal(
+                block,
+                whole[first_sample:first_sample + num_samples,
+                      first_component:first_component + num_components]))
+
+    def test_hazard_names_give_distinct_keys(self):
+        # Hazard.get_seed gives 's_13' and 's_50' the same seed
+        names = ['s_{}'.format(number) for number in range(100)]
+        keys = set(stream_key(0, name) for name in names)
+        self.assertEqual(len(keys), len(names))
+        self.assertNotEqual(stream_key(0, 's_1'), stream_key(1, 's_1'))
+
+
+class TestSamplingMethod(unittest.TestCase):
+
+    def setUp(self):
+        self.scenario, self.hazards, self.infrastructure = \
+            load_simulation_objects("test_scenario_pscoal_test_case.json")
+        self.scenario.num_samples = 200
+
+    def assert_stratified_frequencies(self):
+        num_samples = self.scenario.num_samples
+        for hazard in self.hazards.listOfhazards:
+            component_pe_ds = \
+                self.infrastructure.get_exceedance_probabilities(hazard)
+            component_damage_state_ind = \
+                calculate_expected_damage_state_of_components_for_n_simulations(
+                    self.infrastructure, self.scenario, hazard)
+            # the fraction of samples exceeding each damage state is
+            # within one stratum of its probability
+            for ds_index in range(component_pe_ds.shape[1]):
+                pe_ds = component_pe_ds[:, ds_index]
+                pe_ds = np.where(np.isnan(pe_ds), 0.0, pe_ds)
+                fraction = np.mean(component_damage_state_ind > ds_index,
+                                   axis=0)
+                self.assertTrue(np.all(
+                    np.abs(fraction - pe_ds) <= 1.0 / num_samples + 1e-12))
+
+    def test_latin_hypercube_damage_state_frequencies(self):
+        self.scenario.sampling_method = 'lhs'
+        self.assert_stratified_frequencies()
+
+    def test_sobol_damage_state_frequencies(self):
+        self.scenario.sampling_method = 'sobol'
+        self.scenario.num_samples = 256
+        self.assert_stratified_frequencies()
+
+    def test_adaptive_blocks_use_the_sampling_method(self):
+        hazard = self.hazards.listOfhazards[2]
+        self.scenario.sampling_method = 'lhs'
+        self.scenario.adaptive_block_size = 200
+        adaptive = calculate_adaptive_samples(
+            self.infrastructure, self.scenario, hazard)
+        fixed = \
+            calculate_expected_damage_state_of_components_for_n_simulations(
+                self.infrastructure, self.scenario, hazard)
+        self.assertTrue(np.array_equal(adaptive[0], fixed))
+
+
+if __name__ == '__main__':
+    unittest.main()
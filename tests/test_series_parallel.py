@@ -0,0 +1,90 @@
+import os
+import unittest
+import numpy as np
+from sifra.logger import rootLogger, logging
+from sifra.configuration import Configuration
+from sifra.model_ingest import ingest_model
+from sifra.modelling.graph_backends import create_backend
+from sifra.modelling.series_parallel import \
+    ReducedFlowProblem, SeriesParallelFlowEngine
+rootLogger.set_log_level(logging.CRITICAL)
+
+
+class TestReducedFlowProblem(unittest.TestCase):
+
+    def setUp(self):
+        self.capacity = np.random.RandomState(seed=2).choice(
+            [0.0, 0.25, 0.5, 1.0], size=(100, 5))
+
+    def check_against_maxflow(self, problem, num_vertices, edge_parent,
+                              edge_child, source, sink):
+        backend = create_backend('igraph', num_vertices, edge_parent,
+                                 edge_child)
+        expected = [backend.maxflow(source, sink, capacity)
+                    for capacity in self.capacity]
+        self.assertTrue(np.array_equal(problem.maxflow(self.capacity),
+                                       expected))
+
+    def test_series_and_parallel_edges_reduce_to_closed_form(self):
+        # 0 -> 1 -> 3 and 0 -> 2 -> 3, then 3 -> 4
+        edge_parent = [0, 1, 0, 2, 3]
+        edge_child = [1, 3, 2, 3, 4]
+        problem = ReducedFlowProblem(5, edge_parent, edge_child, 0, 4)
+        self.assertTrue(problem.is_closed_form)
+        self.assertEqual(problem.expression[0], 'min')
+        self.check_against_maxflow(problem, 5, edge_parent, edge_child, 0, 4)
+
+    def test_bridge_is_left_as_a_core(self):
+        # the bridge 1 -> 2 makes the graph not series-parallel
+        edge_parent = [0, 0, 1, 1, 2]
+        edge_child = [1, 2, 2, 3, 3]
+        problem = ReducedFlowProblem(4, edge_parent, edge_child, 0, 3)
+        self.assertFalse(problem.is_closed_form)
+        self.assertEqual(len(problem.core_expressions), 5)
+        self.check_against_maxflow(problem, 4, edge_parent, edge_child, 0, 3)
+
+    def test_unreachable_sink_has_no_flow(self):
+        problem = ReducedFlowProblem(3, [0, 2], [1, 1], 0, 2)
+        self.assertTrue(np.array_equal(problem.maxflow(self.capacity[:, :2]),
+                                       np.zeros(len(self.capacity))))
+
+
+class TestSeriesParallelFlowEngine(unittest.TestCase):
+
+    def load_model(self, setup_file_name):
+        root_dir = os.path.dirname(os.path.abspath(__file__))
+        return ingest_model(Configuration(os.path.join(
+            root_dir, "simulation_setup", setup_file_name)))
+
+    def test_simple_structures_reduce_to_closed_form(self):
+        for setup_file_name in ("test_scenario_simple_linear.json",
+                                "test_scenario_simple_parallel.json",
+                                "test_scenario_pwtp_400ML.json"):
+            engine = SeriesParallelFlowEngine(
+                self.load_model(setup_file_name).compile())
+            self.assertEqual(engine.num_closed_form, len(engine.problems))
+
+    def test_output_matches_sample_by_sample_max_flow(self):
+        random_state = np.random.RandomState(seed=2)
+        for setup_file_name in ("test_scenario_simple_linear_dep.json",
+                                "test_scenario_pscoal_test_case.json",
+                                "test_scenario_pwtp_400ML.json"):
+            infrastructure = self.load_model(setup_file_name)
+            compiled = infrastructure.compile()
+            comp_sample_func = random_state.choice(
+                np.unique(compiled.ds_functionality),
+                size=(100, compiled.num_components))
+            _, edge_capacity = \
+                compiled.propagate_dependencies(comp_sample_func)
+
+            output = SeriesParallelFlowEngine(compiled).system_output(
+                edge_capacity)
+
+            expected = [infrastructure.compute_output_given_ds(func.copy())
+                        for func in comp_sample_func]
+            self.assertTrue(np.array_equal(output, expected),
+                            setup_file_name)
+
+
+if __name__ == '__main__':
+    unittest.main()
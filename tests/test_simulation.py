@@ -0,0 +1,387 @@
+import os
+import unittest
+import numpy as np
+from sifra.logger import rootLogger, logging
+from sifra.configuration import Configuration
+from sifra.scenario import Scenario
+from sifra.modelling.hazard import HazardsContainer
+from sifra.model_ingest import ingest_model
+from scipy import stats
+from sifra.simulation import \
+    calculate_expected_damage_state_of_components_for_n_simulations, \
+    calculate_response, calculate_response_for_hazard, stack_sample_arrays, \
+    allocate_sample_budget, importance_sample_damage_states, \
+    sample_damage_states, saturated_damage_states
+rootLogger.set_log_level(logging.CRITICAL)
+
+
+def load_simulation_objects(setup_file_name):
+    root_dir = os.path.dirname(os.path.abspath(__file__))
+    conf_file_path = os.path.join(root_dir, "simulation_setup",
+                                  setup_file_name)
+    config = Configuration(conf_file_path)
+    scenario = Scenario(config)
+    hazards = HazardsContainer(config)
+    infrastructure = ingest_model(config)
+    return config, scenario, hazards, infrastructure
+
+
+class TestDamageStateSampling(unittest.TestCase):
+
+    def setUp(self):
+        self.config, self.scenario, self.hazards, self.infrastructure = \
+            load_simulation_objects("test_scenario_pscoal_test_case.json")
+
+    def test_exceedance_probabilities_match_response_functions(self):
+        component_list_sorted = sorted(self.infrastructure.components.keys())
+        for hazard in self.hazards.listOfhazards:
+            component_pe_ds = \
+                self.infrastructure.get_exceedance_probabilities(hazard)
+            for comp_index, comp_id in enumerate(component_list_sorted):
+                component = self.infrastructure.components[comp_id]
+                hazard_intensity = hazard.get_hazard_intensity_at_location(
+                    *component.get_location())
+                for ds_index in range(1, len(component.damage_states)):
+                    expected = component.damage_states[ds_index].\
+                        response_function(hazard_intensity)
+                    self.assertEqual(
+                        component_pe_ds[comp_index, ds_index - 1], expected)
+
+    def test_sampled_damage_states_match_per_component_loop(self):
+        component_list_sorted = sorted(self.infrastructure.components.keys())
+        for hazard in self.hazards.listOfhazards:
+            component_damage_state_ind = \
+                calculate_expected_damage_state_of_components_for_n_simulations(
+                    self.infrastructure, self.scenario, hazard)
+
+            rnd = np.random.RandomState(seed=2).uniform(
+                size=(self.scenario.num_samples, len(component_list_sorted)))
+            for comp_index, comp_id in enumerate(component_list_sorted):
+                component = self.infrastructure.components[comp_id]
+                hazard_intensity = hazard.get_hazard_intensity_at_location(
+                    *component.get_location())
+                pe_ds = component.pe_ds(hazard_intensity)[1:]
+                pe_ds[np.isnan(pe_ds)] = -np.inf
+                expected = np.sum(pe_ds > rnd[:, comp_index][:, np.newaxis],
+                                  axis=1)
+                self.assertTrue(np.array_equal(
+                    component_damage_state_ind[:, comp_index], expected))
+
+
+class TestOutputLoss(unittest.TestCase):
+
+    def setUp(self):
+        self.config, self.scenario, self.hazards, self.infrastructure = \
+            load_simulation_objects("test_scenario_pscoal_test_case.json")
+
+    def test_loss_and_functionality_match_damage_states(self):
+        component_list_sorted = sorted(self.infrastructure.components.keys())
+        hazard = self.hazards.listOfhazards[2]
+        component_damage_state_ind = \
+            calculate_expected_damage_state_of_components_for_n_simulations(
+                self.infrastructure, self.scenario, hazard)
+
+        if_level_loss, if_level_functionality, if_level_output, \
+            if_level_economic_loss = self.infrastructure.calc_output_loss(
+                self.scenario, component_damage_state_ind)
+
+        for sample_index in range(self.scenario.num_samples):
+            for comp_index, comp_id in enumerate(component_list_sorted):
+                component = self.infrastructure.components[comp_id]
+                damage_state = component.get_damage_state(
+                    component_damage_state_ind[sample_index, comp_index])
+                self.assertEqual(
+                    if_level_loss[sample_index, comp_index],
+                    damage_state.damage_ratio * component.cost_fraction)
+                self.assertEqual(
+                    if_level_functionality[sample_index, comp_index],
+                    damage_state.functionality)
+            self.assertEqual(if_level_economic_loss[sample_index],
+                             np.sum(if_level_loss[sample_index, :]))
+
+
+class TestCompressedSamples(unittest.TestCase):
+
+    def setUp(self):
+        self.config, self.scenario, self.hazards, self.infrastructure = \
+            load_simulation_objects("test_scenario_pscoal_test_case.json")
+
+    def test_compressed_response_matches_full_response(self):
+        for hazard in self.hazards.listOfhazards:
+            self.scenario.compress_samples = False
+            full = calculate_response_for_hazard(
+                hazard, self.scenario, self.infrastructure)
+            self.scenario.compress_samples = True
+            compressed = calculate_response_for_hazard(
+                hazard, self.scenario, self.infrastructure)
+
+            full = full[hazard.hazard_scenario_name]
+            compressed = compressed[hazard.hazard_scenario_name]
+            # the per-sample arrays are reproduced exactly
+            for list_number in (0, 4, 5):
+                self.assertTrue(np.array_equal(
+                    np.asarray(compressed[list_number]), full[list_number]))
+            # the statistics agree to rounding
+            for output_id, output in full[1].items():
+                self.assertAlmostEqual(compressed[1][output_id], output)
+            for list_number in (2, 3):
+                for key, value in full[list_number].items():
+                    self.assertAlmostEqual(compressed[list_number][key],
+                                           value, places=10)
+
+
+class TestCommonRandomNumbers(unittest.TestCase):
+
+    def setUp(self):
+        self.config, self.scenario, self.hazards, self.infrastructure = \
+            load_simulation_objects("test_scenario_pwtp_400ML.json")
+        # a normal run seeds each hazard level separately
+        self.scenario.run_context = 1
+        self.scenario.common_random_numbers = True
+
+    def test_damage_states_rise_with_hazard_intensity(self):
+        previous = None
+        for hazard in self.hazards.listOfhazards:
+            component_damage_state_ind = \
+                calculate_expected_damage_state_of_components_for_n_simulations(
+                    self.infrastructure, self.scenario, hazard)
+            if previous is not None:
+                self.assertTrue(np.all(component_damage_state_ind >= previous))
+            previous = component_damage_state_ind
+
+    def test_output_of_unchanged_samples_is_reused(self):
+        for hazard in self.hazards.listOfhazards:
+            component_damage_state_ind = \
+                calculate_expected_damage_state_of_components_for_n_simulations(
+                    self.infrastructure, self.scenario, hazard)
+            incremental = self.infrastructure.calc_output_loss(
+                self.scenario, component_damage_state_ind)
+            previous_level = self.infrastructure._previous_level
+            self.assertTrue(np.array_equal(previous_level[1],
+                                           incremental[2]))
+
+            self.infrastructure._previous_level = None
+            full = self.infrastructure.calc_output_loss(
+                self.scenario, component_damage_state_ind)
+            self.infrastructure._previous_level = previous_level
+            for expected, result in zip(full, incremental):
+                self.assertTrue(np.array_equal(expected, result))
+
+
+class TestAdaptiveSampling(unittest.TestCase):
+
+    def setUp(self):
+        self.config, self.scenario, self.hazards, self.infrastructure = \
+            load_simulation_objects("test_scenario_pscoal_test_case.json")
+        self.scenario.num_samples = 300
+        self.scenario.adaptive_block_size = 100
+
+    def test_zero_tolerance_draws_every_sample(self):
+        fixed = calculate_response(
+            self.hazards, self.scenario, self.infrastructure)
+        self.scenario.adaptive_sampling = True
+        self.scenario.adaptive_tolerance = 0.0
+        adaptive = calculate_response(
+            self.hazards, self.scenario, self.infrastructure)
+        for hazard in self.hazards.listOfhazards:
+            self.assertEqual(adaptive[6][hazard.hazard_scenario_name], 300)
+            self.assertTrue(np.array_equal(
+                adaptive[0][hazard.hazard_scenario_name],
+                fixed[0][hazard.hazard_scenario_name]))
+        for list_number in (4, 5):
+            self.assertTrue(np.array_equal(adaptive[list_number],
+                                           fixed[list_number]))
+
+    def test_sampling_stops_within_tolerance(self):
+        self.scenario.adaptive_sampling = True
+        self.scenario.adaptive_tolerance = 0.05
+        response = calculate_response(
+            self.hazards, self.scenario, self.infrastructure)
+        sample_counts = [response[6][hazard.hazard_scenario_name]
+                         for hazard in self.hazards.listOfhazards]
+        # there is no damage at zero intensity, so one block is enough
+        self.assertEqual(sample_counts[0], 100)
+        self.assertTrue(all(count % 100 == 0 and count <= 300
+                            for count in sample_counts))
+        self.assertEqual(response[5].shape,
+                         (max(sample_counts), len(sample_counts)))
+        for hazard_index, count in enumerate(sample_counts):
+            self.assertFalse(np.any(np.isnan(
+                response[5][:count, hazard_index])))
+            self.assertTrue(np.all(np.isnan(
+                response[5][count:, hazard_index])))
+
+    def test_sample_arrays_are_padded_with_nan(self):
+        stacked = stack_sample_arrays([np.ones((2, 3)), np.zeros((1, 3))])
+        self.assertEqual(stacked.shape, (2, 2, 3))
+        self.assertTrue(np.array_equal(stacked[0], np.ones((2, 3))))
+        self.assertTrue(np.all(np.isnan(stacked[1, 1])))
+
+
+class TestSampleBudget(unittest.TestCase):
+
+    def setUp(self):
+        self.config, self.scenario, self.hazards, self.infrastructure = \
+            load_simulation_objects("test_scenario_pscoal_test_case.json")
+        self.scenario.sample_budget = 1000
+        self.scenario.pilot_samples = 50
+
+    def test_budget_is_shared_between_hazard_levels(self):
+        sample_counts = allocate_sample_budget(
+            self.hazards, self.scenario, self.infrastructure)
+        self.assertEqual(sum(sample_counts.values()), 1000)
+        self.assertTrue(all(count >= 50 for count in sample_counts.values()))
+        # there is no damage at zero intensity, so it gets the fewest, up
+        # to rounding
+        no_damage = sample_counts[
+            self.hazards.listOfhazards[0].hazard_scenario_name]
+        self.assertLessEqual(no_damage - min(sample_counts.values()), 1)
+        self.assertLess(no_damage, max(sample_counts.values()))
+
+    def test_response_uses_allocated_samples(self):
+        sample_counts = allocate_sample_budget(
+            self.hazards, self.scenario, self.infrastructure)
+        response = calculate_response(
+            self.hazards, self.scenario, self.infrastructure)
+        self.assertEqual(response[6], sample_counts)
+        for hazard_name, count in sample_counts.items():
+            self.assertEqual(len(response[0][hazard_name]), count)
+
+
+class TestImportanceSampling(unittest.TestCase):
+
+    def test_weighted_rare_event_probability(self):
+        # ten components that are each damaged with probability 0.01
+        component_pe_ds = np.tile([[0.01, 0.002, np.nan]], (10, 1))
+        rnd = np.random.RandomState(seed=2).uniform(size=(4000, 10))
+        component_damage_state_ind, weights = \
+            importance_sample_damage_states(component_pe_ds, rnd, 0.1, 0.5)
+        self.assertTrue(np.all(weights <= 2.0))
+        # at least three damaged components, which plain sampling would
+        # rarely see in 4000 samples
+        rare = np.sum(component_damage_state_ind > 0, axis=1) >= 3
+        self.assertGreater(np.sum(rare), 100)
+        self.assertAlmostEqual(np.average(rare, weights=weights) /
+                               stats.binom.sf(2, 10, 0.01), 1.0, delta=0.3)
+
+    def test_likely_damage_is_not_biased(self):
+        component_pe_ds = np.array([[0.5, 0.2], [0.0, 0.0]])
+        rnd = np.random.RandomState(seed=2).uniform(size=(100, 2))
+        component_damage_state_ind, weights = \
+            importance_sample_damage_states(component_pe_ds, rnd, 0.1, 0.5)
+        self.assertTrue(np.array_equal(
+            component_damage_state_ind,
+            sample_damage_states(component_pe_ds, rnd)))
+        self.assertTrue(np.all(weights == 1.0))
+
+    def test_response_carries_likelihood_weights(self):
+        config, scenario, hazards, infrastructure = \
+            load_simulation_objects("test_scenario_pwtp_400ML.json")
+        scenario.num_samples = 200
+        plain = calculate_response(hazards, scenario, infrastructure)
+        self.assertTrue(all(weights is None for weights in plain[7].values()))
+
+        scenario.importance_sampling = True
+        full = calculate_response(hazards, scenario, infrastructure)
+        scenario.compress_samples = True
+        compressed = calculate_response(hazards, scenario, infrastructure)
+        for hazard_index, hazard in enumerate(hazards.listOfhazards):
+            name = hazard.hazard_scenario_name
+            weights = full[7][name]
+            self.assertTrue(np.array_equal(np.asarray(compressed[7][name]),
+                                           weights))
+            # the mean output is weighted by the likelihood
+            self.assertAlmostEqual(
+                sum(full[1][name].values()),
+                np.average(full[4][:, hazard_index], weights=weights))
+            for output_id, output in full[1][name].items():
+                self.assertAlmostEqual(compressed[1][name][output_id],
+                                       output)
+
+
+class TestDeterministicSaturation(unittest.TestCase):
+
+    def test_saturated_components_are_found(self):
+        component_pe_ds = np.array([[1.0, 1.0, 0.0],
+                                    [1.0, 0.5, 0.0],
+                                    [0.0, 0.0, -np.inf],
+                                    [1.0, np.nan, np.nan]])
+        saturated, damage_state_ind = \
+            saturated_damage_states(component_pe_ds)
+        self.assertTrue(np.array_equal(saturated,
+                                       [True, False, True, True]))
+        self.assertTrue(np.array_equal(damage_state_ind[saturated],
+                                       [2, 0, 1]))
+
+    def test_only_uncertain_components_are_sampled(self):
+        config, scenario, hazards, infrastructure = \
+            load_simulation_objects("test_scenario_ss_230kv.json")
+        scenario.deterministic_saturation = True
+        hazard = hazards.listOfhazards[1]
+        component_pe_ds = infrastructure.get_exceedance_probabilities(hazard)
+        saturated, saturated_damage_state_ind = \
+            saturated_damage_states(component_pe_ds)
+        self.assertTrue(np.any(saturated) and not np.all(saturated))
+
+        component_damage_state_ind = \
+            calculate_expected_damage_state_of_components_for_n_simulations(
+                infrastructure, scenario, hazard)
+        self.assertTrue(np.all(component_damage_state_ind[:, saturated] ==
+                               saturated_damage_state_ind[saturated]))
+        rnd = np.random.RandomState(seed=2).uniform(
+            size=(scenario.num_samples, int(np.sum(~saturated))))
+        self.assertTrue(np.array_equal(
+            component_damage_state_ind[:, ~saturated],
+            sample_damage_states(component_pe_ds[~saturated], rnd)))
+
+    def test_saturated_level_is_evaluated_once(self):
+        config, scenario, hazards, infrastructure = \
+            load_simulation_objects("test_scenario_upper_limit.json")
+        sampled = calculate_response(hazards, scenario, infrastructure)
+        scenario.deterministic_saturation = True
+        exact = calculate_response(hazards, scenario, infrastructure)
+        for list_number in (4, 5):
+            self.assertTrue(np.array_equal(exact[list_number],
+                                           sampled[list_number]))
+        for hazard in hazards.listOfhazards:
+            name = hazard.hazard_scenario_name
+            self.assertEqual(exact[6][name], scenario.num_samples)
+            damage_state_ind = exact[0][name]
+            self.assertEqual(len(damage_state_ind.unique_values), 1)
+            self.assertTrue(np.array_equal(np.asarray(damage_state_ind),
+                                           sampled[0][name]))
+            for key, value in sampled[2][name].items():
+                self.assertAlmostEqual(exact[2][name][key], value)
+                if key[1] in ('loss_std', 'func_std'):
+                    self.assertEqual(exact[2][name][key], 0.0)
+
+    def test_streamed_saturated_level_is_evaluated_once(self):
+        config, scenario, hazards, infrastructure = \
+            load_simulation_objects("test_scenario_upper_limit.json")
+        scenario.deterministic_saturation = True
+        exact = calculate_response(hazards, scenario, infrastructure)
+        scenario.stream_chunk_size = 10
+        # count the evaluations in this process
+        scenario.run_parallel_proc = 0
+        calc_output_loss = infrastructure.calc_output_loss
+        evaluated = []
+
+        def count_samples(scenario, damage_states):
+            evaluated.append(len(damage_states))
+            return calc_output_loss(scenario, damage_states)
+
+        infrastructure.calc_output_loss = count_samples
+        streamed = calculate_response(hazards, scenario, infrastructure)
+        self.assertEqual(evaluated, [1] * len(hazards.listOfhazards))
+        for hazard in hazards.listOfhazards:
+            name = hazard.hazard_scenario_name
+            self.assertEqual(streamed[6][name], scenario.num_samples)
+            for list_number in (1, 2):
+                for key, value in exact[list_number][name].items():
+                    self.assertAlmostEqual(
+                        streamed[list_number][name][key], value)
+        self.assertTrue(np.array_equal(streamed[4], exact[4]))
+
+
+if __name__ == '__main__':
+    unittest.main()